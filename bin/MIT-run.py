@@ -9,22 +9,62 @@ pair-frequency matrices and calculate a Mutual Information score for
 position pairs.
 
 This module is intended to be run as a small CLI tool (see `main`). It
-expects two MSAs (or one MSA used for both inputs) and outputs a CSV with
-per-position MIT scores.
+expects two MSAs (or one MSA used for both inputs) and outputs the
+per-position-pair MIT scores as a float32 matrix (`mit_matrix.npy`, which
+can be memory-mapped) with an optional long-form CSV export.
+
+Two scoring engines are available. The default `numpy` engine integer
+encodes the alignments once and builds the contingency tables for whole
+blocks of position pairs with matrix products; the original `python`
+per-pair loop is kept as the reference implementation. For nucleotides
+the `bitpack` variant of the numpy engine packs every column into 2-bit
+codes with a validity mask and counts 64 genomes per word with popcounts.
+Every engine counts the same integer codes: each residue is translated
+once through a 256-entry table built from the alphabet, which can add a gap
+state, fold lowercase, map ambiguity codes or group residues into a reduced
+alphabet (`--alphabet`, `--gap-state`, `--fold-case`, `--ambiguity`).
+With `--cache` the encoded alignments are stored under a hash of the file
+content and alphabet, so repeat runs memory-map them instead of parsing.
+For top pairs, `--screen` estimates every pair from a subsample of the
+genomes and only scores the pairs that can still qualify exactly.
+`--region1`/`--region2` restrict the run to a sub-grid of positions, given
+in the numbering of a `--reference` sequence or as alignment columns.
+`--plots` (or `MIT-run.py render`) draws the histograms and the z-score
+heatmap of `utils/MIT_analysis.R` straight from the memory-mapped matrix
+(this needs matplotlib, which the rest of the script does not).
+The numpy engine can spread the blocks over a process pool (`--workers`) or over scheduler
+array jobs (`--shard i/N`, then `MIT-run.py merge`).
 
 *NOTE* 
 This has a known issue where the amino acid usage bias exists - meaning if a position utilizes 
 more diverse amino acids it will tend to have a higher MIT score overall regardless of true co-evolutionary signal.
 
-There are plans to address this in future versions - and can also be mitigated at the analysis stage with z-score normalization.
+There are plans to address this in future versions - and can also be mitigated with the RCW / APC corrections and z-score
+normalization (`--corrections`), which are computed from the row and column sums of the score matrix.
 """
 
 import os
 import sys
+import glob
+import gzip
+import hashlib
+import heapq
+import json
+import re
+import shutil
+import time
 import argparse
+import contextlib
+import cProfile
+import pstats
+import tracemalloc
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
 import pandas as pd
-from typing import Dict
+from typing import Dict, Iterator, List, Tuple
 from math import log
+from statistics import NormalDist
 
 #some full lists of amino acids
 AMINO_ACIDS = ["A", "R", "N", "D", "C", "Q", "E", "G", "H", 
@@ -33,64 +73,428 @@ AMINO_ACIDS = ["A", "R", "N", "D", "C", "Q", "E", "G", "H",
 #all the nucleic acids
 NUCLEIC_ACIDS = ["A", "C", "G", "T"]
 
+#gap characters, scored as one extra state with --gap-state
+GAP_CHARACTERS = "-."
+
+#ambiguity codes and the residues they stand for, mapped with --ambiguity map when they all fall in one state
+AMBIGUITY_CODES = {
+    "A": {"B": "DN", "Z": "EQ", "J": "IL", "U": "C", "O": "K", "X": "".join(AMINO_ACIDS)},
+    "N": {"U": "T", "R": "AG", "Y": "CT", "S": "CG", "W": "AT", "K": "GT", "M": "AC",
+          "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG", "N": "ACGT"},
+}
+
+#built-in reduced alphabets for --alphabet, one string of residues per state (Murphy et al. 2000 for amino acids)
+REDUCED_ALPHABETS = {
+    "A": {
+        "murphy15": ["LVIM", "C", "A", "G", "S", "T", "P", "FY", "W", "E", "D", "N", "Q", "KR", "H"],
+        "murphy10": ["LVIM", "C", "A", "G", "ST", "P", "FYW", "EDNQ", "KR", "H"],
+        "murphy8": ["LVIMC", "AG", "ST", "P", "FYW", "EDNQ", "KR", "H"],
+        "murphy4": ["LVIMC", "AGSTP", "FYW", "EDNQKRH"],
+    },
+    "N": {
+        "purine-pyrimidine": ["AG", "CT"],
+    },
+}
+
+#genome ID of a header when pairing by genome - the text after the last '-' like the old make_ordered_files
+DEFAULT_GENOME_REGEX = r"([^-]+)$"
+
+#file extensions picked up when a directory is passed to --batch
+FASTA_EXTENSIONS = (".fasta", ".fa", ".fas", ".faa", ".fna", ".aln", ".afa")
+
+#corrected score outputs - name: (matrix file, long-form column)
+CORRECTIONS = {
+    "rcw": ("mit_rcw.npy", "RCW_entropy"),
+    "apc": ("mit_apc.npy", "APC_entropy"),
+    "zscore": ("mit_zscore.npy", "Z_Score"),
+}
+
 def get_args() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Calculate MIT scores for Amino Acid sequences or Nucleic Acid sequences"
     )
-    parser.add_argument("-m1", "--msa1", required=True, type=str, help="Multiple Sequence Alignment file in FASTA format")
+    parser.add_argument("-m1", "--msa1", required=False, type=str, help="Multiple Sequence Alignment file in FASTA format. Required unless --batch is used")
     parser.add_argument("-m2", "--msa2", required=False, type=str, help="Multiple Sequence Alignment file in FASTA format")
-    parser.add_argument("-o", "--output", required=True, type=str, help="Output path to write the final MIT scores to. File will be named mit_results.csv")
+    parser.add_argument("-b", "--batch", required=False, nargs="+", type=str, help="Directories and/or FASTA files of MSAs to compare all-vs-all in one run. Each pair is written to <output>/<MSA1>__<MSA2>/ and summarized in <output>/batch_summary.csv")
+    parser.add_argument("-o", "--output", required=True, type=str, help="Output path to write the final MIT scores to. The scores are written as the float32 matrix mit_matrix.npy with position labels in mit_matrix_positions.json")
     parser.add_argument("-t", "--type", required=True, type=str, choices=["A", "N"], default="A", help="Type of sequence: A for Amino Acid, N for Nucleic Acid. Default is A")
+    parser.add_argument("--alphabet", required=False, type=str, help="Group residues into fewer states: a built-in reduced alphabet (murphy15, murphy10, murphy8 or murphy4 for -t A, purine-pyrimidine for -t N), comma-separated groups such as LVIM,C,A,G,ST,P,FYW,EDNQ,KR,H or a file with one group per line. Residues outside every group are skipped. Default is one state per residue of -t")
+    parser.add_argument("--gap-state", required=False, action="store_true", help="Score gaps ('-' and '.') as one extra state instead of skipping them. The log base becomes the number of states")
+    parser.add_argument("--fold-case", required=False, action="store_true", help="Read lowercase residues as their uppercase state instead of skipping them")
+    parser.add_argument("--ambiguity", required=False, type=str, choices=["skip", "map"], default="skip", help="Ambiguity codes (B, Z, J, X, U, O for -t A, IUPAC codes for -t N): skip them, or map each one to the state holding all of the residues it stands for (skipped when they span several states). Default is skip")
+    parser.add_argument("--cache", required=False, type=str, help="Directory of the encoded MSA cache. Every MSA is stored once per file content and alphabet as memory-mappable codes, headers and column counts, so repeat runs skip parsing. Empty it with `MIT-run.py clear-cache`")
+    parser.add_argument("--cache-size", required=False, type=float, default=20.0, help="Size limit of --cache in GB; the least recently used MSAs are evicted above it. Default is 20")
+    parser.add_argument("-g", "--pair-by-genome", required=False, action="store_true", help="Match rows of the MSAs by the genome ID parsed from each header instead of assuming the files are already ordered by genome. In --batch mode every comparison is joined on the genomes of its two MSAs, except with --reweight, whose shared weights need one genome set: then only genomes found in every MSA are used")
+    parser.add_argument("--genome-regex", required=False, type=str, default=DEFAULT_GENOME_REGEX, help="Regular expression extracting the genome ID from a header (first group if it has one, the whole match otherwise). Default takes the text after the last '-'")
+    parser.add_argument("--missing-genomes", required=False, type=str, choices=["drop", "error"], default="drop", help="What to do with genomes absent from some MSAs when pairing by genome. Default is drop")
+    parser.add_argument("--duplicate-genomes", required=False, type=str, choices=["drop", "keep-first", "error"], default="drop", help="What to do with genomes seen more than once in an MSA when pairing by genome: drop the genome everywhere, keep its first copy, or stop. Default is drop")
+    parser.add_argument("--reference", required=False, nargs="+", type=str, help="Header, first word of a header or genome ID (see --genome-regex) of the reference sequence to number positions against; a second name is looked up in MSA2, otherwise the same one is used for both. Region positions are then reference residue numbers and the outputs gain Ref_Position_MSA1/Ref_Position_MSA2 labels")
+    parser.add_argument("--region1", required=False, type=str, help="Only score these positions of MSA1, as ranges and single positions such as 10-50,72,88. In reference numbering with --reference, alignment columns otherwise. Default is every position")
+    parser.add_argument("--region2", required=False, type=str, help="Only score these positions of MSA2 (of MSA1 again for a single MSA), same format as --region1. Default is every position")
+    parser.add_argument("-r", "--reweight", required=False, type=identity_fraction, help="Down-weight redundant genomes: each genome gets weight 1 / (number of genomes with at least this identity fraction, e.g. 0.8). Reports the effective number of sequences N_eff")
+    parser.add_argument("--min-entropy", required=False, type=float, default=0.0, help="Skip columns whose entropy (base = alphabet size) is at or below this value. The default 0 skips invariant columns, whose scores are always 0")
+    parser.add_argument("--min-coverage", required=False, type=float, default=0.0, help="Skip columns where fewer than this fraction of genomes carry a valid residue. Default is 0 (keep all)")
+    parser.add_argument("--skipped-pairs", required=False, type=str, choices=["zero", "na"], default="zero", help="Value written for pairs involving a skipped column: zero or na. Default is zero")
+    parser.add_argument("--count-store", required=False, type=str, help="Directory of a persisted pair-count store. Genomes not yet listed in its manifest are added to the stored counts and the scores are recomputed from them, so weekly additions only need the new sequences. The store keeps the --tile-size blocks it was created with; a single MSA only stores the blocks on or above the diagonal. --min-entropy, --min-coverage and --skipped-pairs are applied to the stored counts")
+    parser.add_argument("-e", "--engine", required=False, type=str, choices=["numpy", "bitpack", "python"], default="numpy", help="Scoring engine: numpy (vectorized, all pairs in bulk), bitpack (numpy engine counting 2-bit packed states with popcounts, four-state alphabets such as -t N only) or python (original per-pair loop, kept as the reference). Default is numpy")
+    parser.add_argument("--tile-size", required=False, type=positive_int, default=64, help="Number of positions per block when the numpy engine builds contingency tables. Default is 64")
+    parser.add_argument("-w", "--workers", required=False, type=positive_int, default=1, help="Number of processes scoring position blocks in parallel with the numpy engine. Default is 1")
+    parser.add_argument("--shard", required=False, type=str, help="Only score shard i of N (written as i/N, 1-based) and write it as a partial result to merge later with `MIT-run.py merge`. Meant for scheduler array jobs")
+    parser.add_argument("--checkpoint", required=False, action="store_true", help="Write every finished block straight into an on-disk score matrix and log it in <output>/mit_checkpoint/, so a preempted run can be continued with --resume")
+    parser.add_argument("--resume", required=False, action="store_true", help="Continue the checkpointed run in <output>/mit_checkpoint/ and skip the blocks it already finished (implies --checkpoint)")
+    parser.add_argument("--checkpoint-interval", required=False, type=float, default=CHECKPOINT_SECONDS, help="Seconds between flushes of the checkpointed matrix and its log of finished blocks; at most this much work is lost when a run is killed. 0 flushes after every block. Default is 30")
+    parser.add_argument("--csv", required=False, action="store_true", help="Also export the long-form mit_results.csv (one row per position pair, streamed in chunks)")
+    parser.add_argument("-c", "--corrections", required=False, nargs="+", choices=sorted(CORRECTIONS), default=[], help="Corrected scores to write next to the raw matrix: rcw (row column weighting), apc (average product correction), zscore (z-score of the RCW scores). Pairs of a position with itself are excluded like in utils/MIT_analysis.R")
+    parser.add_argument("--plots", required=False, action="store_true", help="Also draw the MIT, RCW and z-score histograms and the z-score heatmap of utils/MIT_analysis.R from the score matrix (MIT_distribution.png, RCW_MIT_distribution.png, ZScore_distribution.png, MIT_ZScore_heatmap.png). Needs matplotlib. Also available as `MIT-run.py render` for finished runs")
+    parser.add_argument("-k", "--top-k", required=False, type=positive_int, help="Only keep the K highest scoring position pairs while the blocks are scored, instead of the full matrix. Written to mit_top_pairs.csv with the requested rcw/apc corrections")
+    parser.add_argument("--min-score", required=False, type=float, help="Only keep position pairs scoring at least this value (can be combined with --top-k). Written to mit_top_pairs.csv")
+    parser.add_argument("--screen", required=False, type=float, help="Two-phase screening for --top-k/--min-score: estimate every pair from a random subset of the genomes (a fraction below 1, a number of genomes otherwise), then score exactly only the pairs whose upper bound can still qualify. Writes mit_top_pairs.csv and mit_screen_summary.json")
+    parser.add_argument("--screen-recall", required=False, type=float, default=0.99, help="Target probability that a qualifying pair survives the screen; sets the width of the bounds. Default is 0.99")
+    parser.add_argument("--screen-audit", required=False, type=int, default=1000, help="Number of ruled-out pairs scored exactly to estimate the recall of the screen. Default is 1000")
+    parser.add_argument("-p", "--permutations", required=False, type=non_negative_int, default=0, help="Number of genome-order shuffles of MSA2 for the permutation null model. Writes per-pair p-values (mit_pvalues.npy) and a protein-level summary (mit_permutation_summary.json). Default is 0 (off)")
+    parser.add_argument("--permutation-batch", required=False, type=positive_int, default=4, help="Number of permutations counted together per block. Default is 4")
+    parser.add_argument("--alpha", required=False, type=significance_level, default=0.05, help="Per-pair significance level used for the excess of significant pairs. Default is 0.05")
+    parser.add_argument("--seed", required=False, type=int, default=None, help="Random seed for reproducible permutations")
+    parser.add_argument("--progress-interval", required=False, type=float, default=10.0, help="Seconds between progress lines (pairs scored, throughput and ETA) while scoring. 0 turns them off. Default is 10")
+    parser.add_argument("--profile", required=False, type=str, choices=["cprofile", "tracemalloc"], help="Profile the run: cprofile writes mit_profile.prof and the top functions to mit_profile.txt, tracemalloc adds the Python heap peak of every stage to the metrics and the top allocation sites to mit_tracemalloc.txt")
 
     return parser.parse_args()
 
-def get_sequences_from_fasta(fasta_file: str) -> list:
-    """Read sequences from a FASTA file and return a list of sequences.
+def get_merge_args(argv: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="MIT-run.py merge",
+        description="Merge the partial results written by `MIT-run.py --shard i/N` runs into the final MIT scores"
+    )
+    parser.add_argument("-i", "--input", required=True, type=str, help="Directory holding the mit_shard_*.npz files")
+    parser.add_argument("-o", "--output", required=True, type=str, help="Output path to write the final MIT scores to (mit_matrix.npy and mit_matrix_positions.json)")
+    parser.add_argument("--csv", required=False, action="store_true", help="Also export the long-form mit_results.csv")
+    parser.add_argument("-c", "--corrections", required=False, nargs="+", choices=sorted(CORRECTIONS), default=[], help="Corrected scores to write next to the raw matrix: rcw, apc and/or zscore")
+    parser.add_argument("--plots", required=False, action="store_true", help="Also draw the histograms and the z-score heatmap (see `MIT-run.py render`). Needs matplotlib")
+
+    return parser.parse_args(argv)
+
+def get_clear_cache_args(argv: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="MIT-run.py clear-cache",
+        description="Remove the encoded MSAs stored by `MIT-run.py --cache`"
+    )
+    parser.add_argument("-d", "--cache", required=True, type=str, help="Cache directory passed to --cache")
+    parser.add_argument("--max-size", required=False, type=float, default=0.0, help="Only evict the least recently used MSAs until the cache holds at most this many GB. Default is 0 (remove everything)")
+
+    return parser.parse_args(argv)
+
+def get_render_args(argv: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="MIT-run.py render",
+        description="Draw the MIT, RCW and z-score histograms and the z-score heatmap of a finished run from its score matrix (needs matplotlib)"
+    )
+    parser.add_argument("-i", "--input", required=True, type=str, help="Output directory of a run holding mit_matrix.npy and mit_matrix_positions.json")
+    parser.add_argument("-o", "--output", required=False, type=str, help="Directory to write the plots to. Default is the input directory")
+    parser.add_argument("--size", required=False, type=positive_int, default=800, help="Maximum number of heatmap pixels along each axis; larger grids are max-pooled. Default is 800")
+
+    return parser.parse_args(argv)
+
+def positive_int(value: str) -> int:
+    """Argparse type of options counting positions, processes or permutations, which must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+
+    return number
+
+def non_negative_int(value: str) -> int:
+    """Argparse type of `--permutations`, where 0 turns the option off."""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be at least 0, got {value}")
+
+    return number
+
+def significance_level(value: str) -> float:
+    """Argparse type of `--alpha`, a probability strictly between 0 and 1."""
+    level = float(value)
+    if not 0 < level < 1:
+        raise argparse.ArgumentTypeError(f"must be between 0 and 1 (exclusive), got {value}")
+
+    return level
+
+def identity_fraction(value: str) -> float:
+    """Argparse type of `--reweight`, an identity fraction above 0 and at most 1."""
+    fraction = float(value)
+    if not 0 < fraction <= 1:
+        raise argparse.ArgumentTypeError(f"must be an identity fraction above 0 and at most 1, got {value}")
+
+    return fraction
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """Parse a ``i/N`` shard specification into a (0-based index, count) tuple."""
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must be written as i/N, got {shard}.")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Shard index must be between 1 and N, got {shard}.")
+
+    return index - 1, count
+
+####run metrics - every stage records its wall time, memory and throughput for mit_metrics.json
+_RUN_METRICS = {"start": time.perf_counter(), "stages": {}, "progress_interval": 10.0}
+
+#seconds spent counting pairs and turning counts into MI in this process, see `score_tile`
+_SCORE_TIMES = {"pair_counting": 0.0, "mi": 0.0}
+
+def peak_rss_mb(children: bool = False) -> float:
+    """Peak resident memory in MB of this process, or of its largest finished child process (workers)."""
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return usage / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+def record_stage(name: str, seconds: float, items: int = None, tracemalloc_peak: int = None):
+    """Add one run of a pipeline stage to the run metrics; repeated stages are summed."""
+    entry = _RUN_METRICS["stages"].setdefault(name, {"seconds": 0.0, "calls": 0, "items": None, "peak_rss_mb": 0.0})
+    entry["seconds"] += seconds
+    entry["calls"] += 1
+    if items is not None:
+        entry["items"] = (entry["items"] or 0) + int(items)
+    entry["peak_rss_mb"] = max(entry["peak_rss_mb"], peak_rss_mb())
+    if tracemalloc_peak is not None:
+        entry["tracemalloc_peak_mb"] = max(entry.get("tracemalloc_peak_mb", 0.0), tracemalloc_peak / 1024 ** 2)
 
-    The function handles multi-line FASTA entries and returns sequence
-    strings in the same order they appear in the file. Description lines
-    beginning with '>' are ignored.
+@contextlib.contextmanager
+def stage(name: str, items: int = None):
+    """Time a pipeline stage: ``with stage("parse") as work: ...``.
+
+    `items` is the amount of work done in the stage (sequences, pairs, ...)
+    and gives its throughput in the metrics. When it is only known inside the
+    stage it can be set with ``work["items"] = ...``.
+    """
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    work = {"items": items}
+    start = time.perf_counter()
+    try:
+        yield work
+    finally:
+        peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        record_stage(name, time.perf_counter() - start, work["items"], peak)
+
+def record_score_times(pairs: int):
+    """Move the pair counting / MI split of the last scoring stage into the run metrics.
+
+    With worker processes the times are summed over the workers.
+    """
+    for name, seconds in _SCORE_TIMES.items():
+        if seconds > 0:
+            record_stage(name, seconds, pairs)
+        _SCORE_TIMES[name] = 0.0
+
+def format_seconds(seconds: float) -> str:
+    """Format a duration as e.g. ``1h02m`` or ``4m05s`` or ``12s``."""
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+def new_progress(total: int, label: str) -> dict:
+    """Create a progress tracker for `update_progress`."""
+    now = time.perf_counter()
+    return {"total": total, "done": 0, "label": label, "start": now, "last": now}
+
+def update_progress(progress: dict, done: int):
+    """Count `done` more units and print the progress, throughput and ETA every ``--progress-interval`` seconds."""
+    progress["done"] += done
+    interval = _RUN_METRICS["progress_interval"]
+    now = time.perf_counter()
+    #the last update is also printed for stages that ran long enough to report progress
+    due = now - progress["last"] >= interval or (progress["done"] >= progress["total"] and now - progress["start"] >= interval)
+    if interval <= 0 or not due:
+        return
+    progress["last"] = now
+    elapsed = now - progress["start"]
+    rate = progress["done"] / elapsed if elapsed > 0 else float("inf")
+    remaining = (progress["total"] - progress["done"]) / rate if rate > 0 else float("inf")
+    print(
+        f"{progress['label']}: {progress['done']} of {progress['total']} ({100 * progress['done'] / max(progress['total'], 1):.1f}%), "
+        f"{rate:.3g}/s, {format_seconds(elapsed)} elapsed, ETA {format_seconds(remaining) if np.isfinite(remaining) else 'unknown'}",
+        flush=True
+    )
+
+def start_profiling(mode: str):
+    """Start the --profile mode; returns the cProfile profiler when there is one."""
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    if mode == "tracemalloc":
+        tracemalloc.start()
+    return None
+
+def stop_profiling(mode: str, profiler, output: str):
+    """Stop the --profile mode and write its report to `output`."""
+    if mode is None:
+        return
+    os.makedirs(output, exist_ok=True)
+    if mode == "cprofile":
+        profiler.disable()
+        profiler.dump_stats(f"{output}/mit_profile.prof")
+        with open(f"{output}/mit_profile.txt", "w") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+        print(f"Wrote the cProfile report to {output}/mit_profile.prof and {output}/mit_profile.txt")
+    elif mode == "tracemalloc":
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        with open(f"{output}/mit_tracemalloc.txt", "w") as f:
+            for statistic in snapshot.statistics("lineno")[:40]:
+                f.write(f"{statistic}\n")
+        print(f"Wrote the top allocation sites to {output}/mit_tracemalloc.txt")
+
+def write_run_metrics(output: str, settings: dict = None, name: str = "mit_metrics.json") -> str:
+    """Write the per-stage metrics of the run to ``<output>/mit_metrics.json`` (or `name`).
+
+    Every stage has its wall time, number of calls, peak resident memory of
+    the main process when it ended and, when it processed countable work
+    (sequences, pairs), the amount and throughput. ``pair_counting`` and
+    ``mi`` split the time of the scoring blocks and are summed over the
+    worker processes.
+
+    Returns
+    -------
+    str
+        Path of the written file.
+    """
+    stages = []
+    for stage_name, entry in _RUN_METRICS["stages"].items():
+        entry = dict(name=stage_name, **entry)
+        if entry["items"] is not None:
+            entry["items_per_second"] = entry["items"] / entry["seconds"] if entry["seconds"] > 0 else None
+        stages.append(entry)
+    scoring = _RUN_METRICS["stages"].get("scoring", {})
+    wall = time.perf_counter() - _RUN_METRICS["start"]
+    metrics = {
+        "command": sys.argv,
+        "settings": settings or {},
+        "wall_seconds": wall,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_workers_mb": peak_rss_mb(children=True),
+        "pairs": scoring.get("items"),
+        "pairs_per_second": scoring["items"] / scoring["seconds"] if scoring.get("items") and scoring["seconds"] > 0 else None,
+        "stages": stages,
+    }
+    os.makedirs(output, exist_ok=True)
+    path = f"{output}/{name}"
+    with open(path, "w") as f:
+        json.dump(metrics, f, indent=2)
+
+    return path
+
+def open_fasta(fasta_file: str):
+    """Open a FASTA file for binary reading, transparently handling gzip compression."""
+    with open(fasta_file, 'rb') as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    return gzip.open(fasta_file, 'rb') if compressed else open(fasta_file, 'rb')
+
+def read_alignment(fasta_file: str, block_rows: int = 1024) -> Tuple[List[str], np.ndarray]:
+    """Stream an aligned FASTA file into a column-major residue matrix.
+
+    Residues are written straight into a growable uint8 buffer laid out as
+    (positions, genomes), so each column is contiguous for the scoring
+    engines. Records are staged in small row-major blocks and transposed into
+    the buffer a block at a time. Every record is checked against the length
+    of the first one as it is read.
 
     Parameters
     ----------
     fasta_file : str
-        Path to a FASTA file.
+        Path to an aligned FASTA file, optionally gzip-compressed.
+    block_rows : int
+        Number of records staged before they are transposed into the buffer.
 
     Returns
     -------
-    list[str]
-        List of sequence strings (no header lines).
+    tuple[list[str], numpy.ndarray]
+        Header lines (without '>') and the uint8 matrix of raw residue bytes
+        of shape (alignment length, number of sequences).
+
+    Raises
+    ------
+    ValueError
+        If a record's length differs from the first record's length.
     """
-    sequences = []
-    with open(fasta_file, 'r') as f:
-        seq = ""
+    headers = []
+    columns = None
+    staged = None
+    n_staged = 0
+    n_records = 0
+
+    def flush():
+        nonlocal columns, n_records, n_staged
+        if n_records + n_staged > columns.shape[1]:
+            grown = np.empty((columns.shape[0], max(2 * columns.shape[1], n_records + n_staged)), dtype=np.uint8)
+            grown[:, :n_records] = columns[:, :n_records]
+            columns = grown
+        columns[:, n_records:n_records + n_staged] = staged[:n_staged].T
+        n_records += n_staged
+        n_staged = 0
+
+    def add_record(parts):
+        nonlocal columns, staged, n_staged
+        residues = b"".join(parts)
+        if columns is None:
+            columns = np.empty((len(residues), block_rows), dtype=np.uint8)
+            staged = np.empty((block_rows, len(residues)), dtype=np.uint8)
+        elif len(residues) != columns.shape[0]:
+            raise ValueError(
+                f"Sequence '{headers[-1]}' (record {len(headers)}) in {fasta_file} has length {len(residues)} "
+                f"but the alignment length is {columns.shape[0]}."
+            )
+        staged[n_staged] = np.frombuffer(residues, dtype=np.uint8)
+        n_staged += 1
+        if n_staged == block_rows:
+            flush()
+
+    with open_fasta(fasta_file) as f:
+        parts = None
         for line in f:
             line = line.strip()
-            if line.startswith(">"):
-                #check if there was a sequence built out
-                if seq:
-                    sequences.append(seq)
-                    seq = ""
-            else:
-                seq += line
-        if seq:
-            sequences.append(seq)
-    
-    return sequences
+            if line.startswith(b">"):
+                if parts is not None:
+                    add_record(parts)
+                headers.append(line[1:].decode("utf-8", "replace"))
+                parts = []
+            elif line and parts is not None:
+                parts.append(line)
+        if parts is not None:
+            add_record(parts)
+
+    if columns is None:
+        return headers, np.zeros((0, 0), dtype=np.uint8)
+    if n_staged:
+        flush()
+    if n_records != columns.shape[1]:
+        columns = np.ascontiguousarray(columns[:, :n_records])
+
+    return headers, columns
 
 def create_position_identity_matrix(sequences: list) -> Dict[int, list]:
     """Build a position identity matrix from aligned sequences.
 
     Parameters
     ----------
-    sequences : list[str]
-        Aligned sequences (all sequences should have the same length).
+    sequences : list
+        Aligned sequences (all sequences should have the same length), as
+        strings or as rows of integer codes from `encode_alignment`.
 
     Returns
     -------
     Dict[int, list]
-        Mapping from 1-based position to a list of characters observed at
-        that position across all sequences.
+        Mapping from 1-based position to a list of characters (or codes)
+        observed at that position across all sequences.
     """
     identity_dict = {}
     for seq in sequences:
@@ -102,7 +506,7 @@ def create_position_identity_matrix(sequences: list) -> Dict[int, list]:
 
     return identity_dict
 
-def calculate_identity_pair_frequency_and_MIT(identity_dict1: Dict[int, list], identity_dict2: Dict[int, list], valid_chars: list) -> pd.DataFrame:
+def calculate_identity_pair_frequency_and_MIT(identity_dict1: Dict[int, list], identity_dict2: Dict[int, list], valid_chars: list, weights: list = None) -> pd.DataFrame:
     """Compute pair-frequency matrices and MIT scores for position pairs.
 
     For every position in `identity_dict1` and every position in
@@ -115,9 +519,14 @@ def calculate_identity_pair_frequency_and_MIT(identity_dict1: Dict[int, list], i
     Parameters
     ----------
     identity_dict1, identity_dict2 : Dict[int, list]
-        Position identity matrices produced by `create_position_identity_matrix`.
+        Position identity matrices of integer codes, produced by
+        `create_position_identity_matrix` from encoded sequences.
     valid_chars : list[str]
-        List of allowed characters (amino-acids or nucleotides).
+        Label of every state of the alphabet (see `build_alphabet`); code
+        ``i`` is state ``valid_chars[i]`` and larger codes are skipped.
+    weights : list[float], optional
+        Weight of each genome (see `compute_sequence_weights`); every genome
+        counts once when omitted.
 
     Returns
     -------
@@ -128,11 +537,15 @@ def calculate_identity_pair_frequency_and_MIT(identity_dict1: Dict[int, list], i
     # Initialize a dictionary to hold the pair frequencies
     pair_probabilities = {f"{a}-{b}": 0 for a in valid_chars for b in valid_chars}
     single_probabilities = {f"{a}": 0 for a in valid_chars}
+    n_states = len(valid_chars)
 
     #initialize a list of dictionaries to hold the results
     results = []
+    progress = new_progress(len(identity_dict1) * len(identity_dict2), "Scored position pairs")
     #go through each position within the sequence inside the associated genome and count up the pairings
     for pos in identity_dict1:
+        counting_start = time.perf_counter()
+        mi_seconds = 0.0
         for pos2 in identity_dict2:
             #create a counting mechanism for all pairs at these positions across all genomes
             pair_counts = pair_probabilities.copy()
@@ -153,27 +566,34 @@ def calculate_identity_pair_frequency_and_MIT(identity_dict1: Dict[int, list], i
                 base1 = identity_dict1[pos][genome_pos]
                 base2 = identity_dict2[pos2][genome_pos]
 
-                #check if one of the characters is a gap or not in the valid characters
+                #check if one of the codes is outside the alphabet
                 #usually for -, X, N, *, etc.
-                if base1 not in valid_chars or base2 not in valid_chars:
+                if base1 >= n_states or base2 >= n_states:
                     continue
 
+                base1, base2 = valid_chars[base1], valid_chars[base2]
                 pair = f"{base1}-{base2}"
+                weight = 1 if weights is None else weights[genome_pos]
 
                 #increment the counts
-                pair_counts[pair] += 1
-                seq1_pb[base1] += 1
-                seq2_pb[base2] += 1
+                pair_counts[pair] += weight
+                seq1_pb[base1] += weight
+                seq2_pb[base2] += weight
             
             #now convert counts to probabilities and calculate the MIT score
+            mi_start = time.perf_counter()
             mit_score = calculate_mit(
                 convert_counts_to_probabilities(pair_counts),
                 convert_counts_to_probabilities(seq1_pb),
                 convert_counts_to_probabilities(seq2_pb),
                 valid_chars
             )
+            mi_seconds += time.perf_counter() - mi_start
 
             results.append({"Position_MSA1": pos, "Position_MSA2": pos2, "MIT_Score": mit_score})
+        _SCORE_TIMES["mi"] += mi_seconds
+        _SCORE_TIMES["pair_counting"] += time.perf_counter() - counting_start - mi_seconds
+        update_progress(progress, len(identity_dict2))
 
     # Convert results to a DataFrame
     df = pd.DataFrame(results)
@@ -235,56 +655,3239 @@ def calculate_mit(pair_probabilities: Dict[str, float], seq1_probabilities: Dict
     
     return mit_score
 
-def main():
-    """Main entry point: parse arguments, compute MIT scores, and write CSV.
+####vectorized engine - integer encode the alignment once and build all contingency tables in bulk
+####sequence weighting - down-weight redundant genomes by their number of close relatives
+def compute_sequence_weights(codes_list: List[np.ndarray], n_states: int, threshold: float,
+                             block_rows: int = 1024, block_columns: int = 128) -> np.ndarray:
+    """Weight each genome by the inverse size of its identity cluster.
 
-    The function reads input MSAs, constructs position identity matrices,
-    computes MIT scores for every position pair, and writes a CSV file to
-    the directory specified by the `-o/--output` argument.
+    The identity of two genomes is the fraction of alignment columns where
+    they carry the same code (gaps and other skipped characters count as one
+    shared state). A genome's weight is ``1 / #{genomes with identity >=
+    threshold}``, itself included, so the weights sum to the effective number
+    of sequences (N_eff). Identities are accumulated with one-hot matrix
+    products over blocks of genomes and columns, so memory stays at
+    ``block_rows x genomes`` regardless of the alignment size.
+
+    Parameters
+    ----------
+    codes_list : list[numpy.ndarray]
+        Encoded alignments with matching genome order; they are treated as
+        one concatenated alignment (e.g. both proteins of a pair).
+    n_states : int
+        Number of valid characters.
+    threshold : float
+        Identity fraction above which two genomes are considered redundant.
+    block_rows, block_columns : int
+        Number of genomes and columns handled per block.
+
+    Returns
+    -------
+    numpy.ndarray
+        Weight of every genome.
     """
+    n_genomes = codes_list[0].shape[1]
+    n_columns = sum(codes.shape[0] for codes in codes_list)
+    #compare in counts of shared columns to avoid rounding in the fractions
+    min_matches = threshold * n_columns - 1e-9
+    neighbors = np.zeros(n_genomes, dtype=np.int64)
+    for row_start in range(0, n_genomes, block_rows):
+        row_stop = min(row_start + block_rows, n_genomes)
+        matches = np.zeros((row_stop - row_start, n_genomes), dtype=np.float32)
+        for codes in codes_list:
+            for column_start in range(0, codes.shape[0], block_columns):
+                onehot = one_hot_columns(codes[column_start:column_start + block_columns], n_states + 1, np.float32)
+                matches += onehot[row_start:row_stop] @ onehot.T
+        neighbors[row_start:row_stop] = (matches >= min_matches).sum(axis=1)
 
-    # parse the arguments
-    args = get_args()
-    #check if the input files exist and pull the sequences
-    if not os.path.isfile(args.msa1):
-        print(f"Error: The file {args.msa1} does not exist.")
-        sys.exit(1)
-    else:
-        sequences1 = get_sequences_from_fasta(args.msa1)
-        position_identies1 = create_position_identity_matrix(sequences1)
-        if len(sequences1) == 0:
-            print(f"Error: No sequences found in {args.msa1}.")
-            sys.exit(1)
-    #check if the second MSA file exists and pull the sequences, otherwise use the first MSA for both inputs
-    if args.msa2 and not os.path.isfile(args.msa2):
-        print(f"Error: The file {args.msa2} was passed and does not exist.")
-        sys.exit(1)
-    elif args.msa2 is None:
-        position_identies2 = position_identies1
-        print("No second MSA provided, using the first MSA for both inputs to calculate MIT on itself.")
-    else:
-        sequences2 = get_sequences_from_fasta(args.msa2)
-        position_identies2 = create_position_identity_matrix(sequences2)
-        if len(sequences2) == 0:
-            print(f"Error: No sequences found in {args.msa2}.")
-            sys.exit(1)
+    return 1.0 / neighbors
 
-    #report the type of sequences being processed
-    if args.type == "A":
-        valid_chars = AMINO_ACIDS
-        print("Processing as Amino Acid sequences.")
-    else:
-        valid_chars = NUCLEIC_ACIDS
-        print("Processing as Nucleic Acid sequences.")
+def write_sequence_weights(headers: list, weights: np.ndarray, output: str) -> str:
+    """Write the per-sequence weights to ``<output>/mit_sequence_weights.csv``."""
+    os.makedirs(output, exist_ok=True)
+    path = f"{output}/mit_sequence_weights.csv"
+    pd.DataFrame({"Sequence": headers, "Weight": weights}).to_csv(path, index=False)
+    return path
 
-    
-    mit_results = calculate_identity_pair_frequency_and_MIT(position_identies1, position_identies2, valid_chars)
-    
-    #write the results to a CSV file
-    os.path.isdir(args.output) or os.makedirs(args.output)
-    mit_results.to_csv(f"{args.output}/mit_results.csv", index=False, header=True)
+####genome pairing - match rows across MSAs by the genome ID in their headers
+def parse_genome_ids(headers: list, pattern: str) -> List[str]:
+    """Extract the genome ID of every header with `pattern`.
 
-    return 1
+    The first capture group is used when the pattern has one, otherwise the
+    whole match.
+
+    Raises
+    ------
+    ValueError
+        If a header does not match the pattern.
+    """
+    regex = re.compile(pattern)
+    ids = []
+    for header in headers:
+        match = regex.search(header)
+        if match is None:
+            raise ValueError(f"Could not parse a genome ID from header '{header}' with the pattern {pattern}.")
+        ids.append(match.group(1) if regex.groups else match.group(0))
+
+    return ids
+
+def index_genomes(genome_ids: List[str], duplicate_policy: str) -> Tuple[Dict[str, int], set]:
+    """Hash genome IDs to their row in one MSA.
+
+    Parameters
+    ----------
+    genome_ids : list[str]
+        Genome ID of every row, in file order.
+    duplicate_policy : str
+        ``keep-first`` keeps the first row of a repeated genome, ``drop``
+        reports the genome as duplicated so it is removed from every MSA, and
+        ``error`` raises.
+
+    Returns
+    -------
+    tuple[Dict[str, int], set]
+        Genome ID to row index, and the set of duplicated genome IDs.
+    """
+    index = {}
+    duplicates = set()
+    for row, genome in enumerate(genome_ids):
+        if genome in index:
+            if duplicate_policy == "error":
+                raise ValueError(f"Genome {genome} appears more than once.")
+            duplicates.add(genome)
+        else:
+            index[genome] = row
+
+    return index, (duplicates if duplicate_policy == "drop" else set())
+
+def join_genomes(headers_list: List[list], pattern: str, missing_policy: str = "drop", duplicate_policy: str = "drop") -> Tuple[List[str], List[np.ndarray]]:
+    """Align the row order of any number of MSAs on the genome IDs in their headers.
+
+    Every MSA is indexed once in a hash table, so the join is linear in the
+    total number of rows. Genomes are kept in the order of the first MSA.
+
+    Parameters
+    ----------
+    headers_list : list[list[str]]
+        Headers of each MSA.
+    pattern : str
+        Regular expression extracting the genome ID (see `parse_genome_ids`).
+    missing_policy : str
+        ``drop`` keeps only genomes present in every MSA, ``error`` raises if
+        any genome is missing from some MSA.
+    duplicate_policy : str
+        See `index_genomes`.
+
+    Returns
+    -------
+    tuple[list[str], list[numpy.ndarray]]
+        The shared genome IDs and, for each MSA, the row indices that put it
+        in that genome order.
+
+    Raises
+    ------
+    ValueError
+        On unparsable headers, or missing / duplicated genomes under the
+        ``error`` policies.
+    """
+    indexes = []
+    dropped = set()
+    for number, headers in enumerate(headers_list, start=1):
+        try:
+            index, duplicates = index_genomes(parse_genome_ids(headers, pattern), duplicate_policy)
+        except ValueError as e:
+            raise ValueError(f"MSA {number}: {e}")
+        indexes.append(index)
+        dropped |= duplicates
+
+    shared = set(indexes[0]).intersection(*indexes[1:])
+    if missing_policy == "error":
+        seen = set().union(*indexes)
+        for number, index in enumerate(indexes, start=1):
+            missing = seen - set(index)
+            if missing:
+                raise ValueError(f"{len(missing)} genome(s) are missing from MSA {number}, e.g. {sorted(missing)[:5]}.")
+
+    genomes = [genome for genome in indexes[0] if genome in shared and genome not in dropped]
+    rows = [np.fromiter((index[genome] for genome in genomes), dtype=np.int64, count=len(genomes)) for index in indexes]
+
+    return genomes, rows
+
+####alphabet - every residue is translated to an integer state once with a 256-entry table shared by all engines
+def read_alphabet_groups(spec: str, seq_type: str) -> List[str]:
+    """Resolve an --alphabet value into its residue groups, one per state.
+
+    `spec` is the name of a built-in reduced alphabet, the path of a file
+    with one group per line (blank lines and lines starting with '#' are
+    ignored) or comma-separated groups.
+    """
+    if spec in REDUCED_ALPHABETS[seq_type]:
+        return list(REDUCED_ALPHABETS[seq_type][spec])
+    if os.path.isfile(spec):
+        with open(spec) as f:
+            lines = [line.strip() for line in f]
+        return ["".join(line.split()) for line in lines if line and not line.startswith("#")]
+    if "," in spec:
+        return [group.strip() for group in spec.split(",")]
+    raise ValueError(f"--alphabet {spec} is neither a built-in alphabet ({', '.join(REDUCED_ALPHABETS[seq_type])}), a file nor comma-separated groups.")
+
+def build_alphabet(seq_type: str, groups: List[str] = None, gap_state: bool = False, fold_case: bool = False,
+                   ambiguity: str = "skip") -> dict:
+    """Build the states of an alphabet and the lookup table from residue byte to state.
+
+    Every residue of group ``i`` is mapped to code ``i``. Anything else
+    (gaps, X, N, *, lowercase, etc.) is mapped to the number of states,
+    which every engine treats as "skip this genome for this pair".
+
+    Parameters
+    ----------
+    seq_type : str
+        ``A`` or ``N``; picks the default residues and the ambiguity codes.
+    groups : list[str], optional
+        Residues of every state, e.g. ``["LVIM", "C", ...]`` for a reduced
+        alphabet. Defaults to one state per residue of `seq_type`.
+    gap_state : bool
+        Add the `GAP_CHARACTERS` as one extra state.
+    fold_case : bool
+        Map lowercase letters to the state of their uppercase letter.
+    ambiguity : str
+        ``skip`` or ``map``: map an ambiguity code to a state when all the
+        residues it stands for belong to that state.
+
+    Returns
+    -------
+    dict
+        ``states`` the label of every state (its residues, ``-`` for gaps)
+        and ``table`` the uint8 lookup table of 256 entries.
+
+    Raises
+    ------
+    ValueError
+        If a residue is given to several states or there are too few or too
+        many states.
+    """
+    groups = list(AMINO_ACIDS if seq_type == "A" else NUCLEIC_ACIDS) if groups is None else list(groups)
+    if gap_state:
+        groups.append(GAP_CHARACTERS)
+    if not 2 <= len(groups) < 255 or not all(groups):
+        raise ValueError(f"An alphabet needs between 2 and 254 non-empty states, got {len(groups)}.")
+
+    n_states = len(groups)
+    table = np.full(256, n_states, dtype=np.uint8)
+    for code, group in enumerate(groups):
+        for char in group:
+            if table[ord(char)] != n_states:
+                raise ValueError(f"Residue '{char}' belongs to more than one state of the alphabet.")
+            table[ord(char)] = code
+    if ambiguity == "map":
+        for char, residues in AMBIGUITY_CODES[seq_type].items():
+            codes = set(table[[ord(residue) for residue in residues]].tolist())
+            if table[ord(char)] == n_states and len(codes) == 1 and n_states not in codes:
+                table[ord(char)] = codes.pop()
+    if fold_case:
+        for byte in range(ord("a"), ord("z") + 1):
+            if table[byte] == n_states:
+                table[byte] = table[byte - 32]
+    states = [group[0] if group == GAP_CHARACTERS else group for group in groups]
+
+    return {"states": states, "table": table}
+
+def encode_alignment(residues: np.ndarray, alphabet: dict) -> np.ndarray:
+    """Integer-encode a column-major residue matrix.
+
+    Parameters
+    ----------
+    residues : numpy.ndarray
+        uint8 residue bytes of shape (positions, genomes) from `read_alignment`.
+    alphabet : dict
+        Alphabet produced by `build_alphabet`.
+
+    Returns
+    -------
+    numpy.ndarray
+        uint8 codes of the same shape; row ``p`` holds the codes observed at
+        1-based position ``p + 1``.
+    """
+    return alphabet["table"][residues]
+
+def count_skipped_residues(residues: np.ndarray, alphabet: dict) -> Dict[str, int]:
+    """Count the residues of an alignment that fall outside the alphabet, by character, most frequent first."""
+    counts = np.bincount(residues.ravel(), minlength=256)
+    skipped = np.flatnonzero((alphabet["table"] == len(alphabet["states"])) & (counts > 0))
+    skipped = skipped[np.argsort(-counts[skipped], kind="stable")]
+
+    return {chr(byte): int(counts[byte]) for byte in skipped}
+
+def report_skipped_residues(skipped: Dict[str, int], n_residues: int, name: str) -> int:
+    """Print how many residues were skipped (see `count_skipped_residues`), listing the most frequent characters."""
+    n_skipped = sum(skipped.values())
+    if n_skipped:
+        #the long tail of rare characters is summarized
+        listed = ", ".join(f"'{char}' {count}" for char, count in list(skipped.items())[:8])
+        print(f"{name}: skipping {n_skipped} of {n_residues} residues ({n_skipped / n_residues:.2%}) outside the alphabet: {listed}{', ...' if len(skipped) > 8 else ''}")
+
+    return n_skipped
+
+####encoded MSA cache - alignments are stored encoded under a hash of their content and alphabet, so repeat runs map them instead of parsing
+#bump when the layout of a cache entry changes, older entries are then never hit again and age out
+CACHE_VERSION = 1
+
+def hash_file(path: str, chunk_bytes: int = 2**24) -> str:
+    """SHA-1 of a file's bytes, read in chunks."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+def cache_key(fasta_file: str, alphabet: dict, seq_type: str) -> str:
+    """Key of an MSA in the cache: the file content, sequence type and alphabet encoding."""
+    digest = hashlib.sha1(f"v{CACHE_VERSION} {seq_type} {hash_file(fasta_file)} {json.dumps(alphabet['states'])} ".encode())
+    digest.update(alphabet["table"].tobytes())
+
+    return digest.hexdigest()
+
+def cache_entries(cache: str) -> List[Tuple[float, int, str]]:
+    """(last use, size in bytes, path) of every complete entry in the cache, least recently used first."""
+    entries = []
+    for entry in glob.glob(f"{cache}/*/meta.json"):
+        entry = os.path.dirname(entry)
+        size = sum(os.path.getsize(path) for path in glob.glob(f"{entry}/*"))
+        entries.append((os.path.getmtime(entry), size, entry))
+
+    return sorted(entries)
+
+def evict_cache(cache: str, max_bytes: float) -> Tuple[int, int]:
+    """Remove the least recently used entries until the cache holds at most `max_bytes`.
+
+    Returns
+    -------
+    tuple[int, int]
+        Number of entries removed and bytes freed.
+    """
+    entries = cache_entries(cache)
+    total = sum(size for _, size, _ in entries)
+    removed, freed = 0, 0
+    for _, size, entry in entries:
+        if total - freed <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        removed += 1
+        freed += size
+
+    return removed, freed
+
+def read_cache_entry(cache: str, key: str) -> dict:
+    """Open a cache entry, or return None on a miss.
+
+    The codes are memory-mapped read-only, so only the columns a run
+    touches are read from disk. The entry is marked as used for the LRU
+    eviction.
+    """
+    entry = f"{cache}/{key}"
+    if not os.path.isfile(f"{entry}/meta.json"):
+        return None
+    with open(f"{entry}/meta.json") as f:
+        meta = json.load(f)
+    with open(f"{entry}/headers.json") as f:
+        headers = json.load(f)
+    os.utime(entry)
+
+    return {
+        "headers": headers,
+        "codes": np.load(f"{entry}/codes.npy", mmap_mode="r"),
+        "column_counts": np.load(f"{entry}/column_counts.npy"),
+        "skipped": meta["skipped"],
+    }
+
+def write_cache_entry(cache: str, key: str, fasta_file: str, headers: list, codes: np.ndarray, column_counts: np.ndarray,
+                      skipped: Dict[str, int], max_bytes: float) -> str:
+    """Store an encoded MSA in the cache and evict old entries above `max_bytes`.
+
+    The entry is written to a temporary directory and renamed into place, so
+    concurrent runs never read a partial entry; if another run stored the
+    same key first, its entry is kept.
+    """
+    entry = f"{cache}/{key}"
+    staging = f"{cache}/.{key}.{os.getpid()}.tmp"
+    os.makedirs(staging, exist_ok=True)
+    np.save(f"{staging}/codes.npy", codes)
+    np.save(f"{staging}/column_counts.npy", column_counts)
+    with open(f"{staging}/headers.json", "w") as f:
+        json.dump(headers, f)
+    with open(f"{staging}/meta.json", "w") as f:
+        json.dump({"source": os.path.abspath(fasta_file), "shape": list(codes.shape), "skipped": skipped, "version": CACHE_VERSION}, f)
+    try:
+        os.replace(staging, entry)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+    evict_cache(cache, max_bytes)
+
+    return entry
+
+def load_alignment(fasta_file: str, alphabet: dict, seq_type: str, cache: str = None, cache_size: float = None,
+                   name: str = "MSA") -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Read and encode an MSA, through the cache when one is given.
+
+    Parameters
+    ----------
+    fasta_file : str
+        Path to an aligned FASTA file, optionally gzip-compressed.
+    alphabet : dict
+        Alphabet produced by `build_alphabet`.
+    seq_type : str
+        ``A`` or ``N``.
+    cache : str, optional
+        Cache directory; the MSA is parsed and encoded without it.
+    cache_size : float, optional
+        Size limit of the cache in GB.
+    name : str
+        Label used in the printed messages.
+
+    Returns
+    -------
+    tuple[list[str], numpy.ndarray, numpy.ndarray]
+        Header lines, the encoded alignment of shape (positions, genomes)
+        (memory-mapped when it comes from the cache) and the unweighted
+        character counts of every column, shape (positions, states).
+
+    Raises
+    ------
+    ValueError
+        If a record's length differs from the first record's length.
+    """
+    with stage("parse") as work:
+        key = cache_key(fasta_file, alphabet, seq_type) if cache else None
+        entry = read_cache_entry(cache, key) if cache else None
+        if entry is None:
+            headers, residues = read_alignment(fasta_file)
+        work["items"] = len(headers if entry is None else entry["headers"])
+    if entry is not None:
+        print(f"{name}: loaded {len(entry['headers'])} encoded sequences of {fasta_file} from the cache.")
+        report_skipped_residues(entry["skipped"], entry["codes"].size, name)
+        return entry["headers"], entry["codes"], entry["column_counts"]
+
+    with stage("encode"):
+        codes = encode_alignment(residues, alphabet)
+        column_counts = np.rint(compute_column_profiles(codes, len(alphabet["states"]))["counts"]).astype(np.uint32)
+        skipped = count_skipped_residues(residues, alphabet)
+    report_skipped_residues(skipped, residues.size, name)
+    if cache and headers:
+        #a full disk or a concurrent clear-cache only costs the cache entry, not the run
+        try:
+            with stage("cache"):
+                os.makedirs(cache, exist_ok=True)
+                write_cache_entry(cache, key, fasta_file, headers, codes, column_counts, skipped, cache_size * 1024 ** 3)
+        except OSError as e:
+            print(f"{name}: could not store the encoded MSA in the cache: {e}")
+
+    return headers, codes, column_counts
+
+####regions - score a sub-grid of positions named in alignment columns or in the numbering of a reference sequence
+def parse_regions(spec: str) -> np.ndarray:
+    """Parse a region list such as ``10-50,72,88-90`` into sorted unique 1-based positions.
+
+    Raises
+    ------
+    ValueError
+        If an item is not a positive number or an increasing range.
+    """
+    positions = []
+    for item in spec.replace(" ", "").split(","):
+        match = re.fullmatch(r"(\d+)(?:-(\d+))?", item)
+        if match is None:
+            raise ValueError(f"Could not read the region '{item}' of '{spec}', use ranges and positions such as 10-50,72.")
+        start = int(match.group(1))
+        stop = start if match.group(2) is None else int(match.group(2))
+        if start < 1 or stop < start:
+            raise ValueError(f"The region '{item}' must be 1-based and increasing.")
+        positions.extend(range(start, stop + 1))
+
+    return np.unique(np.array(positions, dtype=np.int64))
+
+def read_reference_sequence(fasta_file: str, reference: str, pattern: str) -> str:
+    """Find the aligned sequence of the reference in an MSA.
+
+    A record is the reference when its header, the first word of its header
+    or its genome ID (parsed with `pattern`, see `parse_genome_ids`) equals
+    `reference`.
+
+    Raises
+    ------
+    ValueError
+        If no record or more than one record matches.
+    """
+    regex = re.compile(pattern)
+    matches = []
+    with open_fasta(fasta_file) as f:
+        parts = None
+        for line in f:
+            line = line.strip()
+            if line.startswith(b">"):
+                header = line[1:].decode("utf-8", "replace")
+                match = regex.search(header)
+                genome_id = None if match is None else (match.group(1) if regex.groups else match.group(0))
+                parts = [] if reference in (header, header.split(" ")[0], genome_id) else None
+                if parts is not None:
+                    matches.append(parts)
+            elif line and parts is not None:
+                parts.append(line)
+    if len(matches) != 1:
+        raise ValueError(f"{'No' if not matches else len(matches)} sequences in {fasta_file} match the reference '{reference}', it must match exactly one header or genome ID.")
+
+    return b"".join(matches[0]).decode("ascii", "replace")
+
+def reference_numbering(sequence: str) -> np.ndarray:
+    """1-based residue number of the reference at every alignment column, 0 where the reference has a gap."""
+    residues = ~np.isin(np.frombuffer(sequence.encode("ascii", "replace"), dtype=np.uint8), np.frombuffer(GAP_CHARACTERS.encode(), dtype=np.uint8))
+
+    return np.where(residues, np.cumsum(residues), 0)
+
+def region_columns(positions: np.ndarray, n_columns: int, numbering: np.ndarray = None, name: str = "MSA") -> np.ndarray:
+    """Translate region positions into 0-based alignment columns.
+
+    Without `numbering` the positions are alignment columns, otherwise they
+    are residue numbers of the reference (see `reference_numbering`).
+
+    Raises
+    ------
+    ValueError
+        If a position lies beyond the alignment or the reference.
+    """
+    if numbering is None:
+        if positions.max() > n_columns:
+            raise ValueError(f"The region of {name} reaches column {positions.max()} but the alignment has {n_columns} columns.")
+        return positions - 1
+    #column of every reference residue, in order
+    columns = np.flatnonzero(numbering)
+    if positions.max() > len(columns):
+        raise ValueError(f"The region of {name} reaches residue {positions.max()} but the reference has {len(columns)} residues.")
+
+    return columns[positions - 1]
+
+def add_reference_columns(table: pd.DataFrame, references: Tuple[np.ndarray, np.ndarray]) -> pd.DataFrame:
+    """Add the reference numbering of both positions (``Ref_Position_MSA1``/``Ref_Position_MSA2``) to a pair table.
+
+    `references` holds the `reference_numbering` of each MSA; positions where
+    the reference has a gap are left empty.
+    """
+    if references is None:
+        return table
+    for column, numbering in zip(["Position_MSA1", "Position_MSA2"], references):
+        values = numbering[table[column].to_numpy(dtype=np.int64) - 1]
+        table[f"Ref_{column}"] = pd.arrays.IntegerArray(values, mask=values == 0)
+
+    return table
+
+####contingency tables - one-hot blocks multiplied together count every genome of a block pair at once
+def one_hot_columns(codes: np.ndarray, n_states: int, dtype=np.float64) -> np.ndarray:
+    """Expand a block of encoded columns into a genome x (column, state) indicator matrix.
+
+    Invalid codes (``>= n_states``) become all-zero rows so they drop out of
+    every count built from the matrix.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+        Encoded block of shape (columns, genomes).
+    n_states : int
+        Number of valid characters.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (genomes, columns * n_states).
+    """
+    identity = np.eye(n_states + 1, dtype=dtype)[:, :n_states]
+    return identity[codes.T].reshape(codes.shape[1], codes.shape[0] * n_states)
+
+def count_pair_tile(codes1: np.ndarray, codes2: np.ndarray, n_states: int, weights: np.ndarray = None) -> np.ndarray:
+    """Count co-occurring character pairs for every column pair of two blocks.
+
+    The counts are the product of the one-hot matrices of both blocks, so the
+    whole block is counted with a single matrix multiplication instead of a
+    loop over genomes.
+
+    Parameters
+    ----------
+    codes1, codes2 : numpy.ndarray
+        Encoded blocks of shape (columns, genomes) with matching genome order.
+    n_states : int
+        Number of valid characters.
+    weights : numpy.ndarray, optional
+        Per-genome weights; each genome adds its weight instead of 1.
+
+    Returns
+    -------
+    numpy.ndarray
+        Pair counts of shape (columns1, n_states, columns2, n_states).
+    """
+    #float32 is exact for integer counts up to 2**24 and much faster to multiply
+    dtype = np.float32 if codes1.shape[1] < 2**24 and weights is None else np.float64
+    onehot1 = one_hot_columns(codes1, n_states, dtype)
+    onehot2 = onehot1 if codes2 is codes1 else one_hot_columns(codes2, n_states, dtype)
+    if weights is not None:
+        onehot1 = onehot1 * weights[:, None]
+    counts = onehot1.T @ onehot2
+
+    return counts.astype(np.float64).reshape(codes1.shape[0], n_states, codes2.shape[0], n_states)
+
+def count_pair_list(codes1: np.ndarray, codes2: np.ndarray, index1: np.ndarray, index2: np.ndarray, n_states: int,
+                    weights: np.ndarray = None, chunk_bytes: int = 2**26) -> np.ndarray:
+    """Count co-occurring character pairs for a list of column pairs.
+
+    Used when only scattered pairs are needed (screening candidates), where
+    scoring whole blocks would count mostly unwanted pairs. Each pair's
+    joint codes are counted with one `np.bincount` over a chunk of pairs.
+
+    Parameters
+    ----------
+    codes1, codes2 : numpy.ndarray
+        Encoded alignments of shape (positions, genomes) with matching genome order.
+    index1, index2 : numpy.ndarray
+        0-based rows of `codes1` and `codes2` forming each pair.
+    n_states : int
+        Number of valid characters.
+    weights : numpy.ndarray, optional
+        Per-genome weights; each genome adds its weight instead of 1.
+
+    Returns
+    -------
+    numpy.ndarray
+        Pair counts of shape (pairs, n_states, n_states).
+    """
+    n_codes = n_states + 1
+    n_genomes = codes1.shape[1]
+    counts = np.zeros((len(index1), n_codes * n_codes), dtype=np.float64)
+    pairs_per_chunk = max(1, chunk_bytes // (8 * max(n_genomes, 1)))
+    for start in range(0, len(index1), pairs_per_chunk):
+        stop = min(start + pairs_per_chunk, len(index1))
+        cells = codes1[index1[start:stop]].astype(np.int64) * n_codes + codes2[index2[start:stop]]
+        cells += (np.arange(stop - start, dtype=np.int64) * n_codes * n_codes)[:, None]
+        chunk_weights = None if weights is None else np.tile(weights, stop - start)
+        counts[start:stop] = np.bincount(cells.ravel(), weights=chunk_weights, minlength=(stop - start) * n_codes * n_codes).reshape(stop - start, -1)
+
+    return counts.reshape(-1, n_codes, n_codes)[:, :n_states, :n_states]
+
+####bit-packed nucleotide engine - four states fit in two bits, so genomes are counted 64 at a time with popcounts
+def pack_nucleotides(codes: np.ndarray) -> np.ndarray:
+    """Pack an encoded nucleotide alignment into 2-bit codes plus a validity mask.
+
+    Each column becomes three bit planes over the genomes, packed into
+    64-bit words: the high and low bit of the code and a mask of the genomes
+    with a valid base. Gaps, ambiguous bases and the padding of the last word
+    are 0 in the mask, so they are never counted.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+        Encoded alignment of shape (positions, genomes) over four states,
+        the `NUCLEIC_ACIDS` or any other four-state alphabet.
+
+    Returns
+    -------
+    numpy.ndarray
+        uint64 array of shape (positions, 3, words): high bits, low bits and
+        validity mask.
+    """
+    n_positions, n_genomes = codes.shape
+    n_words = max(1, -(-n_genomes // 64))
+    valid = codes < 4
+    planes = np.stack([valid & (codes >> 1 & 1).astype(bool), valid & (codes & 1).astype(bool), valid], axis=1)
+    packed = np.packbits(planes, axis=2, bitorder="little")
+    padded = np.zeros((n_positions, 3, n_words * 8), dtype=np.uint8)
+    padded[:, :, :packed.shape[2]] = packed
+
+    return padded.view("<u8").reshape(n_positions, 3, n_words)
+
+def nucleotide_indicators(packed: np.ndarray) -> np.ndarray:
+    """Expand packed columns into one bit mask per state: (positions, 4, words)."""
+    high, low, valid = packed[:, 0], packed[:, 1], packed[:, 2]
+    return np.stack([valid & ~high & ~low, valid & ~high & low, valid & high & ~low, valid & high & low], axis=1)
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Number of set bits of every 64-bit word."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    #numpy < 2.0: count the bits of every byte with a lookup table
+    table = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+    return table[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+def count_packed_pair_tile(packed1: np.ndarray, packed2: np.ndarray, chunk_bytes: int = 2**22) -> np.ndarray:
+    """Count the 16 joint nucleotide states of every column pair of two packed blocks.
+
+    Each count is the popcount of the AND of two state masks, summed over
+    the packed words. Words are handled in chunks so the intermediate stays
+    below `chunk_bytes` (small enough to stay in cache).
+
+    Parameters
+    ----------
+    packed1, packed2 : numpy.ndarray
+        Blocks produced by `pack_nucleotides` with matching genome order.
+
+    Returns
+    -------
+    numpy.ndarray
+        Pair counts of shape (columns1, 4, columns2, 4), like `count_pair_tile`.
+    """
+    #words first, so every chunk is one contiguous slab and the sum runs over the outer axis
+    indicators1 = np.ascontiguousarray(np.moveaxis(nucleotide_indicators(packed1), 2, 0))
+    indicators2 = indicators1 if packed2 is packed1 else np.ascontiguousarray(np.moveaxis(nucleotide_indicators(packed2), 2, 0))
+    n_words, n_columns1, n_columns2 = indicators1.shape[0], indicators1.shape[1], indicators2.shape[1]
+    words_per_chunk = max(1, chunk_bytes // (8 * n_columns1 * n_columns2 * 16))
+    counts = np.zeros((n_columns1, 4, n_columns2, 4), dtype=np.int64)
+    for start in range(0, n_words, words_per_chunk):
+        stop = start + words_per_chunk
+        both = indicators1[start:stop, :, :, None, None] & indicators2[start:stop, None, None, :, :]
+        counts += popcount(both).sum(axis=0, dtype=np.int64)
+
+    return counts.astype(np.float64)
+
+def compute_column_profiles(codes: np.ndarray, n_states: int, weights: np.ndarray = None) -> Dict[str, np.ndarray]:
+    """Count each column's characters once and derive its entropy.
+
+    The profile replaces the `seq1_pb` / `seq2_pb` recount that the reference
+    loop repeats for every partner column. For a pair of gap-free columns the
+    pair-restricted marginals equal these full-column marginals, so the MIT
+    score reduces to ``H(i) + H(j) - H(i, j)`` and only the joint table has
+    to be evaluated.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+        Encoded alignment of shape (positions, genomes).
+    n_states : int
+        Number of valid characters (also the log base of the entropy).
+    weights : numpy.ndarray, optional
+        Per-genome weights; counts are weighted sums when given.
+
+    Returns
+    -------
+    Dict[str, numpy.ndarray]
+        ``counts`` (positions, n_states) character counts, ``n_valid`` number
+        (or total weight) of genomes with a valid character, ``coverage`` the
+        fraction of genomes with a valid character, ``complete`` True where
+        no genome is skipped and ``entropy`` the Shannon entropy of the valid
+        characters in base ``n_states``.
+    """
+    n_positions, n_genomes = codes.shape
+    offsets = (np.arange(n_positions, dtype=np.int64) * (n_states + 1))[:, None]
+    tiled_weights = None if weights is None else np.tile(weights, n_positions)
+    counts = np.bincount((codes + offsets).ravel(), weights=tiled_weights, minlength=n_positions * (n_states + 1))
+    counts = counts.reshape(n_positions, n_states + 1)[:, :n_states].astype(np.float64)
+
+    n_valid = counts.sum(axis=1)
+    complete = (codes < n_states).all(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        probabilities = counts / n_valid[:, None]
+        terms = probabilities * np.log(probabilities)
+    terms[~(probabilities > 0)] = 0.0
+
+    return {
+        "counts": counts,
+        "n_valid": n_valid,
+        "coverage": (codes < n_states).mean(axis=1) if n_genomes else np.zeros(n_positions),
+        "complete": complete,
+        "entropy": -terms.sum(axis=1) / log(n_states),
+    }
+
+def mit_from_pair_counts(pair_counts: np.ndarray, base: int, profiles1: Dict[str, np.ndarray] = None, profiles2: Dict[str, np.ndarray] = None) -> np.ndarray:
+    """Vectorized `calculate_mit` for a block of pair-count tables.
+
+    Marginals are taken from the pair table itself so, as in the reference
+    loop, only genomes that are valid at both positions contribute. When the
+    column profiles of the block are given, pairs of gap-free columns use the
+    precomputed entropies instead and only need the joint entropy.
+
+    Parameters
+    ----------
+    pair_counts : numpy.ndarray
+        Pair counts of shape (columns1, n_states, columns2, n_states).
+    base : int
+        Logarithm base, ``len(valid_chars)``.
+    profiles1, profiles2 : Dict[str, numpy.ndarray], optional
+        `compute_column_profiles` output restricted to the block's columns.
+
+    Returns
+    -------
+    numpy.ndarray
+        MIT scores of shape (columns1, columns2). Pairs without any valid
+        genome score 0.
+    """
+    total = pair_counts.sum(axis=(1, 3))
+    if profiles1 is not None and profiles2 is not None:
+        complete = profiles1["complete"][:, None] & profiles2["complete"][None, :]
+    else:
+        complete = np.zeros(total.shape, dtype=bool)
+
+    mit_scores = np.zeros(total.shape, dtype=np.float64)
+    if complete.any():
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p_ab = pair_counts / total[:, None, :, None]
+            terms = p_ab * np.log(p_ab)
+        terms[~(p_ab > 0)] = 0.0
+        joint_entropy = -terms.sum(axis=(1, 3)) / log(base)
+        shortcut = profiles1["entropy"][:, None] + profiles2["entropy"][None, :] - joint_entropy
+        #rounding can leave independent columns a hair below zero
+        mit_scores[complete] = np.maximum(shortcut[complete], 0.0)
+
+    if not complete.all():
+        total = total[:, None, :, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p_ab = pair_counts / total
+            p_a = pair_counts.sum(axis=3, keepdims=True) / total
+            p_b = pair_counts.sum(axis=1, keepdims=True) / total
+            terms = p_ab * np.log(p_ab / (p_a * p_b))
+        #zero probabilities don't contribute to the score
+        terms[~(p_ab > 0)] = 0.0
+        general = terms.sum(axis=(1, 3)) / log(base)
+        mit_scores[~complete] = general[~complete]
+
+    return mit_scores
+
+def estimate_cells(counts: np.ndarray, axis) -> Tuple[np.ndarray, np.ndarray]:
+    """Chao1 estimate of the number of cells with nonzero probability, and its variance.
+
+    Cells never seen in a small sample still bias the plug-in score, so the
+    observed cells are topped up with ``f1^2 / 2 f2`` unseen ones, where
+    ``f1`` and ``f2`` count the cells seen once and twice. The estimate is
+    capped at the number of cells the table has.
+    """
+    observed = (counts > 0).sum(axis=axis)
+    singletons = (counts == 1).sum(axis=axis).astype(np.float64)
+    doubletons = (counts == 2).sum(axis=axis).astype(np.float64)
+    ratio = singletons / np.maximum(doubletons, 1.0)
+    unseen = np.where(doubletons > 0, singletons ** 2 / (2 * np.maximum(doubletons, 1.0)), singletons * (singletons - 1) / 2)
+    variance = np.where(doubletons > 0, doubletons * (ratio ** 4 / 4 + ratio ** 3 + ratio ** 2 / 2), singletons * (2 * singletons - 1) ** 2 / 4)
+
+    possible = np.prod([counts.shape[dimension] for dimension in np.atleast_1d(axis)])
+
+    return np.minimum(observed + unseen, possible), variance
+
+def sketch_mit_from_pair_counts(pair_counts: np.ndarray, base: int, scale: float) -> np.ndarray:
+    """Estimate full-alignment MIT scores, with standard errors, from the pair counts of a genome subsample.
+
+    The plug-in score of ``n`` genomes is biased up by about
+    ``(cells_ab - cells_a - cells_b + 1) / 2n`` nats (Miller-Madow), so the
+    estimate swaps the bias of the subsample for the smaller bias of the
+    ``scale`` times larger full alignment. Rare residues leave many cells
+    unseen in a subsample, so the cells are counted with `estimate_cells`.
+    The standard error adds the delta-method variance of the plug-in score,
+    its chi-square spread under independence and the uncertainty of the
+    unseen joint cells, all shrunk by the sampled fraction.
+
+    Parameters
+    ----------
+    pair_counts : numpy.ndarray
+        Pair counts of the subsample, shape (columns1, n_states, columns2, n_states).
+    base : int
+        Logarithm base, ``len(valid_chars)``.
+    scale : float
+        Number of genomes of the alignment per subsampled genome.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (2, columns1, columns2): the estimated scores and
+        their standard errors. Pairs without any valid genome in the
+        subsample get an infinite standard error.
+    """
+    total = pair_counts.sum(axis=(1, 3))
+    occupied = pair_counts > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p_ab = pair_counts / total[:, None, :, None]
+        p_a = p_ab.sum(axis=3, keepdims=True)
+        p_b = p_ab.sum(axis=1, keepdims=True)
+        ratio = np.where(occupied, np.log(p_ab / (p_a * p_b)), 0.0)
+    p_ab = np.where(occupied, p_ab, 0.0)
+    mit = (p_ab * ratio).sum(axis=(1, 3))
+    second_moment = (p_ab * ratio ** 2).sum(axis=(1, 3))
+    cells_ab, cells_variance = estimate_cells(pair_counts, (1, 3))
+    cells_a, _ = estimate_cells(pair_counts.sum(axis=3), 1)
+    cells_b, _ = estimate_cells(pair_counts.sum(axis=1), 2)
+
+    shrink = 1.0 - 1.0 / scale
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bias = (cells_ab - cells_a - cells_b + 1) * shrink / (2.0 * total)
+        variance = (np.maximum(second_moment - mit ** 2, 0.0) / total + (cells_a - 1) * (cells_b - 1) / (2.0 * total ** 2)) * shrink
+        variance += cells_variance * (shrink / (2.0 * total)) ** 2
+    estimate = np.where(total > 0, mit - bias, 0.0) / log(base)
+    standard_error = np.where(total > 0, np.sqrt(variance), np.inf) / log(base)
+
+    return np.stack([estimate, standard_error])
+
+def slice_profiles(profiles: Dict[str, np.ndarray], start: int, stop: int) -> Dict[str, np.ndarray]:
+    """Restrict column profiles to positions ``start:stop`` (0-based)."""
+    return {key: value[start:stop] for key, value in profiles.items()}
+
+def take_profiles(profiles: Dict[str, np.ndarray], columns: np.ndarray) -> Dict[str, np.ndarray]:
+    """Restrict column profiles to the given 0-based column indices."""
+    return {key: value[columns] for key, value in profiles.items()}
+
+####informative-column prefilter - columns that cannot carry signal are left out of the pair space
+def select_informative_columns(profiles: Dict[str, np.ndarray], min_entropy: float = 0.0, min_coverage: float = 0.0) -> np.ndarray:
+    """Pick the columns worth scoring.
+
+    A column is kept when its entropy is above `min_entropy` and at least
+    `min_coverage` of the genomes carry a valid residue there. With the
+    default thresholds only invariant (or empty) columns are dropped; their
+    score with any partner is exactly 0, so the filter is lossless.
+
+    Returns
+    -------
+    numpy.ndarray
+        0-based indices of the kept columns.
+    """
+    return np.flatnonzero((profiles["entropy"] > min_entropy) & (profiles["coverage"] >= min_coverage))
+
+def report_prefilter(columns1: np.ndarray, n_columns1: int, columns2: np.ndarray, n_columns2: int, symmetric: bool) -> float:
+    """Print how much of the pair space the prefilter removed.
+
+    Returns
+    -------
+    float
+        Fraction of the position pairs that are not scored.
+    """
+    if symmetric:
+        total = n_columns1 * (n_columns1 + 1) // 2
+        scored = len(columns1) * (len(columns1) + 1) // 2
+        print(f"Prefilter kept {len(columns1)} of {n_columns1} columns.")
+    else:
+        total = n_columns1 * n_columns2
+        scored = len(columns1) * len(columns2)
+        print(f"Prefilter kept {len(columns1)} of {n_columns1} columns of MSA1 and {len(columns2)} of {n_columns2} columns of MSA2.")
+    skipped = 1.0 - scored / total if total else 0.0
+    print(f"Scoring {scored} of {total} position pairs ({100 * skipped:.1f}% of the work skipped).")
+
+    return skipped
+
+def expand_matrix(matrix: np.ndarray, columns1: np.ndarray, columns2: np.ndarray, shape: Tuple[int, int], fill: float) -> np.ndarray:
+    """Scatter a matrix computed on the kept columns back into the full position grid."""
+    if matrix.shape == tuple(shape):
+        return matrix
+    full = np.full(shape, fill, dtype=np.float64)
+    full[np.ix_(columns1, columns2)] = matrix
+    return full
+
+def plan_tiles(n_positions1: int, n_positions2: int, tile_size: int, symmetric: bool = False) -> List[Tuple[int, int]]:
+    """List the 0-based start positions of every block of the pair grid.
+
+    For symmetric (self-coevolution) runs only blocks on or above the
+    diagonal are listed. The order is deterministic so that `--shard` runs
+    on different machines agree on which blocks belong to which shard.
+    """
+    return [
+        (start1, start2)
+        for start1 in range(0, n_positions1, tile_size)
+        for start2 in range(start1 if symmetric else 0, n_positions2, tile_size)
+    ]
+
+def shard_tiles(tiles: List[Tuple[int, int]], shard_index: int, n_shards: int) -> List[Tuple[int, int]]:
+    """Select the blocks of one shard; blocks are dealt round-robin to balance the triangle."""
+    return tiles[shard_index::n_shards]
+
+def score_tile(codes1: np.ndarray, codes2: np.ndarray, n_states: int, tile: Tuple[int, int], tile_size: int,
+               profiles1: Dict[str, np.ndarray], profiles2: Dict[str, np.ndarray], weights: np.ndarray = None,
+               sketch_scale: float = None) -> Tuple[int, int, np.ndarray]:
+    """Score one block of the pair grid.
+
+    When `codes2` is None the alignment is scored against itself and
+    diagonal blocks are symmetrized from their upper triangle with each
+    column's entropy (the score of a position with itself) on the diagonal.
+    With `sketch_scale` the codes are a genome subsample and the block holds
+    the estimates and standard errors of `sketch_mit_from_pair_counts`
+    instead, left unsymmetrized.
+    """
+    start1, start2 = tile
+    symmetric = codes2 is None
+    if symmetric:
+        codes2, profiles2 = codes1, profiles1
+
+    block_profiles1 = slice_profiles(profiles1, start1, start1 + tile_size)
+    block_profiles2 = slice_profiles(profiles2, start2, start2 + tile_size)
+    counting_start = time.perf_counter()
+    if codes1.dtype == np.uint64:
+        #bit-packed nucleotides, see `pack_nucleotides`
+        pair_counts = count_packed_pair_tile(codes1[start1:start1 + tile_size], codes2[start2:start2 + tile_size])
+    else:
+        pair_counts = count_pair_tile(codes1[start1:start1 + tile_size], codes2[start2:start2 + tile_size], n_states, weights)
+    mi_start = time.perf_counter()
+    if sketch_scale is not None:
+        block = sketch_mit_from_pair_counts(pair_counts, n_states, sketch_scale)
+    else:
+        block = mit_from_pair_counts(pair_counts, n_states, block_profiles1, block_profiles2)
+    _SCORE_TIMES["pair_counting"] += mi_start - counting_start
+    _SCORE_TIMES["mi"] += time.perf_counter() - mi_start
+    if symmetric and start1 == start2 and sketch_scale is None:
+        upper = np.triu(block, 1)
+        block = upper + upper.T + np.diag(block_profiles1["entropy"])
+
+    return start1, start2, block
+
+####process pool - workers map the encoded alignments from shared memory instead of receiving copies
+_TILE_WORKER = {}
+
+def _share_codes(codes: np.ndarray) -> shared_memory.SharedMemory:
+    """Copy an encoded alignment into a new shared memory block."""
+    shm = shared_memory.SharedMemory(create=True, size=max(codes.nbytes, 1))
+    np.ndarray(codes.shape, dtype=codes.dtype, buffer=shm.buf)[:] = codes
+    return shm
+
+def _attach_codes(name: str, shape: tuple, dtype: str = "|u1") -> np.ndarray:
+    """Map an encoded (or bit-packed) alignment from shared memory in a worker process."""
+    shm = shared_memory.SharedMemory(name=name)
+    #keep a reference so the mapping lives as long as the worker
+    _TILE_WORKER.setdefault("segments", []).append(shm)
+
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+def _init_tile_worker(shared1: tuple, shared2: tuple, state: dict):
+    #one BLAS thread per worker, otherwise every worker fans out over all cores
+    try:
+        from threadpoolctl import threadpool_limits
+        _TILE_WORKER["limits"] = threadpool_limits(1)
+    except ImportError:
+        pass
+    _TILE_WORKER.update(state)
+    _TILE_WORKER["codes1"] = _attach_codes(*shared1)
+    _TILE_WORKER["codes2"] = None if shared2 is None else _attach_codes(*shared2)
+    if shared2 is not None and shared2[0] == shared1[0]:
+        _TILE_WORKER["codes2"] = _TILE_WORKER["codes1"]
+
+def _score_tile_in_worker(tile: Tuple[int, int]) -> Tuple[int, int, np.ndarray, dict]:
+    #the stage times of the block travel back with it, the worker's own counters are reset
+    result = score_tile(
+        _TILE_WORKER["codes1"], _TILE_WORKER["codes2"], _TILE_WORKER["n_states"], tile,
+        _TILE_WORKER["tile_size"], _TILE_WORKER["profiles1"], _TILE_WORKER["profiles2"], _TILE_WORKER["weights"],
+        _TILE_WORKER.get("sketch_scale")
+    )
+    times = dict(_SCORE_TIMES)
+    _SCORE_TIMES.update(pair_counting=0.0, mi=0.0)
+    return result + (times,)
+
+def iter_pool_tasks(codes1: np.ndarray, codes2: np.ndarray, state: dict, task_function, tasks: list, workers: int) -> Iterator:
+    """Run `task_function` over `tasks` in a process pool that shares the encoded alignments.
+
+    The alignments are copied once into shared memory and mapped by every
+    worker as ``_TILE_WORKER["codes1"]`` / ``_TILE_WORKER["codes2"]``; the
+    small per-run `state` (profiles, block size, ...) is sent once per
+    worker. Results are yielded in completion order.
+    """
+    segments = [_share_codes(codes1)]
+    shared1 = (segments[0].name, codes1.shape, codes1.dtype.str)
+    shared2 = None
+    if codes2 is codes1:
+        shared2 = shared1
+    elif codes2 is not None:
+        segments.append(_share_codes(codes2))
+        shared2 = (segments[1].name, codes2.shape, codes2.dtype.str)
+    try:
+        with multiprocessing.Pool(min(workers, len(tasks)), initializer=_init_tile_worker, initargs=(shared1, shared2, state)) as pool:
+            yield from pool.imap_unordered(task_function, tasks)
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+def iter_mit_tiles(codes1: np.ndarray, codes2: np.ndarray, n_states: int, tile_size: int = 64,
+                   profiles1: Dict[str, np.ndarray] = None, profiles2: Dict[str, np.ndarray] = None,
+                   tiles: List[Tuple[int, int]] = None, workers: int = 1, weights: np.ndarray = None,
+                   sketch_scale: float = None) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """Score the position-pair grid block by block.
+
+    When `codes2` is None the alignment is scored against itself: only blocks
+    on or above the diagonal are computed and callers mirror the
+    off-diagonal blocks. With ``workers > 1`` the blocks are scored by a
+    process pool that reads the encoded alignments from shared memory, and
+    are yielded in completion order.
+
+    Parameters
+    ----------
+    codes1, codes2 : numpy.ndarray
+        Encoded alignments of shape (positions, genomes).
+    n_states : int
+        Number of valid characters (also the log base).
+    tile_size : int
+        Number of positions per block along each axis.
+    profiles1, profiles2 : Dict[str, numpy.ndarray], optional
+        Precomputed `compute_column_profiles` output; computed here if missing.
+    tiles : list[tuple[int, int]], optional
+        Blocks to score, from `plan_tiles`; defaults to the whole grid.
+    workers : int
+        Number of worker processes.
+    weights : numpy.ndarray, optional
+        Per-genome weights (see `compute_sequence_weights`).
+    sketch_scale : float, optional
+        The codes are a genome subsample of an alignment this many times
+        larger; blocks hold sketch estimates and standard errors (see
+        `score_tile`).
+
+    Yields
+    ------
+    tuple[int, int, numpy.ndarray]
+        0-based start row, start column and the block of MIT scores.
+    """
+    symmetric = codes2 is None
+    if profiles1 is None:
+        profiles1 = compute_column_profiles(codes1, n_states, weights)
+    if symmetric:
+        profiles2 = None
+    elif profiles2 is None:
+        profiles2 = compute_column_profiles(codes2, n_states, weights)
+    n_positions1 = codes1.shape[0]
+    n_positions2 = n_positions1 if symmetric else codes2.shape[0]
+    if tiles is None:
+        tiles = plan_tiles(n_positions1, n_positions2, tile_size, symmetric)
+    progress = new_progress(sum(tile_pairs(tile, tile_size, n_positions1, n_positions2, symmetric) for tile in tiles), "Scored position pairs")
+
+    if workers <= 1 or len(tiles) <= 1:
+        for tile in tiles:
+            yield score_tile(codes1, codes2, n_states, tile, tile_size, profiles1, profiles2, weights, sketch_scale)
+            update_progress(progress, tile_pairs(tile, tile_size, n_positions1, n_positions2, symmetric))
+        return
+
+    state = {"n_states": n_states, "tile_size": tile_size, "profiles1": profiles1, "profiles2": profiles2, "weights": weights, "sketch_scale": sketch_scale}
+    for start1, start2, block, times in iter_pool_tasks(codes1, codes2, state, _score_tile_in_worker, tiles, workers):
+        for name, seconds in times.items():
+            _SCORE_TIMES[name] += seconds
+        yield start1, start2, block
+        update_progress(progress, tile_pairs((start1, start2), tile_size, n_positions1, n_positions2, symmetric))
+
+def tile_pairs(tile: Tuple[int, int], tile_size: int, n_positions1: int, n_positions2: int, symmetric: bool = False) -> int:
+    """Number of distinct position pairs a block scores (a diagonal block of a symmetric run covers its upper triangle)."""
+    rows = min(tile_size, n_positions1 - tile[0])
+    columns = min(tile_size, n_positions2 - tile[1])
+    if symmetric and tile[0] == tile[1]:
+        return rows * (rows + 1) // 2
+    return rows * columns
+
+def calculate_mit_matrix(codes1: np.ndarray, codes2: np.ndarray, valid_chars: list, tile_size: int = 64, workers: int = 1,
+                         profiles1: Dict[str, np.ndarray] = None, profiles2: Dict[str, np.ndarray] = None,
+                         weights: np.ndarray = None) -> np.ndarray:
+    """Compute the full MIT score matrix with the vectorized engine.
+
+    Parameters
+    ----------
+    codes1, codes2 : numpy.ndarray
+        Encoded alignments produced by `encode_alignment`. Pass None for
+        `codes2` to score `codes1` against itself; only the upper triangle is
+        computed and mirrored into the lower one.
+    valid_chars : list[str]
+        List of allowed characters; the log base is ``len(valid_chars)``.
+    tile_size : int
+        Number of positions per block along each axis.
+    workers : int
+        Number of worker processes.
+    profiles1, profiles2 : Dict[str, numpy.ndarray], optional
+        Precomputed `compute_column_profiles` output; computed if missing.
+    weights : numpy.ndarray, optional
+        Per-genome weights (see `compute_sequence_weights`).
+
+    Returns
+    -------
+    numpy.ndarray
+        Matrix of shape (positions MSA1, positions MSA2); entry ``[i, j]``
+        is the score of 1-based positions ``i + 1`` and ``j + 1``.
+    """
+    if codes2 is not None and codes1.shape[1] != codes2.shape[1]:
+        raise ValueError(f"MSA1 has {codes1.shape[1]} sequences but MSA2 has {codes2.shape[1]}.")
+
+    n_positions2 = codes1.shape[0] if codes2 is None else codes2.shape[0]
+    matrix = np.zeros((codes1.shape[0], n_positions2), dtype=np.float64)
+    for start1, start2, block in iter_mit_tiles(codes1, codes2, len(valid_chars), tile_size, profiles1, profiles2, workers=workers, weights=weights):
+        place_tile(matrix, start1, start2, block, symmetric=codes2 is None)
+
+    return matrix
+
+def place_tile(matrix: np.ndarray, start1: int, start2: int, block: np.ndarray, symmetric: bool = False):
+    """Write a scored block into the full matrix, mirroring it for self-coevolution runs."""
+    stop1, stop2 = start1 + block.shape[0], start2 + block.shape[1]
+    matrix[start1:stop1, start2:stop2] = block
+    if symmetric:
+        matrix[start2:stop2, start1:stop1] = block.T
+
+####sharded runs - each scheduler array task scores a fixed subset of blocks and `merge` assembles them
+def write_shard(output: str, shard_index: int, n_shards: int, shape: Tuple[int, int], symmetric: bool,
+                blocks: List[Tuple[int, int, np.ndarray]], positions1: np.ndarray, positions2: np.ndarray,
+                columns1: np.ndarray, columns2: np.ndarray, fill: float, tile_size: int, fingerprint: str) -> str:
+    """Write the blocks scored by one shard to ``mit_shard_<i>_of_<N>.npz``.
+
+    Blocks are in the coordinates of the prefiltered grid `columns1` x
+    `columns2`; pairs outside it are filled with `fill` on merge. The block
+    size and the `fingerprint_inputs` of the run are stored as well, so
+    `merge_shards` only combines shards of the same run.
+
+    Returns
+    -------
+    str
+        Path of the written shard file.
+    """
+    os.makedirs(output, exist_ok=True)
+    path = f"{output}/mit_shard_{shard_index + 1}_of_{n_shards}.npz"
+    np.savez(
+        path,
+        shape=np.array(shape, dtype=np.int64),
+        symmetric=np.array(symmetric),
+        n_shards=np.array(n_shards),
+        positions1=positions1,
+        positions2=positions2,
+        columns1=columns1,
+        columns2=columns2,
+        fill=np.array(fill),
+        tile_size=np.array(tile_size),
+        fingerprint=np.array(fingerprint),
+        starts=np.array([(start1, start2) for start1, start2, _ in blocks], dtype=np.int64).reshape(-1, 2),
+        sizes=np.array([block.shape for _, _, block in blocks], dtype=np.int64).reshape(-1, 2),
+        values=np.concatenate([block.ravel() for _, _, block in blocks]) if blocks else np.zeros(0),
+    )
+
+    return path
+
+def merge_shards(shard_dir: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Assemble the MIT score matrix from every shard file in `shard_dir`.
+
+    Returns
+    -------
+    tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        The score matrix and the position labels of its rows and columns.
+
+    Raises
+    ------
+    ValueError
+        If no shard files are found, shards disagree on the grid (shape,
+        block size, kept columns, fill or input alignments), or a shard is
+        missing.
+    """
+    paths = sorted(glob.glob(f"{shard_dir}/mit_shard_*_of_*.npz"))
+    if not paths:
+        raise ValueError(f"No mit_shard_*.npz files found in {shard_dir}.")
+
+    matrix = None
+    for path in paths:
+        with np.load(path) as shard:
+            if "fingerprint" not in shard.files:
+                raise ValueError(f"Shard {path} was written without its block size and input fingerprint, rerun it.")
+            shape, symmetric, n_shards = tuple(shard["shape"]), bool(shard["symmetric"]), int(shard["n_shards"])
+            #fill is NaN for --skipped-pairs na, which never compares equal to itself
+            run = (shape, symmetric, n_shards, int(shard["tile_size"]), str(shard["fingerprint"]), tuple(shard["columns1"]),
+                   tuple(shard["columns2"]), None if np.isnan(shard["fill"]) else float(shard["fill"]))
+            if matrix is None:
+                columns1, columns2, fill = shard["columns1"], shard["columns2"], float(shard["fill"])
+                matrix = np.zeros((len(columns1), len(columns2)), dtype=np.float64)
+                expected = run
+                positions1, positions2 = shard["positions1"], shard["positions2"]
+            elif run != expected:
+                raise ValueError(f"Shard {path} was computed for a different run than {paths[0]} (inputs, --tile-size, --min-entropy, --min-coverage or --skipped-pairs differ).")
+            offset = 0
+            for (start1, start2), (size1, size2) in zip(shard["starts"], shard["sizes"]):
+                block = shard["values"][offset:offset + size1 * size2].reshape(size1, size2)
+                place_tile(matrix, start1, start2, block, symmetric)
+                offset += size1 * size2
+
+    found = {os.path.basename(path) for path in paths}
+    missing = [i for i in range(1, n_shards + 1) if f"mit_shard_{i}_of_{n_shards}.npz" not in found]
+    if missing:
+        raise ValueError(f"Missing shard(s) {missing} of {n_shards} in {shard_dir}.")
+
+    return expand_matrix(matrix, columns1, columns2, shape, fill), positions1, positions2
+
+####checkpointed runs - finished blocks go straight to a memory-mapped matrix and are logged, so a killed run can resume
+#default seconds between flushes of the score matrix and the log of finished blocks (--checkpoint-interval)
+CHECKPOINT_SECONDS = 30.0
+
+def fingerprint_inputs(*arrays: np.ndarray) -> str:
+    """SHA-1 of the encoded alignments (and weights) a checkpoint was computed from."""
+    digest = hashlib.sha1()
+    for array in arrays:
+        if array is not None:
+            digest.update(str((array.shape, array.dtype.str)).encode())
+            digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+def open_checkpoint(checkpoint_dir: str, manifest: dict, fill: float, resume: bool) -> Tuple[np.ndarray, set]:
+    """Create the checkpoint of a run, or reopen it with --resume.
+
+    The checkpoint holds ``scores.npy``, the float64 score matrix as a
+    memory-mapped file, ``tiles.log`` with the start of every finished
+    block and ``manifest.json`` describing the run (grid, kept columns, block
+    size, input fingerprint).
+
+    Returns
+    -------
+    tuple[numpy.ndarray, set]
+        The writable score matrix and the set of finished blocks.
+
+    Raises
+    ------
+    ValueError
+        If a checkpoint exists without --resume, or --resume finds a
+        checkpoint of a different run.
+    """
+    manifest_path = f"{checkpoint_dir}/manifest.json"
+    if os.path.isfile(manifest_path):
+        if not resume:
+            raise ValueError(f"A checkpoint already exists in {checkpoint_dir}; pass --resume to continue it or remove it.")
+        with open(manifest_path) as f:
+            if json.load(f) != manifest:
+                raise ValueError(f"The checkpoint in {checkpoint_dir} was written for other inputs or settings.")
+        done = set()
+        with open(f"{checkpoint_dir}/tiles.log") as f:
+            for line in f:
+                #a line cut short by the interruption is ignored and its block redone
+                parts = line.split()
+                if line.endswith("\n") and len(parts) == 2:
+                    done.add((int(parts[0]), int(parts[1])))
+        return np.load(f"{checkpoint_dir}/scores.npy", mmap_mode="r+"), done
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    matrix = np.lib.format.open_memmap(f"{checkpoint_dir}/scores.npy", mode="w+", dtype=np.float64, shape=tuple(manifest["shape"]))
+    if fill != 0:
+        matrix[:] = fill
+    matrix.flush()
+    open(f"{checkpoint_dir}/tiles.log", "w").close()
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+
+    return matrix, set()
+
+def calculate_mit_matrix_checkpointed(codes1: np.ndarray, codes2: np.ndarray, n_states: int, columns1: np.ndarray, columns2: np.ndarray,
+                                      shape: Tuple[int, int], fill: float, checkpoint_dir: str, fingerprint: str, resume: bool = False,
+                                      tile_size: int = 64, workers: int = 1, profiles1: Dict[str, np.ndarray] = None,
+                                      profiles2: Dict[str, np.ndarray] = None, weights: np.ndarray = None,
+                                      interval: float = CHECKPOINT_SECONDS) -> np.ndarray:
+    """Score the grid block by block straight into an on-disk matrix that survives interruptions.
+
+    Every finished block is written into the memory-mapped ``scores.npy`` of
+    the checkpoint at its place in the full grid. Every `interval` seconds
+    the matrix is flushed and the blocks it holds are appended to
+    ``tiles.log``. With `resume` the blocks listed there are skipped.
+
+    Parameters
+    ----------
+    codes1, codes2 : numpy.ndarray
+        Encoded (or bit-packed) alignments restricted to `columns1` /
+        `columns2`; `codes2` is None for a single MSA.
+    n_states : int
+        Number of valid characters.
+    columns1, columns2 : numpy.ndarray
+        Rows and columns of the full grid the codes belong to.
+    shape : tuple[int, int]
+        Shape of the full grid; pairs outside the kept columns hold `fill`.
+    checkpoint_dir : str
+        Directory of the checkpoint (see `open_checkpoint`).
+    fingerprint : str
+        `fingerprint_inputs` of the run, checked when resuming.
+    resume : bool
+        Continue an existing checkpoint.
+    interval : float
+        Seconds between flushes (`--checkpoint-interval`).
+
+    Returns
+    -------
+    numpy.ndarray
+        The memory-mapped score matrix of shape `shape`.
+    """
+    symmetric = codes2 is None
+    manifest = {
+        "shape": list(shape),
+        "symmetric": symmetric,
+        "tile_size": tile_size,
+        "fill": None if np.isnan(fill) else fill,
+        "columns1": [int(column) for column in columns1],
+        "columns2": [int(column) for column in columns2],
+        "fingerprint": fingerprint,
+    }
+    matrix, done = open_checkpoint(checkpoint_dir, manifest, fill, resume)
+    tiles = [tile for tile in plan_tiles(len(columns1), len(columns2), tile_size, symmetric) if tile not in done]
+    if done:
+        print(f"Resuming from {checkpoint_dir}: {len(done)} block(s) already scored, {len(tiles)} left.")
+
+    pending = []
+    last_flush = time.perf_counter()
+    with open(f"{checkpoint_dir}/tiles.log", "a") as log_file:
+        for start1, start2, block in iter_mit_tiles(codes1, codes2, n_states, tile_size, profiles1, profiles2, tiles=tiles, workers=workers, weights=weights):
+            rows = columns1[start1:start1 + block.shape[0]]
+            columns = columns2[start2:start2 + block.shape[1]]
+            matrix[np.ix_(rows, columns)] = block
+            if symmetric:
+                matrix[np.ix_(columns, rows)] = block.T
+            pending.append((start1, start2))
+            if time.perf_counter() - last_flush >= interval:
+                #the blocks are logged only once their scores are on disk
+                matrix.flush()
+                log_file.writelines(f"{start1} {start2}\n" for start1, start2 in pending)
+                log_file.flush()
+                pending, last_flush = [], time.perf_counter()
+        matrix.flush()
+        log_file.writelines(f"{start1} {start2}\n" for start1, start2 in pending)
+
+    return matrix
+
+####pair-count store - the contingency tables are additive, so new genomes are counted once and added to the stored tables
+def profiles_from_counts(counts: np.ndarray, n_genomes: int, n_states: int) -> Dict[str, np.ndarray]:
+    """Column profiles (see `compute_column_profiles`) from stored character counts."""
+    counts = np.asarray(counts, dtype=np.float64)
+    n_valid = counts.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        probabilities = counts / n_valid[:, None]
+        terms = probabilities * np.log(probabilities)
+    terms[~(probabilities > 0)] = 0.0
+
+    return {
+        "counts": counts,
+        "n_valid": n_valid,
+        "coverage": n_valid / n_genomes if n_genomes else np.zeros(len(counts)),
+        "complete": n_valid == n_genomes,
+        "entropy": -terms.sum(axis=1) / log(n_states),
+    }
+
+def count_store_tiles(manifest: dict) -> Dict[Tuple[int, int], int]:
+    """Map the start positions of every block of a pair-count store to its index in ``pair_counts.npy``."""
+    return {tile: index for index, tile in enumerate(plan_tiles(*manifest["shape"], manifest["tile_size"], manifest["symmetric"]))}
+
+def open_count_store(store: str, alphabet: dict, shape: Tuple[int, int], symmetric: bool, tile_size: int = 64) -> Tuple[dict, np.ndarray, List[np.ndarray]]:
+    """Open the pair-count store in `store`, creating an empty one if needed.
+
+    The store holds ``pair_counts.npy``, a uint32 memory-mapped tensor of
+    shape (blocks, tile_size, states, tile_size, states) with the counts of
+    every block of `plan_tiles` (for a single MSA only the blocks on or
+    above the diagonal, about half the grid), the character counts of
+    every column (``column_counts_msa1.npy`` and, for two MSAs,
+    ``column_counts_msa2.npy``) and ``manifest.json`` listing the genomes
+    already counted. The block size is fixed when the store is created
+    and kept by later updates, whatever their `tile_size`.
+
+    Returns
+    -------
+    tuple[dict, numpy.ndarray, list[numpy.ndarray]]
+        The manifest, the memory-mapped pair counts and the column counts.
+
+    Raises
+    ------
+    ValueError
+        If the store was built for another alphabet or alignment shape, or
+        a new store does not fit on the disk.
+    """
+    n_states = len(alphabet["states"])
+    #lowercase and ambiguity handling change the counts without changing the states
+    encoding = hashlib.sha1(alphabet["table"].tobytes()).hexdigest()
+    manifest_path = f"{store}/manifest.json"
+    if not os.path.isfile(manifest_path):
+        os.makedirs(store, exist_ok=True)
+        manifest = {"valid_chars": list(alphabet["states"]), "encoding": encoding, "shape": list(shape), "symmetric": symmetric,
+                    "tile_size": tile_size, "genomes": []}
+        tiles_shape = (len(count_store_tiles(manifest)), tile_size, n_states, tile_size, n_states)
+        size = int(np.prod(tiles_shape)) * np.dtype(np.uint32).itemsize
+        print(f"Creating the count store {store}: {tiles_shape[0]} blocks of pair counts, {size / 1e9:.2f} GB on disk.")
+        if size > shutil.disk_usage(store).free:
+            raise ValueError(f"The count store needs {size / 1e9:.2f} GB but {store} has only {shutil.disk_usage(store).free / 1e9:.2f} GB free.")
+        np.lib.format.open_memmap(f"{store}/pair_counts.npy", mode="w+", dtype=np.uint32, shape=tiles_shape).flush()
+        for number in (1,) if symmetric else (1, 2):
+            np.save(f"{store}/column_counts_msa{number}.npy", np.zeros((shape[number - 1], n_states), dtype=np.uint32))
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+    else:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["valid_chars"] != list(alphabet["states"]) or manifest.get("encoding", encoding) != encoding:
+            raise ValueError(f"The count store {store} was built for another sequence type or alphabet.")
+        if tuple(manifest["shape"]) != tuple(shape) or manifest["symmetric"] != symmetric:
+            raise ValueError(f"The count store {store} holds a {'single' if manifest['symmetric'] else 'paired'} {manifest['shape'][0]} x {manifest['shape'][1]} grid, not this alignment.")
+        if "tile_size" not in manifest:
+            raise ValueError(f"The count store {store} holds the whole pair grid in an older layout, rebuild it from the full alignment.")
+
+    pair_counts = np.load(f"{store}/pair_counts.npy", mmap_mode="r+")
+    column_counts = [np.load(f"{store}/column_counts_msa{number}.npy") for number in ((1,) if symmetric else (1, 2))]
+
+    return manifest, pair_counts, column_counts
+
+def update_count_store(store: str, codes1: np.ndarray, codes2: np.ndarray, genome_ids: List[str], alphabet: dict, tile_size: int = 64) -> int:
+    """Add the genomes missing from the store's manifest to its counts.
+
+    Genomes already listed in the manifest are skipped, so passing the full
+    alignment again only counts what is new. The work is proportional to
+    the number of new genomes. The manifest is rewritten last, so an
+    interrupted update leaves the old genome list in place.
+
+    Parameters
+    ----------
+    store : str
+        Directory of the store (see `open_count_store`).
+    codes1, codes2 : numpy.ndarray
+        Encoded alignments; `codes2` is None for a single MSA.
+    genome_ids : list[str]
+        Genome ID of every column of the encoded alignments.
+    alphabet : dict
+        Alphabet the alignments were encoded with (see `build_alphabet`).
+    tile_size : int
+        Number of positions per block of a new store.
+
+    Returns
+    -------
+    int
+        Number of genomes added.
+    """
+    symmetric = codes2 is None
+    shape = (codes1.shape[0], codes1.shape[0] if symmetric else codes2.shape[0])
+    manifest, pair_counts, column_counts = open_count_store(store, alphabet, shape, symmetric, tile_size)
+    if len(set(genome_ids)) != len(genome_ids):
+        raise ValueError("Genome IDs must be unique to update a count store, check --genome-regex.")
+    known = set(manifest["genomes"])
+    new = np.array([genome not in known for genome in genome_ids], dtype=bool)
+    if not new.any():
+        return 0
+
+    n_states = len(alphabet["states"])
+    new_codes1 = np.ascontiguousarray(codes1[:, new])
+    new_codes2 = None if symmetric else np.ascontiguousarray(codes2[:, new])
+    tile_size = manifest["tile_size"]
+    for (start1, start2), index in count_store_tiles(manifest).items():
+        block1 = new_codes1[start1:start1 + tile_size]
+        block2 = (new_codes1 if symmetric else new_codes2)[start2:start2 + tile_size]
+        counts = count_pair_tile(block1, block1 if symmetric and start1 == start2 else block2, n_states)
+        #blocks at the edge of the grid only fill the top left of their slot
+        pair_counts[index, :len(block1), :, :len(block2)] += np.rint(counts).astype(np.uint32)
+    pair_counts.flush()
+    for number, codes in enumerate((new_codes1,) if symmetric else (new_codes1, new_codes2), start=1):
+        column_counts[number - 1] += np.rint(compute_column_profiles(codes, n_states)["counts"]).astype(np.uint32)
+        np.save(f"{store}/column_counts_msa{number}.npy", column_counts[number - 1])
+
+    manifest["genomes"] += [genome for genome, is_new in zip(genome_ids, new) if is_new]
+    with open(f"{store}/manifest.json.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{store}/manifest.json.tmp", f"{store}/manifest.json")
+
+    return int(new.sum())
+
+def mit_matrix_from_store(store: str, min_entropy: float = 0.0, min_coverage: float = 0.0, fill: float = 0.0) -> np.ndarray:
+    """Score every position pair from the counts held in a pair-count store, one stored block at a time.
+
+    The informative-column prefilter (see `select_informative_columns`) is
+    applied to the stored column counts: blocks without a kept column are
+    not scored and pairs with a skipped column hold `fill`, like in a run
+    without the store.
+    """
+    with open(f"{store}/manifest.json") as f:
+        manifest = json.load(f)
+    symmetric, n_states, n_genomes = manifest["symmetric"], len(manifest["valid_chars"]), len(manifest["genomes"])
+    pair_counts = np.load(f"{store}/pair_counts.npy", mmap_mode="r")
+    profiles = [profiles_from_counts(np.load(f"{store}/column_counts_msa{number}.npy"), n_genomes, n_states) for number in ((1,) if symmetric else (1, 2))]
+    profiles1, profiles2 = profiles[0], profiles[-1]
+    kept1 = np.zeros(manifest["shape"][0], dtype=bool)
+    kept1[select_informative_columns(profiles1, min_entropy, min_coverage)] = True
+    kept2 = kept1 if symmetric else np.zeros(manifest["shape"][1], dtype=bool)
+    if not symmetric:
+        kept2[select_informative_columns(profiles2, min_entropy, min_coverage)] = True
+    report_prefilter(np.flatnonzero(kept1), len(kept1), np.flatnonzero(kept2), len(kept2), symmetric)
+
+    tile_size = manifest["tile_size"]
+    matrix = np.full(manifest["shape"], fill, dtype=np.float64)
+    for (start1, start2), index in count_store_tiles(manifest).items():
+        stop1, stop2 = min(start1 + tile_size, manifest["shape"][0]), min(start2 + tile_size, manifest["shape"][1])
+        if not kept1[start1:stop1].any() or not kept2[start2:stop2].any():
+            continue
+        block = mit_from_pair_counts(
+            np.asarray(pair_counts[index, :stop1 - start1, :, :stop2 - start2], dtype=np.float64), n_states,
+            slice_profiles(profiles1, start1, stop1), slice_profiles(profiles2, start2, stop2)
+        )
+        if symmetric and start1 == start2:
+            upper = np.triu(block, 1)
+            block = upper + upper.T + np.diag(profiles1["entropy"][start1:stop1])
+        place_tile(matrix, start1, start2, block, symmetric)
+    matrix[~kept1] = fill
+    matrix[:, ~kept2] = fill
+
+    return matrix
+
+####permutation null model - shuffle the genome order of MSA2 and rescore with the same marginals
+def score_permutation_tile(codes1: np.ndarray, codes2: np.ndarray, n_states: int, tile: Tuple[int, int], tile_size: int,
+                           profiles1: Dict[str, np.ndarray], profiles2: Dict[str, np.ndarray], permutations: np.ndarray,
+                           observed: np.ndarray, excluded: np.ndarray, weights: np.ndarray = None) -> Tuple[int, int, np.ndarray, np.ndarray]:
+    """Score one block of the pair grid under a batch of genome permutations of MSA2.
+
+    Permuting genomes leaves every column's marginal counts unchanged, so the
+    precomputed profiles are reused as is. The permuted copies of the MSA2
+    block are stacked side by side and counted with a single matrix product.
+
+    Parameters
+    ----------
+    codes1, codes2 : numpy.ndarray
+        Encoded alignments of shape (positions, genomes).
+    n_states : int
+        Number of valid characters (also the log base).
+    tile : tuple[int, int]
+        0-based start row and column of the block.
+    tile_size : int
+        Number of positions per block along each axis.
+    profiles1, profiles2 : Dict[str, numpy.ndarray]
+        `compute_column_profiles` output of both alignments.
+    permutations : numpy.ndarray
+        Genome orders of shape (batch, genomes) applied to MSA2.
+    observed : numpy.ndarray
+        Observed MIT scores of the block.
+    excluded : numpy.ndarray
+        Boolean block of pairs left out of the protein-level statistic.
+    weights : numpy.ndarray, optional
+        Per-genome weights, attached to the MSA1 rows. Weighted MSA2
+        marginals change under permutation, so the profile shortcut is not
+        used for MSA2 then.
+
+    Returns
+    -------
+    tuple[int, int, numpy.ndarray, numpy.ndarray]
+        Start row, start column, per-pair number of permutations scoring at
+        least the observed score, and the per-permutation sum of scores
+        over the pairs that are not excluded.
+    """
+    start1, start2 = tile
+    block1 = codes1[start1:start1 + tile_size]
+    block2 = codes2[start2:start2 + tile_size]
+    n_block2 = block2.shape[0]
+    stacked = np.concatenate([block2[:, order] for order in permutations], axis=0)
+    block_profiles2 = {
+        key: np.tile(value, (len(permutations),) + (1,) * (value.ndim - 1))
+        for key, value in slice_profiles(profiles2, start2, start2 + tile_size).items()
+    }
+    null = mit_from_pair_counts(
+        count_pair_tile(block1, stacked, n_states, weights), n_states,
+        slice_profiles(profiles1, start1, start1 + tile_size), None if weights is not None else block_profiles2
+    ).reshape(block1.shape[0], len(permutations), n_block2)
+
+    #ties (e.g. invariant columns scoring 0 either way) count as at least as extreme
+    exceed = (null >= observed[:, None, :] - 1e-12).sum(axis=1)
+    null_sums = np.where(excluded[:, None, :], 0.0, null).sum(axis=(0, 2))
+
+    return start1, start2, exceed, null_sums
+
+def _score_permutation_tile_in_worker(task: tuple) -> Tuple[int, int, int, np.ndarray, np.ndarray]:
+    tile, batch_start, batch_stop, observed, excluded = task
+    start1, start2, exceed, null_sums = score_permutation_tile(
+        _TILE_WORKER["codes1"], _TILE_WORKER["codes2"], _TILE_WORKER["n_states"], tile, _TILE_WORKER["tile_size"],
+        _TILE_WORKER["profiles1"], _TILE_WORKER["profiles2"], _TILE_WORKER["permutations"][batch_start:batch_stop],
+        observed, excluded, _TILE_WORKER["weights"]
+    )
+    return start1, start2, batch_start, exceed, null_sums
+
+def run_permutation_test(codes1: np.ndarray, codes2: np.ndarray, observed: np.ndarray, n_states: int, excluded: np.ndarray,
+                         n_permutations: int, seed: int = None, batch_size: int = 4, tile_size: int = 64, workers: int = 1,
+                         alpha: float = 0.05, weights: np.ndarray = None) -> Tuple[np.ndarray, dict]:
+    """Permutation test for inter-protein coevolution.
+
+    The genome order of MSA2 is shuffled `n_permutations` times and every
+    position pair is rescored. Per-pair empirical p-values are
+    ``(1 + #{null >= observed}) / (n_permutations + 1)``. At the protein
+    level, the mean score over all pairs is compared with its permutation
+    distribution (excess coupling), and the number of pairs with
+    ``p <= alpha`` is compared with the ``alpha * pairs`` expected by chance.
+
+    Parameters
+    ----------
+    codes1, codes2 : numpy.ndarray
+        Encoded alignments; pass `codes1` again as `codes2` for a single MSA.
+    observed : numpy.ndarray
+        Observed MIT score matrix.
+    n_states : int
+        Number of valid characters (also the log base).
+    excluded : numpy.ndarray
+        Boolean matrix of pairs left out of the protein-level statistics.
+    n_permutations : int
+        Number of genome permutations.
+    seed : int, optional
+        Seed for the permutations; the same seed gives the same results
+        regardless of `batch_size` and `workers`.
+    batch_size : int
+        Number of permutations counted together per block.
+    tile_size : int
+        Number of positions per block along each axis.
+    workers : int
+        Number of worker processes.
+    alpha : float
+        Per-pair significance level for the excess of significant pairs.
+    weights : numpy.ndarray, optional
+        Per-genome weights (see `compute_sequence_weights`).
+
+    Returns
+    -------
+    tuple[numpy.ndarray, dict]
+        Matrix of per-pair p-values and the protein-level summary.
+    """
+    n_genomes = codes1.shape[1]
+    rng = np.random.default_rng(seed)
+    permutations = np.stack([rng.permutation(n_genomes) for _ in range(n_permutations)]).astype(np.int64)
+    profiles1 = compute_column_profiles(codes1, n_states, weights)
+    profiles2 = profiles1 if codes2 is codes1 else compute_column_profiles(codes2, n_states, weights)
+
+    batches = [(start, min(start + batch_size, n_permutations)) for start in range(0, n_permutations, batch_size)]
+    tasks = []
+    for start1, start2 in plan_tiles(codes1.shape[0], codes2.shape[0], tile_size):
+        observed_block = np.asarray(observed[start1:start1 + tile_size, start2:start2 + tile_size], dtype=np.float64)
+        excluded_block = excluded[start1:start1 + tile_size, start2:start2 + tile_size]
+        tasks.extend(((start1, start2), batch_start, batch_stop, observed_block, excluded_block) for batch_start, batch_stop in batches)
+
+    exceed = np.zeros(observed.shape, dtype=np.int64)
+    null_sums = np.zeros(n_permutations, dtype=np.float64)
+    if workers <= 1 or len(tasks) <= 1:
+        results = (
+            (start1, start2, batch_start) + score_permutation_tile(
+                codes1, codes2, n_states, (start1, start2), tile_size, profiles1, profiles2,
+                permutations[batch_start:batch_stop], observed_block, excluded_block, weights
+            )[2:]
+            for (start1, start2), batch_start, batch_stop, observed_block, excluded_block in tasks
+        )
+    else:
+        state = {"n_states": n_states, "tile_size": tile_size, "profiles1": profiles1, "profiles2": profiles2, "permutations": permutations, "weights": weights}
+        results = iter_pool_tasks(codes1, codes2, state, _score_permutation_tile_in_worker, tasks, workers)
+    progress = new_progress(observed.size * n_permutations, "Scored permuted position pairs")
+    for start1, start2, batch_start, block_exceed, block_sums in results:
+        exceed[start1:start1 + block_exceed.shape[0], start2:start2 + block_exceed.shape[1]] += block_exceed
+        null_sums[batch_start:batch_start + len(block_sums)] += block_sums
+        update_progress(progress, block_exceed.size * len(block_sums))
+
+    pvalues = (1.0 + exceed) / (n_permutations + 1.0)
+    kept = ~excluded
+    n_pairs = int(kept.sum())
+    observed_mean = float(np.asarray(observed, dtype=np.float64)[kept].mean()) if n_pairs else 0.0
+    null_means = null_sums / max(n_pairs, 1)
+    null_sd = float(null_means.std(ddof=1)) if n_permutations > 1 else float("nan")
+    significant = int((pvalues[kept] <= alpha).sum())
+    summary = {
+        "permutations": n_permutations,
+        "seed": seed,
+        "pairs": n_pairs,
+        "observed_mean_mit": observed_mean,
+        "null_mean_mit": float(null_means.mean()),
+        "null_sd_mit": null_sd,
+        "excess_coupling": observed_mean - float(null_means.mean()),
+        "excess_coupling_z": (observed_mean - float(null_means.mean())) / null_sd if null_sd > 0 else float("nan"),
+        "excess_coupling_p": float((1 + (null_means >= observed_mean - 1e-12).sum()) / (n_permutations + 1)),
+        "alpha": alpha,
+        "significant_pairs": significant,
+        "expected_significant_pairs": alpha * n_pairs,
+        "excess_significant_pairs": significant - alpha * n_pairs,
+    }
+
+    return pvalues, summary
+
+####corrections - computed from row and column sums of the score matrix instead of per-pair scans
+def self_pair_mask(positions1: np.ndarray, positions2: np.ndarray) -> np.ndarray:
+    """Flag the pairs of a position with itself (same position label in both MSAs).
+
+    These are the pairs `utils/MIT_analysis.R` drops before correcting.
+    """
+    return np.equal.outer(np.asarray(positions1), np.asarray(positions2))
+
+def compares_msa_with_itself(args: argparse.Namespace, codes2: np.ndarray) -> bool:
+    """True when an MSA is scored against itself: a single MSA, whole or on two regions (see `--region1`)."""
+    return codes2 is None or (args.msa2 is None and not args.batch)
+
+def ranked_pair_mask(positions1: np.ndarray, positions2: np.ndarray, same_msa: bool) -> np.ndarray:
+    """Flag the pairs left out of rankings, summaries and the null model.
+
+    Only an MSA compared with itself has pairs of a position with itself;
+    between two proteins ``(i, i)`` is an ordinary pair. The corrections
+    still drop equal labels like `utils/MIT_analysis.R` (see `self_pair_mask`).
+    """
+    if same_msa:
+        return self_pair_mask(positions1, positions2)
+    return np.zeros((len(positions1), len(positions2)), dtype=bool)
+
+def mirrored_pair_mask(positions1: np.ndarray, positions2: np.ndarray, grid1: np.ndarray, grid2: np.ndarray) -> np.ndarray:
+    """Flag the pairs of a single MSA scored on two regions that are already ranked as their mirror image.
+
+    Pair ``(i, j)`` with ``i > j`` is the same unordered pair as ``(j, i)``
+    when ``j`` is a row (in `grid1`) and ``i`` a column (in `grid2`) of the
+    grid, so only the mirror is ranked. Broadcasts like a numpy comparison.
+    """
+    return (positions1 > positions2) & np.isin(positions2, grid1) & np.isin(positions1, grid2)
+
+def rcw_correction(matrix: np.ndarray, excluded: np.ndarray) -> np.ndarray:
+    """Row column weighting of the MIT scores.
+
+    Each score is divided by the mean of the other scores in its row and
+    column, as `rcw_conservation` in `utils/MIT_analysis.R` does, but with
+    the sums taken once per row and column instead of once per pair.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        MIT score matrix.
+    excluded : numpy.ndarray
+        Boolean matrix of pairs left out of the sums (see `self_pair_mask`).
+
+    Returns
+    -------
+    numpy.ndarray
+        RCW scores; excluded pairs and pairs with an undefined weight are NaN.
+    """
+    values = np.where(excluded, 0.0, np.asarray(matrix, dtype=np.float64))
+    kept = ~excluded
+    row_sums, column_sums = values.sum(axis=1), values.sum(axis=0)
+    row_counts, column_counts = kept.sum(axis=1), kept.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        background = (row_sums[:, None] + column_sums[None, :] - 2 * values) / (row_counts[:, None] + column_counts[None, :] - 2)
+        rcw = values / background
+    rcw[excluded] = np.nan
+
+    return rcw
+
+def apc_correction(matrix: np.ndarray, excluded: np.ndarray) -> np.ndarray:
+    """Average product correction: subtract ``mean(row) * mean(column) / mean(all)`` from each score.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        MIT score matrix.
+    excluded : numpy.ndarray
+        Boolean matrix of pairs left out of the means (see `self_pair_mask`).
+
+    Returns
+    -------
+    numpy.ndarray
+        APC corrected scores; excluded pairs are NaN.
+    """
+    values = np.where(excluded, 0.0, np.asarray(matrix, dtype=np.float64))
+    kept = ~excluded
+    with np.errstate(divide="ignore", invalid="ignore"):
+        row_means = values.sum(axis=1) / kept.sum(axis=1)
+        column_means = values.sum(axis=0) / kept.sum(axis=0)
+        overall_mean = values.sum() / kept.sum()
+        apc = values - row_means[:, None] * column_means[None, :] / overall_mean
+    apc[excluded] = np.nan
+
+    return apc
+
+def z_score(values: np.ndarray) -> np.ndarray:
+    """Z-score ignoring NaN entries (sample standard deviation, like R's `sd`)."""
+    values = np.asarray(values, dtype=np.float64)
+    finite = values[np.isfinite(values)]
+    if finite.size < 2:
+        return np.full(values.shape, np.nan)
+    return (values - finite.mean()) / finite.std(ddof=1)
+
+def compute_corrections(matrix: np.ndarray, positions1: np.ndarray, positions2: np.ndarray, corrections: list) -> Dict[str, np.ndarray]:
+    """Compute the requested corrected score matrices.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        MIT score matrix.
+    positions1, positions2 : numpy.ndarray
+        Position labels of the rows and columns.
+    corrections : list[str]
+        Names from `CORRECTIONS`. ``zscore`` is the z-score of the RCW
+        scores, matching `utils/MIT_analysis.R`.
+
+    Returns
+    -------
+    Dict[str, numpy.ndarray]
+        Corrected matrices keyed by correction name.
+    """
+    if not corrections:
+        return {}
+    #skipped pairs written as NA are left out like the pairs of a position with itself
+    excluded = self_pair_mask(positions1, positions2) | ~np.isfinite(matrix)
+    corrected = {}
+    if "rcw" in corrections or "zscore" in corrections:
+        rcw = rcw_correction(matrix, excluded)
+        if "rcw" in corrections:
+            corrected["rcw"] = rcw
+        if "zscore" in corrections:
+            corrected["zscore"] = z_score(rcw)
+    if "apc" in corrections:
+        corrected["apc"] = apc_correction(matrix, excluded)
+
+    return corrected
+
+####top pairs - keep the strongest pairs while the blocks stream by, the correction sums are accumulated on the way
+def new_pair_stream(positions1: np.ndarray, positions2: np.ndarray, top_k: int = None, min_score: float = None,
+                    mirrored: bool = False, same_msa: bool = False) -> dict:
+    """Create the accumulator filled by `add_block_to_stream`.
+
+    It holds the row and column sums, counts and moments the corrections
+    need, plus a heap of at most `top_k` pairs (or every pair reaching
+    `min_score` when no `top_k` is given), so memory does not depend on the
+    size of the pair grid. `mirrored` marks two regions of a single MSA,
+    where each unordered pair is ranked once (see `mirrored_pair_mask`).
+    `same_msa` marks an MSA compared with itself, the only case where
+    pairs of a position with itself are not ranked (see `ranked_pair_mask`).
+    """
+    return {
+        "positions1": np.asarray(positions1),
+        "positions2": np.asarray(positions2),
+        "top_k": top_k,
+        "min_score": min_score,
+        "mirrored": mirrored,
+        "same_msa": same_msa or mirrored,
+        "heap": [],
+        "row_sums": np.zeros(len(positions1)),
+        "column_sums": np.zeros(len(positions2)),
+        "row_counts": np.zeros(len(positions1), dtype=np.int64),
+        "column_counts": np.zeros(len(positions2), dtype=np.int64),
+        "sum": 0.0,
+        "count": 0,
+        #pairs that can be ranked and their score sum, for the summary
+        "pairs": 0,
+        "pairs_sum": 0.0,
+    }
+
+def add_block_to_stream(stream: dict, block: np.ndarray, rows: np.ndarray, columns: np.ndarray, symmetric: bool = False, diagonal: bool = False):
+    """Fold one scored block into a pair stream.
+
+    Parameters
+    ----------
+    stream : dict
+        Accumulator from `new_pair_stream`.
+    block : numpy.ndarray
+        Block of MIT scores.
+    rows, columns : numpy.ndarray
+        0-based matrix rows and columns of the block.
+    symmetric : bool
+        True for a single MSA scored against itself: the block also stands
+        for its mirror image and only pairs above the diagonal are ranked.
+    diagonal : bool
+        True for a block on the diagonal of a symmetric run, which already
+        holds both halves.
+    """
+    #the correction sums leave out equal labels like utils/MIT_analysis.R
+    kept = ~self_pair_mask(stream["positions1"][rows], stream["positions2"][columns])
+    values = np.where(kept, block, 0.0)
+    row_sums, column_sums = values.sum(axis=1), values.sum(axis=0)
+    row_counts, column_counts = kept.sum(axis=1), kept.sum(axis=0)
+    copies = 2 if symmetric and not diagonal else 1
+    stream["row_sums"][rows] += row_sums
+    stream["column_sums"][columns] += column_sums
+    stream["row_counts"][rows] += row_counts
+    stream["column_counts"][columns] += column_counts
+    if copies == 2:
+        stream["row_sums"][columns] += column_sums
+        stream["column_sums"][rows] += row_sums
+        stream["row_counts"][columns] += column_counts
+        stream["column_counts"][rows] += row_counts
+    stream["sum"] += copies * values.sum()
+    stream["count"] += copies * int(kept.sum())
+    kept = ~ranked_pair_mask(stream["positions1"][rows], stream["positions2"][columns], symmetric or stream["same_msa"])
+    stream["pairs"] += copies * int(kept.sum())
+    stream["pairs_sum"] += copies * float(block[kept].sum())
+
+    #rank each unordered pair once
+    if symmetric and diagonal:
+        kept &= np.triu(np.ones(block.shape, dtype=bool), 1)
+    if stream["mirrored"]:
+        kept &= ~mirrored_pair_mask(stream["positions1"][rows][:, None], stream["positions2"][columns][None, :], stream["positions1"], stream["positions2"])
+    if stream["min_score"] is not None:
+        kept &= block >= stream["min_score"]
+    local1, local2 = np.nonzero(kept)
+    scores = block[local1, local2]
+    heap, top_k = stream["heap"], stream["top_k"]
+    if top_k is not None:
+        #only the best `top_k` pairs of a block can enter the heap
+        order = np.lexsort((columns[local2], rows[local1], -scores))[:top_k]
+        local1, local2, scores = local1[order], local2[order], scores[order]
+    for score, row, column in zip(scores.tolist(), rows[local1].tolist(), columns[local2].tolist()):
+        #ties are broken towards the lower positions so the result does not depend on the block order
+        item = (score, -row, -column)
+        if top_k is None or len(heap) < top_k:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+def add_skipped_pairs_to_stream(stream: dict):
+    """Count the pairs left out by the prefilter as scores of 0.
+
+    Used when skipped pairs are written as 0: they add nothing to the sums
+    but take part in the correction means like any other pair. They are
+    never ranked.
+    """
+    stream["row_counts"] = len(stream["positions2"]) - np.isin(stream["positions1"], stream["positions2"]).astype(np.int64)
+    stream["column_counts"] = len(stream["positions1"]) - np.isin(stream["positions2"], stream["positions1"]).astype(np.int64)
+    stream["count"] = int(stream["row_counts"].sum())
+    self_pairs = int(np.isin(stream["positions1"], stream["positions2"]).sum()) if stream["same_msa"] else 0
+    stream["pairs"] = len(stream["positions1"]) * len(stream["positions2"]) - self_pairs
+
+def finish_pair_stream(stream: dict, corrections: list = None) -> pd.DataFrame:
+    """Turn a pair stream into the table of kept pairs, best first.
+
+    ``rcw`` and ``apc`` are computed from the accumulated row and column sums
+    and are equal to the values of `compute_corrections` on the full matrix.
+    ``zscore`` needs every RCW score and is rejected with a pair stream.
+    """
+    items = sorted(stream["heap"], reverse=True)
+    rows = np.array([-item[1] for item in items], dtype=np.int64)
+    columns = np.array([-item[2] for item in items], dtype=np.int64)
+    values = np.array([item[0] for item in items], dtype=np.float64)
+    table = pd.DataFrame({
+        "Position_MSA1": stream["positions1"][rows],
+        "Position_MSA2": stream["positions2"][columns],
+        "MIT_Score": values,
+    })
+    corrections = corrections or []
+    #pairs of equal labels are outside the correction sums, their corrected scores are NA like in `compute_corrections`
+    uncorrected = stream["positions1"][rows] == stream["positions2"][columns]
+    row_sums, column_sums = stream["row_sums"][rows], stream["column_sums"][columns]
+    row_counts, column_counts = stream["row_counts"][rows], stream["column_counts"][columns]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if "rcw" in corrections:
+            table[CORRECTIONS["rcw"][1]] = values / ((row_sums + column_sums - 2 * values) / (row_counts + column_counts - 2))
+        if "apc" in corrections:
+            table[CORRECTIONS["apc"][1]] = values - (row_sums / row_counts) * (column_sums / column_counts) / (stream["sum"] / stream["count"])
+    table.loc[uncorrected, [column for column in table.columns[3:]]] = np.nan
+
+    return table
+
+####two-phase screening - a genome subsample bounds every pair, only the pairs it cannot rule out are scored exactly
+def screen_sample_size(screen: float, n_genomes: int) -> int:
+    """Number of genomes of the sketch: a fraction of the alignment below 1, a count otherwise."""
+    n_sample = int(round(screen * n_genomes)) if screen < 1 else int(screen)
+    return min(max(n_sample, 2), n_genomes)
+
+def mcdiarmid_bound(n_genomes: int, base: int, delta: float) -> float:
+    """Distribution-free deviation of a plug-in MIT score of `n_genomes` genomes from its expectation.
+
+    Replacing one genome changes each plug-in entropy by at most
+    ``2 log(n) / n`` nats (Antos and Kontoyiannis 2001), so the score moves by
+    at most ``c = 6 log(n) / n`` and McDiarmid's inequality bounds the
+    deviation by ``c * sqrt(n log(2 / delta) / 2)`` with probability
+    ``1 - delta``. It holds for any alignment, but is much wider than the
+    standard errors of `sketch_mit_from_pair_counts`.
+    """
+    if n_genomes < 2:
+        return float("inf")
+    bounded_difference = 6 * log(n_genomes) / n_genomes
+    return bounded_difference * np.sqrt(n_genomes * log(2 / delta) / 2) / log(base)
+
+def score_pair_list(codes1: np.ndarray, codes2: np.ndarray, index1: np.ndarray, index2: np.ndarray, n_states: int,
+                    weights: np.ndarray = None, chunk_pairs: int = 4096) -> np.ndarray:
+    """Exact MIT scores of a list of column pairs, see `count_pair_list`."""
+    scores = np.zeros(len(index1), dtype=np.float64)
+    for start in range(0, len(index1), chunk_pairs):
+        stop = start + chunk_pairs
+        pair_counts = count_pair_list(codes1, codes2, index1[start:stop], index2[start:stop], n_states, weights)
+        scores[start:stop] = mit_from_pair_counts(pair_counts[:, :, None, :], n_states)[:, 0]
+
+    return scores
+
+def sample_pairs(rng: np.random.Generator, n_pairs: int, n_rows: int, n_columns: int, symmetric: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """Draw `n_pairs` random pairs of the grid (with replacement), above the diagonal for a single MSA."""
+    rows = rng.integers(0, n_rows, n_pairs)
+    columns = rng.integers(0, n_columns, n_pairs)
+    if symmetric:
+        rows, columns = np.minimum(rows, columns), np.maximum(rows, columns)
+        distinct = rows != columns
+        rows, columns = rows[distinct], columns[distinct]
+
+    return rows, columns
+
+def screen_top_pairs(codes1: np.ndarray, codes2: np.ndarray, n_states: int, columns1: np.ndarray, columns2: np.ndarray,
+                     positions1: np.ndarray, positions2: np.ndarray, output: str, args: argparse.Namespace,
+                     weights: np.ndarray = None, skipped: float = 0.0, references: Tuple[np.ndarray, np.ndarray] = None) -> dict:
+    """Find the best pairs of a comparison in two phases and write them to ``mit_top_pairs.csv``.
+
+    Phase one scores every pair on a random subset of the genomes (`--screen`)
+    and turns each estimate into a lower and an upper bound, ``z`` standard
+    errors apart, where ``z`` is the normal quantile of the target recall.
+    A pair stays a candidate while its upper bound reaches `--min-score` and
+    the K-th best lower bound seen so far (`--top-k`). Phase two scores only
+    the candidates exactly, over all genomes. Finally a random sample of the
+    pairs that were ruled out is scored exactly (`--screen-audit`) to
+    estimate how many qualifying pairs the screen missed.
+
+    Parameters
+    ----------
+    codes1, codes2 : numpy.ndarray
+        Encoded alignments restricted to `columns1`/`columns2` (never
+        bit-packed, the bitpack engine packs the subsample itself); `codes2`
+        is None for a single MSA.
+    columns1, columns2 : numpy.ndarray
+        Columns kept by the prefilter.
+    positions1, positions2 : numpy.ndarray
+        Position labels of the full grid.
+    output : str
+        Directory the outputs are written to.
+    args : argparse.Namespace
+        Parsed command-line arguments (screen settings, top-K, min score, ...).
+    weights : numpy.ndarray, optional
+        Per-genome weights (see `compute_sequence_weights`).
+    skipped : float
+        Fraction of the pairs left out by the prefilter.
+    references : tuple[numpy.ndarray, numpy.ndarray], optional
+        `reference_numbering` of both MSAs, added to the table.
+
+    Returns
+    -------
+    dict
+        `summarize_pair`-like statistics plus the candidate fraction and the
+        estimated recall.
+    """
+    symmetric = codes2 is None
+    same_msa = compares_msa_with_itself(args, codes2)
+    #two regions of one MSA are scored as a rectangle
+    mirrored = not symmetric and same_msa
+    partner_codes = codes1 if symmetric else codes2
+    labels1, labels2 = positions1[columns1], positions2[columns2]
+    n_genomes = codes1.shape[1]
+    n_sample = screen_sample_size(args.screen, n_genomes)
+    rng = np.random.default_rng(args.seed)
+    sample = np.sort(rng.choice(n_genomes, n_sample, replace=False))
+    sample_weights = None if weights is None else weights[sample]
+    scale = n_genomes / n_sample if weights is None else float(weights.sum() / sample_weights.sum())
+    z = NormalDist().inv_cdf(args.screen_recall)
+    bound = mcdiarmid_bound(n_sample, n_states, 1 - args.screen_recall)
+    print(f"Screening with a sketch of {n_sample} of {n_genomes} genomes for a target recall of {args.screen_recall} "
+          f"(bounds at z = {z:.2f}; the distribution-free McDiarmid bound would be +/- {bound:.3g}).")
+
+    with stage("encode"):
+        sketch1 = np.ascontiguousarray(codes1[:, sample])
+        sketch2 = None if symmetric else np.ascontiguousarray(codes2[:, sample])
+        #profiles come from the unpacked codes, the bit planes have no per-genome codes
+        sketch_profiles1 = compute_column_profiles(sketch1, n_states, sample_weights)
+        sketch_profiles2 = None if symmetric else compute_column_profiles(sketch2, n_states, sample_weights)
+        if args.engine == "bitpack":
+            sketch1 = pack_nucleotides(sketch1)
+            sketch2 = None if symmetric else pack_nucleotides(sketch2)
+
+    #a pair is dropped once its upper bound falls below the floor, which only rises
+    floor = -np.inf if args.min_score is None else args.min_score
+    best_lower = np.empty(0)
+    candidate_rows, candidate_columns = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    candidate_upper, candidate_estimates = np.empty(0), np.empty(0)
+    n_pairs = 0
+    scored_pairs = len(columns1) * (len(columns1) + 1) // 2 if symmetric else len(columns1) * len(columns2)
+    with stage("sketch", scored_pairs):
+        for start1, start2, (estimate, error) in iter_mit_tiles(sketch1, sketch2, n_states, args.tile_size, sketch_profiles1,
+                                                                sketch_profiles2, workers=args.workers,
+                                                                weights=sample_weights, sketch_scale=scale):
+            rows = np.arange(start1, start1 + estimate.shape[0])
+            columns = np.arange(start2, start2 + estimate.shape[1])
+            kept = ~ranked_pair_mask(labels1[rows], labels2[columns], same_msa)
+            if symmetric and start1 == start2:
+                kept &= np.triu(np.ones(kept.shape, dtype=bool), 1)
+            if mirrored:
+                kept &= ~mirrored_pair_mask(labels1[rows][:, None], labels2[columns][None, :], labels1, labels2)
+            n_pairs += int(kept.sum())
+            upper = estimate + z * error
+            if args.top_k is not None:
+                best_lower = np.concatenate([best_lower, (estimate - z * error)[kept]])
+                if len(best_lower) >= args.top_k:
+                    best_lower = np.partition(best_lower, len(best_lower) - args.top_k)[-args.top_k:]
+                    floor = max(floor, float(best_lower.min()))
+            local1, local2 = np.nonzero(kept & (upper >= floor))
+            keep = candidate_upper >= floor
+            candidate_rows = np.concatenate([candidate_rows[keep], rows[local1]])
+            candidate_columns = np.concatenate([candidate_columns[keep], columns[local2]])
+            candidate_upper = np.concatenate([candidate_upper[keep], upper[local1, local2]])
+            candidate_estimates = np.concatenate([candidate_estimates[keep], estimate[local1, local2]])
+    record_score_times(scored_pairs)
+    keep = candidate_upper >= floor
+    candidate_rows, candidate_columns, candidate_estimates = candidate_rows[keep], candidate_columns[keep], candidate_estimates[keep]
+    print(f"The sketch kept {len(candidate_rows)} of {n_pairs} pairs ({len(candidate_rows) / max(n_pairs, 1):.2%}) as candidates.")
+
+    with stage("rescoring", len(candidate_rows)):
+        exact = score_pair_list(codes1, partner_codes, candidate_rows, candidate_columns, n_states, weights)
+    selected = np.ones(len(exact), dtype=bool) if args.min_score is None else exact >= args.min_score
+    #ties are broken towards the lower positions like the streamed top pairs
+    order = np.flatnonzero(selected)[np.lexsort((candidate_columns[selected], candidate_rows[selected], -exact[selected]))]
+    if args.top_k is not None:
+        order = order[:args.top_k]
+    table = pd.DataFrame({
+        "Position_MSA1": labels1[candidate_rows[order]],
+        "Position_MSA2": labels2[candidate_columns[order]],
+        "MIT_Score": exact[order],
+        "Sketch_Score": candidate_estimates[order],
+    })
+    table = add_reference_columns(table, references)
+
+    #a ruled-out pair is a miss if it would have made the table
+    full = args.top_k is not None and len(table) == args.top_k
+    threshold = float(table["MIT_Score"].iloc[-1]) if full else (-np.inf if args.min_score is None else args.min_score)
+    audit_rows, audit_columns = sample_pairs(rng, 4 * args.screen_audit, len(columns1), len(columns2), symmetric)
+    audited = ~np.isin(audit_rows * len(columns2) + audit_columns, candidate_rows * len(columns2) + candidate_columns)
+    if same_msa:
+        audited &= labels1[audit_rows] != labels2[audit_columns]
+    if mirrored:
+        audited &= ~mirrored_pair_mask(labels1[audit_rows], labels2[audit_columns], labels1, labels2)
+    audit_rows, audit_columns = audit_rows[audited][:args.screen_audit], audit_columns[audited][:args.screen_audit]
+    with stage("rescoring", len(audit_rows)):
+        audit_scores = score_pair_list(codes1, partner_codes, audit_rows, audit_columns, n_states, weights)
+    audit_misses = int((audit_scores > threshold).sum() if full else (audit_scores >= threshold).sum())
+    missed = audit_misses / len(audit_rows) * (n_pairs - len(candidate_rows)) if len(audit_rows) else 0.0
+    if full:
+        recall = max(len(table) - missed, 0.0) / len(table)
+    else:
+        recall = len(table) / (len(table) + missed) if len(table) + missed > 0 else 1.0
+    print(f"{audit_misses} of {len(audit_rows)} audited ruled-out pairs would have qualified: estimated recall {recall:.4f}.")
+
+    screen_summary = {
+        "genomes": n_genomes,
+        "sketch_genomes": n_sample,
+        "target_recall": args.screen_recall,
+        "z": z,
+        "mcdiarmid_bound": bound,
+        "pairs": n_pairs,
+        "candidates": len(candidate_rows),
+        "candidate_fraction": len(candidate_rows) / max(n_pairs, 1),
+        "threshold": threshold,
+        "audited_pairs": len(audit_rows),
+        "audit_misses": audit_misses,
+        "estimated_missed_pairs": missed,
+        "estimated_recall": recall,
+        "seed": args.seed,
+    }
+    with stage("output", len(table)):
+        os.makedirs(output, exist_ok=True)
+        path = f"{output}/mit_top_pairs.csv"
+        table.to_csv(path, index=False)
+        with open(f"{output}/mit_screen_summary.json", "w") as f:
+            json.dump(screen_summary, f, indent=2)
+    print(f"Wrote the {len(table)} best position pairs to {path}")
+
+    summary = {
+        "Pairs": n_pairs,
+        "Mean_MIT": np.nan,
+        "Max_MIT": np.nan,
+        "Top_Position_MSA1": np.nan,
+        "Top_Position_MSA2": np.nan,
+        "Skipped_Pair_Fraction": skipped,
+        "Candidate_Fraction": screen_summary["candidate_fraction"],
+        "Estimated_Recall": recall,
+    }
+    if len(table):
+        summary.update({
+            "Max_MIT": float(table["MIT_Score"].iloc[0]),
+            "Top_Position_MSA1": int(table["Position_MSA1"].iloc[0]),
+            "Top_Position_MSA2": int(table["Position_MSA2"].iloc[0]),
+        })
+
+    return summary
+
+####output - the dense matrix is the primary result, the long-form table is an optional export
+def write_matrix_file(matrix: np.ndarray, path: str) -> str:
+    """Write a matrix as a float32 ``.npy`` file that can be memory-mapped."""
+    stored = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=matrix.shape)
+    stored[:] = matrix
+    stored.flush()
+    del stored
+
+    return path
+
+def write_mit_matrix(matrix: np.ndarray, output: str, positions1: np.ndarray, positions2: np.ndarray,
+                     references: Tuple[np.ndarray, np.ndarray] = None) -> str:
+    """Write the scores as a float32 ``.npy`` matrix with its position labels.
+
+    The matrix is written to ``<output>/mit_matrix.npy`` and can be opened
+    without reading it into memory with ``numpy.load(path, mmap_mode="r")``.
+    Row and column labels (1-based alignment positions) are written to
+    ``<output>/mit_matrix_positions.json``, together with their reference
+    numbering (null at reference gaps) when `references` is given.
+
+    Returns
+    -------
+    str
+        Path of the written matrix.
+    """
+    os.makedirs(output, exist_ok=True)
+    path = write_matrix_file(matrix, f"{output}/mit_matrix.npy")
+    labels = {"Position_MSA1": [int(p) for p in positions1], "Position_MSA2": [int(p) for p in positions2]}
+    if references is not None:
+        for column, positions, numbering in zip(["Position_MSA1", "Position_MSA2"], [positions1, positions2], references):
+            labels[f"Ref_{column}"] = [int(number) if number else None for number in numbering[np.asarray(positions) - 1]]
+    with open(f"{output}/mit_matrix_positions.json", "w") as f:
+        json.dump(labels, f)
+
+    return path
+
+def load_mit_matrix(output: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Memory-map a matrix written by `write_mit_matrix` together with its position labels."""
+    matrix = np.load(f"{output}/mit_matrix.npy", mmap_mode="r")
+    with open(f"{output}/mit_matrix_positions.json") as f:
+        positions = json.load(f)
+
+    return matrix, np.asarray(positions["Position_MSA1"]), np.asarray(positions["Position_MSA2"])
+
+def export_long_csv(matrix: np.ndarray, output: str, positions1: np.ndarray, positions2: np.ndarray,
+                    extra_columns: Dict[str, np.ndarray] = None, references: Tuple[np.ndarray, np.ndarray] = None,
+                    chunk_pairs: int = 1_000_000) -> str:
+    """Stream the long-form ``mit_results.csv`` from a score matrix.
+
+    Rows are ordered like `calculate_identity_pair_frequency_and_MIT` (MSA1
+    position outer, MSA2 position inner). `extra_columns` maps column names
+    to matrices of the same shape (corrected scores, p-values, ...) and
+    `references` adds the reference numbering of both positions (see
+    `add_reference_columns`). Only a block of rows of the matrix is turned into a table
+    at a time, so memory stays bounded by `chunk_pairs` regardless of the
+    grid size.
+
+    Returns
+    -------
+    str
+        Path of the written CSV file.
+    """
+    extra_columns = extra_columns or {}
+    os.makedirs(output, exist_ok=True)
+    path = f"{output}/mit_results.csv"
+    rows_per_chunk = max(1, chunk_pairs // max(1, matrix.shape[1]))
+    header = ["Position_MSA1", "Position_MSA2", "MIT_Score"]
+    header += [] if references is None else ["Ref_Position_MSA1", "Ref_Position_MSA2"]
+    header += list(extra_columns)
+    with open(path, "w") as f:
+        f.write(",".join(header) + "\n")
+        for start in range(0, matrix.shape[0], rows_per_chunk):
+            stop = start + rows_per_chunk
+            chunk = mit_matrix_to_dataframe(np.asarray(matrix[start:stop], dtype=np.float64), positions1[start:stop], positions2)
+            chunk = add_reference_columns(chunk, references)
+            for column, values in extra_columns.items():
+                chunk[column] = np.asarray(values[start:stop], dtype=np.float64).ravel()
+            chunk.to_csv(f, index=False, header=False)
+
+    return path
+
+def write_outputs(matrix: np.ndarray, output: str, positions1: np.ndarray, positions2: np.ndarray, csv: bool = False,
+                  corrections: list = None, extra_columns: Dict[str, np.ndarray] = None,
+                  references: Tuple[np.ndarray, np.ndarray] = None):
+    """Write the score matrix, the requested corrected matrices and, when requested, the long-form CSV export.
+
+    `extra_columns` are per-pair matrices written elsewhere by the caller
+    (e.g. permutation p-values) that should also appear in the CSV export.
+    `references` labels the positions in reference numbering as well.
+    """
+    if corrections:
+        with stage("corrections", matrix.size):
+            corrected = compute_corrections(matrix, positions1, positions2, corrections)
+    else:
+        corrected = {}
+    with stage("output", matrix.size):
+        path = write_mit_matrix(matrix, output, positions1, positions2, references)
+        print(f"Wrote the {matrix.shape[0]} x {matrix.shape[1]} MIT score matrix to {path}")
+        columns = {}
+        for name, values in corrected.items():
+            matrix_file, column = CORRECTIONS[name]
+            print(f"Wrote {name} corrected scores to {write_matrix_file(values, f'{output}/{matrix_file}')}")
+            columns[column] = values
+        columns.update(extra_columns or {})
+        if csv:
+            print(f"Exported long-form scores to {export_long_csv(matrix, output, positions1, positions2, columns, references)}")
+
+def merge_main(argv: list):
+    """Entry point of ``MIT-run.py merge``: combine shard files into the final outputs."""
+    args = get_merge_args(argv)
+    try:
+        if args.plots:
+            load_pyplot()
+        with stage("merge"):
+            mit_matrix, positions1, positions2 = merge_shards(args.input)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Merged shards from {args.input}")
+    write_outputs(mit_matrix, args.output, positions1, positions2, args.csv, args.corrections)
+    if args.plots:
+        with stage("render"):
+            render_plots(args.output)
+        print(f"Wrote the plots to {args.output}")
+    print(f"Wrote run metrics to {write_run_metrics(args.output, {'subcommand': 'merge'})}")
+
+    return 1
+
+def clear_cache_main(argv: list):
+    """Entry point of ``MIT-run.py clear-cache``: evict cached MSAs down to the requested size."""
+    args = get_clear_cache_args(argv)
+    if not os.path.isdir(args.cache):
+        print(f"Error: The cache directory {args.cache} does not exist.")
+        sys.exit(1)
+    removed, freed = evict_cache(args.cache, args.max_size * 1024 ** 3)
+    #staging directories of runs that died while writing an entry
+    for staging in glob.glob(f"{args.cache}/.*.tmp"):
+        shutil.rmtree(staging, ignore_errors=True)
+    print(f"Removed {removed} cached MSA(s) ({freed / 1024 ** 2:.1f} MB) from {args.cache}; {len(cache_entries(args.cache))} left.")
+
+    return 1
+
+def mit_matrix_to_dataframe(matrix: np.ndarray, positions1: np.ndarray = None, positions2: np.ndarray = None) -> pd.DataFrame:
+    """Convert an MIT score matrix into the long-form results table.
+
+    Rows are ordered like `calculate_identity_pair_frequency_and_MIT`
+    (MSA1 position outer, MSA2 position inner). Positions default to
+    1-based alignment columns.
+    """
+    n1, n2 = matrix.shape
+    positions1 = np.arange(1, n1 + 1) if positions1 is None else np.asarray(positions1)
+    positions2 = np.arange(1, n2 + 1) if positions2 is None else np.asarray(positions2)
+    return pd.DataFrame({
+        "Position_MSA1": np.repeat(positions1, n2),
+        "Position_MSA2": np.tile(positions2, n1),
+        "MIT_Score": matrix.ravel(),
+    })
+
+####plots - the histograms and the heatmap of utils/MIT_analysis.R, streamed from the score matrix in blocks of rows
+#fill of the heatmap from white to firebrick, pairs without a score are drawn in the dark panel grey
+HEATMAP_LOW, HEATMAP_HIGH, HEATMAP_MISSING = (255, 255, 255), (178, 34, 34), (127, 127, 127)
+
+def iter_matrix_rows(matrix: np.ndarray, positions1: np.ndarray, positions2: np.ndarray, rows_per_chunk: int) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """Yield blocks of rows of a (memory-mapped) score matrix with the mask of pairs left out of the corrections.
+
+    Yields
+    ------
+    tuple[int, numpy.ndarray, numpy.ndarray]
+        First row, the float64 scores and the excluded pairs (pairs of a
+        position with itself and scores that are NA).
+    """
+    for start in range(0, matrix.shape[0], rows_per_chunk):
+        values = np.asarray(matrix[start:start + rows_per_chunk], dtype=np.float64)
+        excluded = self_pair_mask(positions1[start:start + len(values)], positions2) | ~np.isfinite(values)
+        yield start, values, excluded
+
+def new_histogram(width: float) -> dict:
+    """Create a histogram with bins of `width` (at multiples of it) that is filled block by block."""
+    return {"width": width, "counts": {}}
+
+def add_to_histogram(histogram: dict, values: np.ndarray):
+    """Count the finite `values` into their bins."""
+    values = values[np.isfinite(values)]
+    bins, counts = np.unique(np.floor(values / histogram["width"]).astype(np.int64), return_counts=True)
+    for index, count in zip(bins.tolist(), counts.tolist()):
+        histogram["counts"][index] = histogram["counts"].get(index, 0) + count
+
+def histogram_table(histogram: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Bin edges and counts of a histogram, with empty bins filled in between the first and last used bin."""
+    if not histogram["counts"]:
+        return np.array([0.0, histogram["width"]]), np.zeros(1, dtype=np.int64)
+    first, last = min(histogram["counts"]), max(histogram["counts"])
+    counts = np.zeros(last - first + 1, dtype=np.int64)
+    for index, count in histogram["counts"].items():
+        counts[index - first] = count
+
+    return np.arange(first, last + 2) * histogram["width"], counts
+
+def pool_rows(values: np.ndarray, factor1: int, factor2: int) -> np.ndarray:
+    """Max-pool a block of rows into ``factor1 x factor2`` cells, ignoring NaN (cells without any score stay NaN)."""
+    rows = -(-values.shape[0] // factor1) * factor1
+    columns = -(-values.shape[1] // factor2) * factor2
+    padded = np.full((rows, columns), np.nan)
+    padded[:values.shape[0], :values.shape[1]] = values
+    pooled = np.fmax.reduce(padded.reshape(rows // factor1, factor1, columns // factor2, factor2), axis=3)
+
+    return np.fmax.reduce(pooled, axis=1)
+
+def load_pyplot():
+    """Import matplotlib's pyplot with the file-only Agg backend.
+
+    Raises
+    ------
+    ValueError
+        If matplotlib is not installed; the plots need it for their titles, axes and colour bar.
+    """
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        raise ValueError("--plots and `MIT-run.py render` need matplotlib for the titles, axes and colour bar of the plots (pip install matplotlib).")
+
+    return plt
+
+def save_histogram(edges: np.ndarray, counts: np.ndarray, path: str, title: str, label: str) -> str:
+    """Write a histogram PNG with its title and axis labels."""
+    plt = load_pyplot()
+    figure, axis = plt.subplots(figsize=(4.8, 4.8), dpi=100)
+    axis.bar(edges[:-1], counts, width=np.diff(edges), align="edge", color="blue", alpha=0.7, edgecolor="black")
+    axis.set(title=title, xlabel=label, ylabel="Count")
+    figure.savefig(path)
+    plt.close(figure)
+
+    return path
+
+def save_heatmap(pooled: np.ndarray, positions1: np.ndarray, positions2: np.ndarray, path: str, size: int) -> str:
+    """Write the pooled z-score heatmap as a PNG, with the positions on the axes and a colour bar."""
+    plt = load_pyplot()
+    from matplotlib.colors import LinearSegmentedColormap
+    from matplotlib.ticker import FuncFormatter
+    colours = LinearSegmentedColormap.from_list("mit", [np.array(HEATMAP_LOW) / 255, np.array(HEATMAP_HIGH) / 255])
+    colours.set_bad(np.array(HEATMAP_MISSING) / 255)
+    figure, axis = plt.subplots(figsize=(size / 100, size / 100), dpi=100)
+    #pixels are laid out by matrix index and labelled with the positions, which need not be contiguous
+    shown = axis.imshow(np.ma.masked_invalid(pooled.T), origin="lower", cmap=colours, interpolation="nearest",
+                        extent=(0, len(positions1), 0, len(positions2)))
+    for labels, ticks in ((positions1, axis.xaxis), (positions2, axis.yaxis)):
+        ticks.set_major_formatter(FuncFormatter(lambda value, _, labels=labels: str(labels[min(int(value), len(labels) - 1)])))
+    axis.set(xlabel="Position 1", ylabel="Position 2")
+    figure.colorbar(shown, ax=axis, label="zscore(RCW MIT Entropy)", shrink=0.8)
+    figure.savefig(path)
+    plt.close(figure)
+
+    return path
+
+def render_plots(directory: str, output: str = None, size: int = 800, bin_width: float = 0.1, chunk_pairs: int = 1_000_000) -> List[str]:
+    """Draw the plots of `utils/MIT_analysis.R` from the score matrix of a finished run.
+
+    The matrix written by `write_mit_matrix` is memory-mapped and read a
+    block of rows at a time, so time grows with the number of pairs and
+    memory with the side of the grid and the image size only:
+
+    1. row and column sums of the MIT scores (the RCW background),
+    2. RCW scores, the MIT and RCW histograms and the moments of the RCW
+       scores,
+    3. z-scores, their histogram and the heatmap, max-pooled into at most
+       `size` pixels along each axis.
+
+    Pairs of a position with itself and NA scores are left out like in the
+    R script. Stored ``mit_rcw.npy``/``mit_zscore.npy`` matrices are not
+    needed, the corrections are recomputed on the way.
+
+    Parameters
+    ----------
+    directory : str
+        Output directory of a run holding ``mit_matrix.npy``.
+    output : str, optional
+        Directory the plots are written to; defaults to `directory`.
+    size : int
+        Maximum number of heatmap pixels along each axis.
+    bin_width : float
+        Width of the histogram bins, 0.1 like the R script.
+    chunk_pairs : int
+        Number of pairs read per block.
+
+    Returns
+    -------
+    list[str]
+        Paths of the written files: ``MIT_distribution.png``,
+        ``RCW_MIT_distribution.png``, ``ZScore_distribution.png``,
+        ``MIT_ZScore_heatmap.png`` and the bin counts in ``mit_histograms.csv``.
+    """
+    output = directory if output is None else output
+    matrix, positions1, positions2 = load_mit_matrix(directory)
+    n1, n2 = matrix.shape
+    factor1, factor2 = max(1, -(-n1 // size)), max(1, -(-n2 // size))
+    #blocks hold whole rows of heatmap pixels
+    rows_per_chunk = max(1, chunk_pairs // max(1, n2) // factor1) * factor1
+
+    row_sums, column_sums = np.zeros(n1), np.zeros(n2)
+    row_counts, column_counts = np.zeros(n1, dtype=np.int64), np.zeros(n2, dtype=np.int64)
+    for start, values, excluded in iter_matrix_rows(matrix, positions1, positions2, rows_per_chunk):
+        values = np.where(excluded, 0.0, values)
+        row_sums[start:start + len(values)] = values.sum(axis=1)
+        column_sums += values.sum(axis=0)
+        row_counts[start:start + len(values)] = (~excluded).sum(axis=1)
+        column_counts += (~excluded).sum(axis=0)
+
+    def rcw_rows(start, values, excluded):
+        #the block of `rcw_correction` for these rows
+        values = np.where(excluded, 0.0, values)
+        rows = slice(start, start + len(values))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            background = (row_sums[rows, None] + column_sums[None, :] - 2 * values) / (row_counts[rows, None] + column_counts[None, :] - 2)
+            rcw = values / background
+        rcw[excluded] = np.nan
+        return rcw
+
+    histograms = {name: new_histogram(bin_width) for name in ("MIT_Score", "RCW_entropy", "Z_Score")}
+    #running count, mean and sum of squared deviations of the RCW scores, merged block by block
+    n_rcw, mean_rcw, squares_rcw = 0, 0.0, 0.0
+    for start, values, excluded in iter_matrix_rows(matrix, positions1, positions2, rows_per_chunk):
+        rcw = rcw_rows(start, values, excluded)
+        finite = np.isfinite(rcw)
+        #the R script drops the pairs whose RCW score is NA from every plot
+        add_to_histogram(histograms["MIT_Score"], values[finite])
+        add_to_histogram(histograms["RCW_entropy"], rcw[finite])
+        block = rcw[finite]
+        if block.size:
+            block_mean = block.mean()
+            total = n_rcw + block.size
+            squares_rcw += ((block - block_mean) ** 2).sum() + (block_mean - mean_rcw) ** 2 * n_rcw * block.size / total
+            mean_rcw += (block_mean - mean_rcw) * block.size / total
+            n_rcw = total
+    sd_rcw = np.sqrt(squares_rcw / (n_rcw - 1)) if n_rcw > 1 else np.nan
+
+    pooled = np.full((-(-n1 // factor1), -(-n2 // factor2)), np.nan)
+    for start, values, excluded in iter_matrix_rows(matrix, positions1, positions2, rows_per_chunk):
+        z = (rcw_rows(start, values, excluded) - mean_rcw) / sd_rcw
+        add_to_histogram(histograms["Z_Score"], z)
+        pooled[start // factor1:start // factor1 + -(-len(values) // factor1)] = pool_rows(z, factor1, factor2)
+
+    os.makedirs(output, exist_ok=True)
+    paths = []
+    tables = []
+    plots = {
+        "MIT_Score": ("MIT_distribution.png", "MIT Score Distribution", "MIT Score"),
+        "RCW_entropy": ("RCW_MIT_distribution.png", "MIT Score Distribution RCW corrected", "RCW MIT Score"),
+        "Z_Score": ("ZScore_distribution.png", "Z-Score Distribution of the RCW corrected MIT Scores", "zscore(RCW MIT Entropy)"),
+    }
+    for name, (file_name, title, label) in plots.items():
+        edges, counts = histogram_table(histograms[name])
+        paths.append(save_histogram(edges, counts, f"{output}/{file_name}", title, label))
+        tables.append(pd.DataFrame({"Score": name, "Bin_Start": edges[:-1], "Bin_End": edges[1:], "Count": counts}))
+    paths.append(save_heatmap(pooled, positions1[::factor1], positions2[::factor2], f"{output}/MIT_ZScore_heatmap.png", size))
+    pd.concat(tables).to_csv(f"{output}/mit_histograms.csv", index=False)
+    paths.append(f"{output}/mit_histograms.csv")
+    if factor1 > 1 or factor2 > 1:
+        print(f"Max-pooled the {n1} x {n2} z-score grid into {pooled.shape[0]} x {pooled.shape[1]} heatmap pixels.")
+
+    return paths
+
+def render_run_plots(args: argparse.Namespace):
+    """Render the plots of every score matrix the run wrote (`--plots`): one per comparison in batch mode."""
+    if args.shard or args.top_k is not None or args.min_score is not None:
+        print("No score matrix was written (--shard or --top-k/--min-score), render the merged or full run with `MIT-run.py render`.")
+        return
+    pattern = f"{args.output}/*/mit_matrix.npy" if args.batch else f"{args.output}/mit_matrix.npy"
+    for path in sorted(glob.glob(pattern)):
+        with stage("render"):
+            render_plots(os.path.dirname(path))
+        print(f"Wrote the plots to {os.path.dirname(path)}")
+
+def render_main(argv: list):
+    """Entry point of ``MIT-run.py render``: draw the plots of a finished run from its score matrix."""
+    args = get_render_args(argv)
+    try:
+        load_pyplot()
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not os.path.isfile(f"{args.input}/mit_matrix.npy"):
+        print(f"Error: {args.input} holds no mit_matrix.npy to render.")
+        sys.exit(1)
+    output = args.input if args.output is None else args.output
+    with stage("render"):
+        paths = render_plots(args.input, output, args.size)
+    print(f"Wrote {', '.join(os.path.basename(path) for path in paths)} to {output}")
+    #the run's own metrics stay next to it
+    print(f"Wrote run metrics to {write_run_metrics(output, {'subcommand': 'render'}, 'mit_metrics_render.json')}")
+
+    return 1
+
+####all-vs-all batch mode - every MSA is read, encoded and profiled once for all of its comparisons
+def collect_batch_msas(paths: list) -> List[str]:
+    """Expand the --batch arguments into a sorted list of MSA files.
+
+    Directories contribute every file ending in one of `FASTA_EXTENSIONS`
+    (optionally followed by ``.gz``); files are taken as is.
+
+    Raises
+    ------
+    ValueError
+        If a path does not exist or two MSAs would get the same name.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().removesuffix(".gz").endswith(FASTA_EXTENSIONS)
+            )
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            raise ValueError(f"The batch input {path} does not exist.")
+
+    names = [msa_name(path) for path in files]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Several batch MSAs share the name(s) {duplicates}.")
+
+    return files
+
+def msa_name(path: str) -> str:
+    """Name an MSA after its file name without the FASTA and gzip extensions."""
+    name = os.path.basename(path)
+    name = name[:-3] if name.lower().endswith(".gz") else name
+    root, extension = os.path.splitext(name)
+    return root if extension.lower() in FASTA_EXTENSIONS else name
+
+def summarize_pair(mit_matrix: np.ndarray, positions1: np.ndarray, positions2: np.ndarray, excluded: np.ndarray) -> dict:
+    """Summary statistics of one comparison for the batch table."""
+    scores = np.where(excluded, np.nan, np.asarray(mit_matrix, dtype=np.float64))
+    if np.isnan(scores).all():
+        return {"Pairs": 0, "Mean_MIT": np.nan, "Max_MIT": np.nan, "Top_Position_MSA1": np.nan, "Top_Position_MSA2": np.nan}
+    top1, top2 = np.unravel_index(np.nanargmax(scores), scores.shape)
+    return {
+        "Pairs": int((~excluded).sum()),
+        "Mean_MIT": float(np.nanmean(scores)),
+        "Max_MIT": float(scores[top1, top2]),
+        "Top_Position_MSA1": int(positions1[top1]),
+        "Top_Position_MSA2": int(positions2[top2]),
+    }
+
+def prepare_scoring(codes1: np.ndarray, codes2: np.ndarray, n_states: int, shape: Tuple[int, int], args: argparse.Namespace,
+                    profiles1: Dict[str, np.ndarray] = None, profiles2: Dict[str, np.ndarray] = None,
+                    weights: np.ndarray = None) -> dict:
+    """Prefilter the columns of one comparison and prepare the codes every scoring mode starts from.
+
+    Shared by `score_and_write` and the `--shard` runs, so shards of a run
+    and the full run score exactly the same grid.
+
+    Parameters
+    ----------
+    codes1, codes2 : numpy.ndarray
+        Encoded alignments; `codes2` is None for a single MSA scored against itself.
+    n_states : int
+        Number of valid characters.
+    shape : tuple[int, int]
+        Number of positions of both MSAs.
+    args : argparse.Namespace
+        Parsed command-line arguments (prefilter thresholds, engine, fill).
+    profiles1, profiles2 : Dict[str, numpy.ndarray], optional
+        Precomputed column profiles; computed here when missing.
+    weights : numpy.ndarray, optional
+        Per-genome weights (see `compute_sequence_weights`).
+
+    Returns
+    -------
+    dict
+        The kept ``columns1``/``columns2``, the ``skipped`` pair fraction,
+        the ``fill`` of skipped pairs, the ``kept_codes`` and
+        ``kept_profiles`` of both MSAs and the ``scoring_codes`` (bit-packed
+        for the bitpack engine), with None for MSA2 of a single MSA.
+    """
+    symmetric = codes2 is None
+    with stage("encode"):
+        if profiles1 is None:
+            profiles1 = compute_column_profiles(codes1, n_states, weights)
+        if not symmetric and profiles2 is None:
+            profiles2 = compute_column_profiles(codes2, n_states, weights)
+
+    #score only the informative columns and write skipped pairs as 0 / NA so coordinates stay the same
+    columns1 = select_informative_columns(profiles1, args.min_entropy, args.min_coverage)
+    columns2 = columns1 if symmetric else select_informative_columns(profiles2, args.min_entropy, args.min_coverage)
+    skipped = report_prefilter(columns1, shape[0], columns2, shape[1], symmetric)
+    kept_codes = (codes1[columns1], None if symmetric else codes2[columns2])
+    scoring_codes = kept_codes
+    if args.engine == "bitpack":
+        with stage("encode"):
+            scoring_codes = tuple(None if codes is None else pack_nucleotides(codes) for codes in kept_codes)
+
+    return {
+        "columns1": columns1,
+        "columns2": columns2,
+        "skipped": skipped,
+        "fill": 0.0 if args.skipped_pairs == "zero" else np.nan,
+        "kept_codes": kept_codes,
+        "kept_profiles": (take_profiles(profiles1, columns1), None if symmetric else take_profiles(profiles2, columns2)),
+        "scoring_codes": scoring_codes,
+    }
+
+def score_and_write(codes1: np.ndarray, codes2: np.ndarray, valid_chars: list, positions1: np.ndarray, positions2: np.ndarray,
+                    output: str, args: argparse.Namespace, profiles1: Dict[str, np.ndarray] = None,
+                    profiles2: Dict[str, np.ndarray] = None, weights: np.ndarray = None,
+                    references: Tuple[np.ndarray, np.ndarray] = None) -> dict:
+    """Score one comparison with the numpy engine, run the optional permutation test and write every output.
+
+    Parameters
+    ----------
+    codes1, codes2 : numpy.ndarray
+        Encoded alignments; `codes2` is None for a single MSA scored against itself.
+    valid_chars : list[str]
+        List of allowed characters.
+    positions1, positions2 : numpy.ndarray
+        Position labels of the rows and columns.
+    output : str
+        Directory the outputs are written to.
+    args : argparse.Namespace
+        Parsed command-line arguments (block size, workers, corrections, ...).
+    profiles1, profiles2 : Dict[str, numpy.ndarray], optional
+        Precomputed column profiles, reused across comparisons in batch mode.
+    weights : numpy.ndarray, optional
+        Per-genome weights (see `compute_sequence_weights`).
+    references : tuple[numpy.ndarray, numpy.ndarray], optional
+        `reference_numbering` of both MSAs, added to every output.
+
+    Returns
+    -------
+    dict
+        `summarize_pair` statistics, plus the permutation summary if one was run.
+    """
+    n_states = len(valid_chars)
+    shape = (len(positions1), len(positions2))
+    prepared = prepare_scoring(codes1, codes2, n_states, shape, args, profiles1, profiles2, weights)
+    columns1, columns2, skipped, fill = prepared["columns1"], prepared["columns2"], prepared["skipped"], prepared["fill"]
+    kept_codes1, kept_codes2 = prepared["kept_codes"]
+    kept_profiles1, kept_profiles2 = prepared["kept_profiles"]
+    scoring_codes1, scoring_codes2 = prepared["scoring_codes"]
+
+    if args.screen is not None:
+        return screen_top_pairs(
+            kept_codes1, kept_codes2, n_states, columns1, columns2, positions1, positions2, output, args, weights, skipped,
+            references
+        )
+    if args.top_k is not None or args.min_score is not None:
+        return score_top_pairs(
+            scoring_codes1, scoring_codes2, n_states, columns1, columns2, positions1, positions2, output, args,
+            kept_profiles1, kept_profiles2, weights, skipped, references
+        )
+
+    scored_pairs = len(columns1) * (len(columns1) + 1) // 2 if codes2 is None else len(columns1) * len(columns2)
+    checkpoint_dir = f"{output}/mit_checkpoint"
+    with stage("scoring", scored_pairs):
+        if args.checkpoint or args.resume:
+            mit_matrix = calculate_mit_matrix_checkpointed(
+                scoring_codes1, scoring_codes2, n_states, columns1, columns2, shape, fill, checkpoint_dir,
+                fingerprint_inputs(codes1, codes2, weights), args.resume, args.tile_size, args.workers, kept_profiles1, kept_profiles2, weights,
+                args.checkpoint_interval
+            )
+            kept_matrix = mit_matrix[np.ix_(columns1, columns2)] if args.permutations > 0 else None
+        else:
+            kept_matrix = calculate_mit_matrix(scoring_codes1, scoring_codes2, valid_chars, args.tile_size, args.workers, kept_profiles1, kept_profiles2, weights)
+            mit_matrix = expand_matrix(kept_matrix, columns1, columns2, shape, fill)
+    record_score_times(scored_pairs)
+    same_msa = compares_msa_with_itself(args, codes2)
+    summary = summarize_pair(mit_matrix, positions1, positions2, ranked_pair_mask(positions1, positions2, same_msa))
+    summary["Skipped_Pair_Fraction"] = skipped
+
+    extra_columns = {}
+    if args.permutations > 0:
+        print(f"Running {args.permutations} genome permutations of MSA2 for the null model.")
+        #the null model only covers the informative pairs; skipped pairs never beat their observed score
+        with stage("permutations", kept_matrix.size * args.permutations):
+            kept_pvalues, permutation_summary = run_permutation_test(
+                kept_codes1, kept_codes1 if kept_codes2 is None else kept_codes2, kept_matrix, n_states,
+                ranked_pair_mask(positions1[columns1], positions2[columns2], same_msa),
+                args.permutations, args.seed, args.permutation_batch, args.tile_size, args.workers, args.alpha, weights
+            )
+        pvalues = expand_matrix(kept_pvalues, columns1, columns2, shape, 1.0 if args.skipped_pairs == "zero" else np.nan)
+        os.makedirs(output, exist_ok=True)
+        write_matrix_file(pvalues, f"{output}/mit_pvalues.npy")
+        with open(f"{output}/mit_permutation_summary.json", "w") as f:
+            json.dump(permutation_summary, f, indent=2)
+        print(
+            f"Excess coupling {permutation_summary['excess_coupling']:.4g} (z = {permutation_summary['excess_coupling_z']:.3g}, "
+            f"p = {permutation_summary['excess_coupling_p']:.3g}); {permutation_summary['significant_pairs']} pairs with p <= {args.alpha} "
+            f"vs {permutation_summary['expected_significant_pairs']:.1f} expected by chance."
+        )
+        extra_columns["P_Value"] = pvalues
+        summary.update({
+            "Excess_Coupling": permutation_summary["excess_coupling"],
+            "Excess_Coupling_Z": permutation_summary["excess_coupling_z"],
+            "Excess_Coupling_P": permutation_summary["excess_coupling_p"],
+            "Significant_Pairs": permutation_summary["significant_pairs"],
+            "Expected_Significant_Pairs": permutation_summary["expected_significant_pairs"],
+        })
+
+    write_outputs(mit_matrix, output, positions1, positions2, args.csv, args.corrections, extra_columns, references)
+    if args.checkpoint or args.resume:
+        #every output is written, the checkpoint is no longer needed
+        del mit_matrix
+        shutil.rmtree(checkpoint_dir)
+
+    return summary
+
+def score_top_pairs(codes1: np.ndarray, codes2: np.ndarray, n_states: int, columns1: np.ndarray, columns2: np.ndarray,
+                    positions1: np.ndarray, positions2: np.ndarray, output: str, args: argparse.Namespace,
+                    profiles1: Dict[str, np.ndarray], profiles2: Dict[str, np.ndarray], weights: np.ndarray = None,
+                    skipped: float = 0.0, references: Tuple[np.ndarray, np.ndarray] = None) -> dict:
+    """Score the prefiltered columns block by block and write only the best pairs to ``mit_top_pairs.csv``.
+
+    No score matrix is built: every block is folded into a pair stream (see
+    `new_pair_stream`) and dropped. `codes1`/`codes2` (encoded or bit-packed)
+    and the profiles are restricted to `columns1`/`columns2`.
+
+    Returns
+    -------
+    dict
+        `summarize_pair` statistics of the comparison.
+    """
+    symmetric = codes2 is None
+    #two regions of one MSA are scored as a rectangle
+    mirrored = not symmetric and compares_msa_with_itself(args, codes2)
+    stream = new_pair_stream(positions1, positions2, args.top_k, args.min_score, mirrored, compares_msa_with_itself(args, codes2))
+    scored_pairs = len(columns1) * (len(columns1) + 1) // 2 if symmetric else len(columns1) * len(columns2)
+    with stage("scoring", scored_pairs):
+        for start1, start2, block in iter_mit_tiles(codes1, codes2, n_states, args.tile_size, profiles1, profiles2, workers=args.workers, weights=weights):
+            rows = columns1[start1:start1 + block.shape[0]]
+            columns = columns2[start2:start2 + block.shape[1]]
+            add_block_to_stream(stream, block, rows, columns, symmetric, diagonal=symmetric and start1 == start2)
+    record_score_times(scored_pairs)
+    if args.skipped_pairs == "zero":
+        add_skipped_pairs_to_stream(stream)
+    with stage("corrections", len(stream["heap"])):
+        table = add_reference_columns(finish_pair_stream(stream, args.corrections), references)
+
+    with stage("output", len(table)):
+        os.makedirs(output, exist_ok=True)
+        path = f"{output}/mit_top_pairs.csv"
+        table.to_csv(path, index=False)
+    print(f"Wrote the {len(table)} best position pairs to {path}")
+
+    summary = {
+        "Pairs": stream["pairs"],
+        "Mean_MIT": stream["pairs_sum"] / stream["pairs"] if stream["pairs"] else np.nan,
+        "Max_MIT": np.nan,
+        "Top_Position_MSA1": np.nan,
+        "Top_Position_MSA2": np.nan,
+        "Skipped_Pair_Fraction": skipped,
+    }
+    if len(table):
+        summary.update({
+            "Max_MIT": float(table["MIT_Score"].iloc[0]),
+            "Top_Position_MSA1": int(table["Position_MSA1"].iloc[0]),
+            "Top_Position_MSA2": int(table["Position_MSA2"].iloc[0]),
+        })
+
+    return summary
+
+def run_batch(args: argparse.Namespace, alphabet: dict):
+    """Compare every pair of MSAs given to --batch in one process.
+
+    Each MSA is read, encoded and profiled once. Every unordered pair is then
+    scored with `score_and_write` into ``<output>/<MSA1>__<MSA2>/`` and one
+    row per pair is written to ``<output>/batch_summary.csv``.
+    """
+    try:
+        files = collect_batch_msas(args.batch)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if len(files) < 2:
+        print(f"Error: --batch needs at least two MSAs, found {len(files)}.")
+        sys.exit(1)
+
+    msas = []
+    for path in files:
+        try:
+            headers, codes, counts = load_alignment(path, alphabet, args.type, args.cache, args.cache_size, msa_name(path))
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if len(headers) == 0:
+            print(f"Error: No sequences found in {path}.")
+            sys.exit(1)
+        msas.append({"name": msa_name(path), "headers": headers, "codes": codes, "counts": counts, "positions": np.arange(1, codes.shape[0] + 1)})
+
+    valid_chars = alphabet["states"]
+    #the weights of --reweight are shared by the panel, so they need the genomes found in every MSA (like the old
+    #make_ordered_files); otherwise every comparison is joined on its own genomes below
+    if args.pair_by_genome and args.reweight is not None:
+        try:
+            with stage("genome_join", sum(len(msa["headers"]) for msa in msas)):
+                genomes, rows = join_genomes([msa["headers"] for msa in msas], args.genome_regex, args.missing_genomes, args.duplicate_genomes)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Paired {len(genomes)} genomes shared by all {len(msas)} MSAs.")
+        if len(genomes) == 0:
+            print("Error: No genome is shared by all MSAs.")
+            sys.exit(1)
+        for msa, msa_rows in zip(msas, rows):
+            msa["headers"] = [msa["headers"][row] for row in msa_rows]
+            msa["codes"] = np.ascontiguousarray(msa["codes"][:, msa_rows])
+            msa["counts"] = None
+    weights = None
+    if args.reweight is not None:
+        if len({msa["codes"].shape[1] for msa in msas}) > 1:
+            print("Error: --reweight in batch mode needs the same genomes in every MSA, use --pair-by-genome.")
+            sys.exit(1)
+        #genome redundancy is measured over the whole panel so every MSA keeps one set of profiles
+        with stage("reweight", msas[0]["codes"].shape[1]):
+            weights = compute_sequence_weights([msa["codes"] for msa in msas], len(valid_chars), args.reweight)
+        print(f"Reweighted {len(weights)} genomes at identity >= {args.reweight}: N_eff = {weights.sum():.1f}")
+        write_sequence_weights(msas[0]["headers"], weights, args.output)
+    with stage("encode"):
+        for msa in msas:
+            if weights is None and msa["counts"] is not None:
+                msa["profiles"] = profiles_from_counts(msa["counts"], msa["codes"].shape[1], len(valid_chars))
+            else:
+                msa["profiles"] = compute_column_profiles(msa["codes"], len(valid_chars), weights)
+    print(f"Encoded {len(msas)} MSAs for {len(msas) * (len(msas) - 1) // 2} pairwise comparisons.")
+
+    rows = []
+    for index1, msa1 in enumerate(msas):
+        for msa2 in msas[index1 + 1:]:
+            print(f"Comparing {msa1['name']} with {msa2['name']}.")
+            row = {"MSA1": msa1["name"], "MSA2": msa2["name"], "Positions_MSA1": msa1["codes"].shape[0], "Positions_MSA2": msa2["codes"].shape[0]}
+            (codes1, profiles1), (codes2, profiles2) = (msa1["codes"], msa1["profiles"]), (msa2["codes"], msa2["profiles"])
+            if args.pair_by_genome and weights is None:
+                try:
+                    with stage("genome_join", len(msa1["headers"]) + len(msa2["headers"])):
+                        genomes, pair_rows = join_genomes([msa1["headers"], msa2["headers"]], args.genome_regex, args.missing_genomes, args.duplicate_genomes)
+                except ValueError as e:
+                    print(f"Error: {e}")
+                    sys.exit(1)
+                print(f"Paired {len(genomes)} genomes across both MSAs.")
+                joined = []
+                for msa, msa_rows in zip((msa1, msa2), pair_rows):
+                    if np.array_equal(msa_rows, np.arange(msa["codes"].shape[1])):
+                        joined.append((msa["codes"], msa["profiles"]))
+                    else:
+                        #the profiles of the whole MSA do not describe this subset of genomes
+                        with stage("encode"):
+                            msa_codes = np.ascontiguousarray(msa["codes"][:, msa_rows])
+                            joined.append((msa_codes, compute_column_profiles(msa_codes, len(valid_chars))))
+                (codes1, profiles1), (codes2, profiles2) = joined
+            if codes1.shape[1] == 0:
+                print(f"Skipping: {msa1['name']} and {msa2['name']} share no genome.")
+                row["Status"] = "skipped: no shared genome"
+            elif codes1.shape[1] != codes2.shape[1]:
+                print(f"Skipping: {msa1['name']} has {codes1.shape[1]} sequences but {msa2['name']} has {codes2.shape[1]}.")
+                row["Status"] = "skipped: different number of sequences"
+            else:
+                row["Genomes"] = codes1.shape[1]
+                row.update(score_and_write(
+                    codes1, codes2, valid_chars, msa1["positions"], msa2["positions"],
+                    f"{args.output}/{msa1['name']}__{msa2['name']}", args, profiles1, profiles2, weights
+                ))
+                row["Status"] = "ok"
+            rows.append(row)
+
+    os.makedirs(args.output, exist_ok=True)
+    pd.DataFrame(rows).convert_dtypes().to_csv(f"{args.output}/batch_summary.csv", index=False)
+    print(f"Wrote the summary of {len(rows)} comparisons to {args.output}/batch_summary.csv")
+
+    return 1
+
+def run_mit(args: argparse.Namespace):
+    """Run the pipeline for parsed arguments: read and encode the MSAs, score every position pair and write the results."""
+    if (args.msa1 is None) == (args.batch is None):
+        print("Error: Pass either --msa1 (with an optional --msa2) or --batch.")
+        sys.exit(1)
+    if args.batch and (args.engine == "python" or args.shard or args.msa2):
+        print("Error: --batch requires the numpy engine and cannot be combined with --msa2 or --shard.")
+        sys.exit(1)
+    if args.plots:
+        #fail before scoring rather than after
+        try:
+            load_pyplot()
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    if args.top_k is not None or args.min_score is not None:
+        if args.engine == "python" or args.shard or args.permutations or args.csv:
+            print("Error: --top-k/--min-score write mit_top_pairs.csv instead of the matrix and cannot be combined with --csv, --permutations, --shard or the python engine.")
+            sys.exit(1)
+        if "zscore" in args.corrections:
+            print("Error: --corrections zscore is the z-score of every RCW score, which --top-k/--min-score never holds at once. Use rcw and/or apc, or write the full matrix.")
+            sys.exit(1)
+    if args.screen is not None:
+        if args.top_k is None and args.min_score is None:
+            print("Error: --screen needs --top-k and/or --min-score to know which pairs to keep.")
+            sys.exit(1)
+        if args.screen <= 0 or not 0 < args.screen_recall < 1 or args.screen_audit < 0:
+            print("Error: --screen must be positive, --screen-recall between 0 and 1 and --screen-audit at least 0.")
+            sys.exit(1)
+        if args.corrections:
+            print("Error: --screen only scores the candidate pairs exactly, so the row and column sums of --corrections are not available.")
+            sys.exit(1)
+    if args.count_store and (args.batch or args.engine == "python" or args.shard or args.permutations or args.reweight is not None
+                             or args.top_k is not None or args.min_score is not None):
+        print("Error: --count-store holds plain genome counts and cannot be combined with --batch, --shard, --permutations, --reweight, --top-k/--min-score or the python engine.")
+        sys.exit(1)
+    if (args.checkpoint or args.resume) and (args.batch or args.engine == "python" or args.shard or args.count_store
+                                             or args.top_k is not None or args.min_score is not None):
+        print("Error: --checkpoint/--resume cannot be combined with --batch, --shard, --count-store, --top-k/--min-score or the python engine.")
+        sys.exit(1)
+    if (args.reference or args.region1 or args.region2) and (args.batch or args.shard or args.count_store):
+        print("Error: --reference/--region1/--region2 select positions of --msa1/--msa2 and cannot be combined with --batch, --shard or --count-store.")
+        sys.exit(1)
+    if args.reference and len(args.reference) > 2:
+        print("Error: --reference takes one name, or one name per MSA.")
+        sys.exit(1)
+    try:
+        groups = None if args.alphabet is None else read_alphabet_groups(args.alphabet, args.type)
+        alphabet = build_alphabet(args.type, groups, args.gap_state, args.fold_case, args.ambiguity)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if args.engine == "bitpack" and (len(alphabet["states"]) != 4 or args.reweight is not None):
+        print("Error: The bitpack engine packs four states in two bits and counts every genome once: it needs a four-state alphabet (-t N without --gap-state, or e.g. --alphabet murphy4) and cannot be combined with --reweight.")
+        sys.exit(1)
+    if args.batch:
+        return run_batch(args, alphabet)
+
+    #report the type of sequences being processed
+    valid_chars = alphabet["states"]
+    print(f"Processing as {'Amino Acid' if args.type == 'A' else 'Nucleic Acid'} sequences with {len(valid_chars)} states: {' '.join(valid_chars)}")
+
+    #check if the input files exist and pull the sequences
+    if not os.path.isfile(args.msa1):
+        print(f"Error: The file {args.msa1} does not exist.")
+        sys.exit(1)
+    else:
+        try:
+            headers1, codes1, counts1 = load_alignment(args.msa1, alphabet, args.type, args.cache, args.cache_size, "MSA1")
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if len(headers1) == 0:
+            print(f"Error: No sequences found in {args.msa1}.")
+            sys.exit(1)
+    #check if the second MSA file exists and pull the sequences, otherwise use the first MSA for both inputs
+    if args.msa2 and not os.path.isfile(args.msa2):
+        print(f"Error: The file {args.msa2} was passed and does not exist.")
+        sys.exit(1)
+    elif args.msa2 is None:
+        headers2, codes2, counts2 = headers1, None, None
+        print("No second MSA provided, using the first MSA for both inputs to calculate MIT on itself.")
+    else:
+        try:
+            headers2, codes2, counts2 = load_alignment(args.msa2, alphabet, args.type, args.cache, args.cache_size, "MSA2")
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if len(headers2) == 0:
+            print(f"Error: No sequences found in {args.msa2}.")
+            sys.exit(1)
+    if args.pair_by_genome and codes2 is not None:
+        try:
+            with stage("genome_join", len(headers1) + len(headers2)):
+                genomes, (rows1, rows2) = join_genomes([headers1, headers2], args.genome_regex, args.missing_genomes, args.duplicate_genomes)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Paired {len(genomes)} genomes across both MSAs ({len(headers1)} and {len(headers2)} sequences read).")
+        headers1, codes1 = [headers1[row] for row in rows1], np.ascontiguousarray(codes1[:, rows1])
+        headers2, codes2 = [headers2[row] for row in rows2], np.ascontiguousarray(codes2[:, rows2])
+        #the cached column counts cover every genome of the files
+        counts1, counts2 = None, None
+        if len(genomes) == 0:
+            print("Error: No genome is shared by both MSAs.")
+            sys.exit(1)
+    if len(headers1) != len(headers2):
+        print(f"Error: MSA1 has {len(headers1)} sequences but MSA2 has {len(headers2)}.")
+        sys.exit(1)
+
+
+    if args.permutations and (args.engine == "python" or args.shard):
+        print("Error: --permutations requires the numpy engine and cannot be combined with --shard.")
+        sys.exit(1)
+
+    shard = None
+    if args.shard:
+        if args.engine == "python":
+            print("Error: --shard requires the numpy engine.")
+            sys.exit(1)
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+    #output rows and columns are labelled with 1-based alignment positions
+    positions1 = np.arange(1, codes1.shape[0] + 1)
+    positions2 = positions1 if codes2 is None else np.arange(1, codes2.shape[0] + 1)
+
+    weights = None
+    if args.reweight is not None:
+        with stage("reweight", len(headers1)):
+            codes_list = [codes for codes in (codes1, codes2) if codes is not None]
+            weights = compute_sequence_weights(codes_list, len(valid_chars), args.reweight)
+        print(f"Reweighted {len(weights)} sequences at identity >= {args.reweight}: N_eff = {weights.sum():.1f}")
+        write_sequence_weights(headers1, weights, args.output)
+
+    #number the columns against the reference, then keep only the requested sub-grid
+    references = None
+    if args.reference:
+        try:
+            with stage("reference"):
+                numbering1 = reference_numbering(read_reference_sequence(args.msa1, args.reference[0], args.genome_regex))
+                numbering2 = numbering1 if args.msa2 is None else reference_numbering(read_reference_sequence(args.msa2, args.reference[-1], args.genome_regex))
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        references = (numbering1, numbering2)
+        print(f"Numbering positions against the reference {' and '.join(args.reference)} ({(numbering1 > 0).sum()} and {(numbering2 > 0).sum()} residues).")
+    if args.region1 or args.region2:
+        n_columns1 = codes1.shape[0]
+        n_columns2 = n_columns1 if codes2 is None else codes2.shape[0]
+        try:
+            rows1 = np.arange(n_columns1) if not args.region1 else region_columns(parse_regions(args.region1), n_columns1, None if references is None else references[0], "MSA1")
+            rows2 = np.arange(n_columns2) if not args.region2 else region_columns(parse_regions(args.region2), n_columns2, None if references is None else references[1], "MSA2")
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Scoring the {len(rows1)} x {len(rows2)} sub-grid of the {n_columns1} x {n_columns2} positions.")
+        if codes2 is None and not np.array_equal(rows1, rows2):
+            #different regions of one MSA form a rectangle, scored like two MSAs; pairs of a position with itself stay excluded by label
+            codes2, counts2 = codes1, counts1
+        codes1, counts1 = np.ascontiguousarray(codes1[rows1]), None if counts1 is None else counts1[rows1]
+        if codes2 is not None:
+            codes2, counts2 = np.ascontiguousarray(codes2[rows2]), None if counts2 is None else counts2[rows2]
+        positions1 = rows1 + 1
+        positions2 = positions1 if codes2 is None else rows2 + 1
+
+    if args.engine == "python":
+        with stage("encode"):
+            #the reference loop counts the same integer codes as the numpy engines
+            identity_dict1 = create_position_identity_matrix(codes1.T.tolist())
+            identity_dict2 = identity_dict1 if codes2 is None else create_position_identity_matrix(codes2.T.tolist())
+        with stage("scoring", len(positions1) * len(positions2)):
+            mit_results = calculate_identity_pair_frequency_and_MIT(identity_dict1, identity_dict2, valid_chars, None if weights is None else weights.tolist())
+        record_score_times(len(positions1) * len(positions2))
+        mit_matrix = mit_results["MIT_Score"].to_numpy().reshape(len(positions1), len(positions2))
+    else:
+        print(f"Scoring all position pairs with the {'bit-packed nucleotide' if args.engine == 'bitpack' else 'vectorized numpy'} engine.")
+        #a single MSA is scored against itself on the upper triangle only
+        profiles1, profiles2 = None, None
+        if weights is None and counts1 is not None:
+            profiles1 = profiles_from_counts(counts1, codes1.shape[1], len(valid_chars))
+            profiles2 = None if codes2 is None else profiles_from_counts(counts2, codes2.shape[1], len(valid_chars))
+        try:
+            if args.count_store:
+                genome_ids = genomes if args.pair_by_genome and codes2 is not None else parse_genome_ids(headers1, args.genome_regex)
+                with stage("pair_counting") as work:
+                    added = update_count_store(args.count_store, codes1, codes2, genome_ids, alphabet, args.tile_size)
+                    work["items"] = added
+                print(f"Added {added} new genome(s) to the count store {args.count_store}; {len(genome_ids) - added} were already counted.")
+                with stage("mi", len(positions1) * len(positions2)):
+                    mit_matrix = mit_matrix_from_store(args.count_store, args.min_entropy, args.min_coverage, 0.0 if args.skipped_pairs == "zero" else np.nan)
+                write_outputs(mit_matrix, args.output, positions1, positions2, args.csv, args.corrections)
+                return 1
+            if shard is not None:
+                symmetric = codes2 is None
+                shape = (len(positions1), len(positions2))
+                prepared = prepare_scoring(codes1, codes2, len(valid_chars), shape, args, profiles1, profiles2, weights)
+                columns1, columns2 = prepared["columns1"], prepared["columns2"]
+                tiles = shard_tiles(plan_tiles(len(columns1), len(columns2), args.tile_size, symmetric), *shard)
+                scored_pairs = sum(tile_pairs(tile, args.tile_size, len(columns1), len(columns2), symmetric) for tile in tiles)
+                with stage("scoring", scored_pairs):
+                    blocks = list(iter_mit_tiles(
+                        *prepared["scoring_codes"], len(valid_chars), args.tile_size, *prepared["kept_profiles"],
+                        tiles=tiles, workers=args.workers, weights=weights
+                    ))
+                record_score_times(scored_pairs)
+                with stage("output", scored_pairs):
+                    path = write_shard(args.output, *shard, shape, symmetric, blocks, positions1, positions2, columns1, columns2,
+                                       prepared["fill"], args.tile_size, fingerprint_inputs(codes1, codes2, weights))
+                print(f"Wrote {len(blocks)} block(s) of shard {args.shard} to {path}")
+                return 1
+            score_and_write(codes1, codes2, valid_chars, positions1, positions2, args.output, args, profiles1, profiles2, weights, references)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return 1
+
+    write_outputs(mit_matrix, args.output, positions1, positions2, args.csv, args.corrections, references=references)
+
+    return 1
+
+def main():
+    """Main entry point: parse arguments, compute MIT scores, and write the results.
+
+    The function reads input MSAs, encodes them, computes MIT scores for
+    every position pair, and writes the score matrix (plus the optional
+    long-form CSV) to the directory specified by the `-o/--output` argument,
+    together with the run metrics in ``mit_metrics.json``.
+    """
+
+    #subcommands are dispatched before the regular arguments are parsed
+    if sys.argv[1:2] == ["merge"]:
+        return merge_main(sys.argv[2:])
+    if sys.argv[1:2] == ["clear-cache"]:
+        return clear_cache_main(sys.argv[2:])
+    if sys.argv[1:2] == ["render"]:
+        return render_main(sys.argv[2:])
+
+    # parse the arguments
+    args = get_args()
+    _RUN_METRICS["progress_interval"] = args.progress_interval
+    profiler = start_profiling(args.profile)
+    status = run_mit(args)
+    if args.plots:
+        render_run_plots(args)
+    stop_profiling(args.profile, profiler, args.output)
+    settings = {"engine": args.engine, "workers": args.workers, "tile_size": args.tile_size, "type": args.type,
+                "alphabet": args.alphabet, "gap_state": args.gap_state, "fold_case": args.fold_case, "ambiguity": args.ambiguity,
+                "reference": args.reference, "region1": args.region1, "region2": args.region2}
+    #shards share their output directory, so each keeps its own metrics file
+    name = "mit_metrics.json" if not args.shard else "mit_metrics_shard_{}_of_{}.json".format(*args.shard.split("/"))
+    print(f"Wrote run metrics to {write_run_metrics(args.output, settings, name)}")
+
+    return status
 
 
 if __name__ == "__main__":
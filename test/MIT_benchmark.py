@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+This script benchmarks the MIT scoring engines of bin/MIT-run.py on generated alignments.
+For every input size it generates MSAs with MIT_test_sequence_generator.py, runs each engine
+in its own process and records the wall time, pairs scored per second and peak resident memory.
+It also checks that the planted coupled positions are recovered as the top scoring pairs and that
+every engine agrees with the reference (python) engine when the reference was run.
+With --screen the two-phase screening mode is run as well and its top pairs are compared with
+the exact top pairs of the numpy engine, reporting the true recall next to the estimated one.
+"""
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+
+#the generator lives next to this script
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from MIT_test_sequence_generator import AMINO_ACIDS, NUCLEIC_ACIDS, generate_alignments, write_fasta
+
+MIT_RUN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bin", "MIT-run.py")
+
+def get_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the MIT engines on generated alignments with planted coevolving positions."
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        required=True,
+        help="Output directory for the generated inputs, the engine outputs and benchmark_results.csv."
+    )
+    parser.add_argument(
+        "-l", "--lengths",
+        type=int,
+        nargs="+",
+        default=[100, 500, 1000],
+        help="Numbers of columns per MSA to benchmark. Default is 100 500 1000."
+    )
+    parser.add_argument(
+        "-n", "--depths",
+        type=int,
+        nargs="+",
+        default=[1000, 10000],
+        help="Numbers of sequences per MSA to benchmark. Default is 1000 10000."
+    )
+    parser.add_argument(
+        "-e", "--engines",
+        type=str,
+        nargs="+",
+        default=["numpy", "python"],
+        help="Engines of MIT-run.py to benchmark. Default is numpy python."
+    )
+    parser.add_argument(
+        "-t", "--type",
+        type=str,
+        choices=["A", "N"],
+        default="A",
+        help="Type of sequence: A for Amino Acid, N for Nucleic Acid. Default is A."
+    )
+    parser.add_argument(
+        "-s", "--single",
+        action="store_true",
+        help="Benchmark a single MSA scored against itself instead of a pair."
+    )
+    parser.add_argument(
+        "-c", "--couplings",
+        type=int,
+        default=10,
+        help="Number of coupled position pairs to plant. Default is 10."
+    )
+    parser.add_argument(
+        "--gap_rate",
+        type=float,
+        default=0.02,
+        help="Fraction of residues replaced by gaps. Default is 0.02."
+    )
+    parser.add_argument(
+        "--noise",
+        type=float,
+        default=0.1,
+        help="Fraction of background residues replaced by random characters. Default is 0.1."
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes passed to MIT-run.py. Default is 1."
+    )
+    parser.add_argument(
+        "--max_python_cells",
+        type=float,
+        default=5e6,
+        help="Skip the python engine when pairs x sequences exceeds this, it scores about a million cells per second. Default is 5e6."
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=1994,
+        help="Random seed of the generator. Default is 1994."
+    )
+    parser.add_argument(
+        "--screen",
+        type=float,
+        default=None,
+        help="Also run the screening mode with this fraction (or number) of genomes in the sketch and report its recall against the numpy engine. Default is off."
+    )
+    parser.add_argument(
+        "--screen_top",
+        type=int,
+        default=100,
+        help="Number of top pairs the screening mode has to find. Default is 100."
+    )
+
+    return parser.parse_args()
+
+def run_engine(engine: str, msa_files: list, output: str, seq_type: str, workers: int, extra: list = None) -> dict:
+    """Run MIT-run.py with one engine in its own process.
+
+    Args:
+        engine (str): Value of the -e option.
+        msa_files (list): One or two FASTA files.
+        output (str): Output directory of the run.
+        seq_type (str): A or N.
+        workers (int): Number of worker processes.
+        extra (list): Further command line options of the run.
+
+    Returns:
+        dict: Wall time in seconds, peak RSS in MB and the exit status of the run.
+    """
+    command = [sys.executable, MIT_RUN, "-m1", msa_files[0], "-o", output, "-t", seq_type, "-e", engine, "-w", str(workers)]
+    if len(msa_files) > 1:
+        command += ["-m2", msa_files[1]]
+    command += extra or []
+    os.makedirs(output, exist_ok=True)
+    with open(f"{output}/benchmark.log", "w") as log_file:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+        #wait4 reports the resources of this run only, including its worker processes
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    #ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    peak_rss = usage.ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+    return {"Wall_Seconds": wall, "Peak_RSS_MB": peak_rss, "Exit_Code": process.returncode}
+
+def load_scores(output: str) -> np.ndarray:
+    """Load the score matrix written by a run, or None if the run did not write one."""
+    path = f"{output}/mit_matrix.npy"
+    return np.load(path).astype(np.float64) if os.path.isfile(path) else None
+
+def planted_recovery(matrix: np.ndarray, planted: pd.DataFrame, single: bool) -> float:
+    """Fraction of the planted pairs found among the top scoring pairs.
+
+    As many top pairs as there are planted couplings are taken. For a single MSA
+    every unordered pair of distinct positions is ranked once.
+
+    Args:
+        matrix (np.ndarray): Score matrix of the run.
+        planted (pd.DataFrame): Planted pairs with 1-based positions.
+        single (bool): The matrix is a single MSA scored against itself.
+
+    Returns:
+        float: Fraction of planted pairs recovered.
+    """
+    scores = np.array(matrix, dtype=np.float64)
+    if single:
+        scores[np.tril_indices_from(scores)] = -np.inf
+    top = np.argsort(scores, axis=None, kind="stable")[::-1][:len(planted)]
+    found = set(zip(*(index + 1 for index in np.unravel_index(top, scores.shape))))
+    truth = set(zip(planted["Position_MSA1"], planted["Position_MSA2"]))
+
+    return len(found & truth) / len(truth) if truth else np.nan
+
+def screen_recall(matrix: np.ndarray, output: str, top: int, single: bool) -> dict:
+    """Compare the pairs found by a screening run with the exact top pairs.
+
+    A screened pair counts as found when its exact score reaches the exact
+    ``top``-th best score, so ties at the cutoff are not counted as misses.
+
+    Args:
+        matrix (np.ndarray): Exact score matrix of the numpy engine.
+        output (str): Output directory of the screening run.
+        top (int): Number of top pairs the screen was asked for.
+        single (bool): The matrix is a single MSA scored against itself.
+
+    Returns:
+        dict: True recall, the recall estimated by the run and its fraction of candidate pairs.
+    """
+    scores = np.array(matrix, dtype=np.float64)
+    if single:
+        scores[np.tril_indices_from(scores)] = -np.inf
+    cutoff = np.sort(scores, axis=None)[::-1][top - 1]
+    screened = pd.read_csv(f"{output}/mit_top_pairs.csv")
+    found = scores[screened["Position_MSA1"] - 1, screened["Position_MSA2"] - 1] >= cutoff
+    with open(f"{output}/mit_screen_summary.json") as summary_file:
+        summary = json.load(summary_file)
+
+    return {"Recall": found.sum() / top, "Estimated_Recall": summary["estimated_recall"],
+            "Candidate_Fraction": summary["candidate_fraction"]}
+
+def main():
+    args = get_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    valid_chars = AMINO_ACIDS if args.type == "A" else NUCLEIC_ACIDS
+    #run the reference first so every other engine can be compared with it
+    engines = sorted(args.engines, key=lambda engine: engine != "python")
+
+    results = []
+    for depth in args.depths:
+        for length in args.lengths:
+            name = f"L{length}_N{depth}"
+            data_dir = f"{args.output}/{name}"
+            os.makedirs(data_dir, exist_ok=True)
+            sequence1, sequence2, planted = generate_alignments(
+                depth, length=length, single=args.single, valid_chars=valid_chars, num_couplings=args.couplings,
+                gap_rate=args.gap_rate, noise=args.noise, seed=args.seed
+            )
+            if args.single:
+                msa_files = [f"{data_dir}/single_MSA.fasta"]
+                write_fasta(sequence1, msa_files[0])
+            else:
+                msa_files = [f"{data_dir}/paired_MSA_1.fasta", f"{data_dir}/paired_MSA_2.fasta"]
+                write_fasta(sequence1, msa_files[0])
+                write_fasta(sequence2, msa_files[1])
+            planted.to_csv(f"{data_dir}/planted_pairs.csv", index=False)
+
+            #pairs of distinct positions for a single MSA, every position pair otherwise
+            pairs = length * (length - 1) // 2 if args.single else length * length
+            reference = None
+            exact = None
+            for engine in engines:
+                row = {"Engine": engine, "Length": length, "Genomes": depth, "Pairs": pairs}
+                if engine == "python" and pairs * depth > args.max_python_cells:
+                    print(f"{name}: skipping the python engine ({pairs * depth:.3g} cells > {args.max_python_cells:.3g}).")
+                    row["Status"] = "skipped"
+                    results.append(row)
+                    continue
+
+                print(f"{name}: running the {engine} engine.")
+                row.update(run_engine(engine, msa_files, f"{data_dir}/{engine}", args.type, args.workers))
+                row["Pairs_Per_Second"] = pairs / row["Wall_Seconds"]
+                matrix = load_scores(f"{data_dir}/{engine}")
+                if row["Exit_Code"] != 0 or matrix is None:
+                    row["Status"] = "failed"
+                    results.append(row)
+                    continue
+
+                row["Planted_Recovered"] = planted_recovery(matrix, planted, args.single)
+                if engine == "numpy":
+                    exact = matrix
+                if engine == "python":
+                    reference = matrix
+                elif reference is not None:
+                    row["Max_Diff_Reference"] = float(np.abs(matrix - reference).max())
+                row["Status"] = "ok"
+                results.append(row)
+
+            if args.screen is not None and exact is not None:
+                print(f"{name}: running the screening mode.")
+                row = {"Engine": "screen", "Length": length, "Genomes": depth, "Pairs": pairs}
+                screen_output = f"{data_dir}/screen"
+                row.update(run_engine("numpy", msa_files, screen_output, args.type, args.workers,
+                                      ["--screen", str(args.screen), "-k", str(args.screen_top), "--seed", str(args.seed)]))
+                row["Pairs_Per_Second"] = pairs / row["Wall_Seconds"]
+                if row["Exit_Code"] != 0 or not os.path.isfile(f"{screen_output}/mit_screen_summary.json"):
+                    row["Status"] = "failed"
+                else:
+                    row.update(screen_recall(exact, screen_output, min(args.screen_top, pairs), args.single))
+                    row["Status"] = "ok"
+                results.append(row)
+
+    columns = ["Engine", "Length", "Genomes", "Pairs", "Wall_Seconds", "Pairs_Per_Second", "Peak_RSS_MB",
+               "Planted_Recovered", "Max_Diff_Reference", "Recall", "Estimated_Recall", "Candidate_Fraction",
+               "Exit_Code", "Status"]
+    results = pd.DataFrame(results, columns=columns).convert_dtypes()
+    results.to_csv(f"{args.output}/benchmark_results.csv", index=False)
+    print(results.to_string(index=False))
+
+    return 0
+
+if __name__ == "__main__":
+    main()
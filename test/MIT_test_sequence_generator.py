@@ -3,21 +3,37 @@
 This script generates test sequences for unit tests in the MIT (Mutual Information Theory).
 It is designed to be very simple to allow easy verification of correctness and can be used to test
 the performance of the MIT calculations single and paired sequence alignments (MSAs).
+
+Alignments are built as numpy character arrays, so inputs with thousands of columns and
+tens of thousands of genomes can be generated in seconds. The planted coupled positions are
+written to planted_pairs.csv as the ground truth for benchmarks.
 """
 
 
 import os
 import sys
 import argparse
+import numpy as np
 import pandas as pd
-from typing import Dict
-from math import log
-import random
+from typing import List, Tuple
 
 #some full lists of amino acids
-AMINO_ACIDS = ["A", "R", "N", "D", "C", "Q", "E", "G", "H", 
+AMINO_ACIDS = ["A", "R", "N", "D", "C", "Q", "E", "G", "H",
           "I", "L", "K", "M", "F", "P", "S", "T", "W", "Y", "V"]
 
+#all the nucleic acids
+NUCLEIC_ACIDS = ["A", "C", "G", "T"]
+
+#the original four couplings: (position 1, position 2, change frequency, same character frequency)
+#positions 2/5 always change together, 7/10 change together but rarely to the same characters,
+#12/14 rarely change but always together and 16/19 rarely change and rarely to the same characters
+CLASSIC_COUPLINGS = [
+    (1, 4, 50, 100),
+    (6, 9, 50, 10),
+    (11, 13, 10, 100),
+    (15, 18, 10, 30),
+]
+
 def get_args() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Creates Amino Acid or Nucleic Acid sequences that have \"coevolving\" positions."
@@ -39,228 +55,241 @@ def get_args() -> argparse.ArgumentParser:
         action="store_true",
         help="Generate a single MSA with coevolving positions instead of a pair."
     )
+    parser.add_argument(
+        "-l", "--length",
+        type=int,
+        default=20,
+        help="Number of columns of each MSA. Default is 20."
+    )
+    parser.add_argument(
+        "-t", "--type",
+        type=str,
+        choices=["A", "N"],
+        default="A",
+        help="Type of sequence: A for Amino Acid, N for Nucleic Acid. Default is A."
+    )
+    parser.add_argument(
+        "-c", "--couplings",
+        type=int,
+        default=4,
+        help="Number of coupled position pairs to plant. The first four use the original frequencies, the rest cycle through them. Default is 4."
+    )
+    parser.add_argument(
+        "--gap_rate",
+        type=float,
+        default=0.0,
+        help="Fraction of residues replaced by gaps. Default is 0."
+    )
+    parser.add_argument(
+        "--noise",
+        type=float,
+        default=0.0,
+        help="Fraction of background residues replaced by a random character, so uncoupled columns are not invariant. Default is 0."
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=1994,
+        help="Random seed. Default is 1994."
+    )
 
     return parser.parse_args()
 
-def generate_sequences(num_sequences: int, seq_length: 20) -> Dict[str, list]:
-    #sequences will be 100 bases long
-    sequences = []
-    seq = "A"*seq_length
-    for i in range(num_sequences):
-        sequences.append(seq)
+def generate_sequences(num_sequences: int, seq_length: int = 20) -> np.ndarray:
+    """Create an alignment of identical all-"A" sequences.
 
+    Args:
+        num_sequences (int): Number of sequences (rows).
+        seq_length (int): Number of columns.
+
+    Returns:
+        np.ndarray: Character array of shape (num_sequences, seq_length).
+    """
+    return np.full((num_sequences, seq_length), b"A", dtype="S1")
+
+def add_noise(sequences: np.ndarray, noise: float, valid_chars: list, rng: np.random.Generator) -> np.ndarray:
+    """Replace a fraction of the residues with random characters.
+
+    Args:
+        sequences (np.ndarray): Character array of the alignment, modified in place.
+        noise (float): Fraction of residues to replace.
+        valid_chars (list): List of valid characters to use for changes.
+        rng (np.random.Generator): Random number generator.
+
+    Returns:
+        np.ndarray: The modified alignment.
+    """
+    if noise > 0:
+        mask = rng.random(sequences.shape) < noise
+        sequences[mask] = rng.choice(np.array(valid_chars, dtype="S1"), size=int(mask.sum()))
     return sequences
 
-def create_changes_paired(sequence1: list, sequence2: list, positions: list, change_frequency: int, same_character_freq: int, valid_chars: list) -> list:
-    """Create changes at specified positions in the sequences.
+def coupled_characters(num_sequences: int, change_frequency: int, same_character_freq: int, valid_chars: list,
+                       rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Draw the characters of one coupled position pair for every sequence.
+
+    Each sequence changes with probability ``(101 - change_frequency) / 100``. A change
+    either uses the pair's current "consistent characters" (probability
+    ``(101 - same_character_freq) / 100``) or draws two random characters, which then
+    become the consistent characters for the following sequences.
 
     Args:
-        sequences (list): List of sequences to modify.
-        positions (list): List of positions to modify in each sequence.
-        change_frequency (int): Frequency of changes (e.g., every Nth sequence).
-        same_character_freq (int): Frequency of keeping the same character.
+        num_sequences (int): Number of sequences.
+        change_frequency (int): Frequency of changes (1-100, higher means fewer changes).
+        same_character_freq (int): Frequency of keeping the same character (1-100).
         valid_chars (list): List of valid characters to use for changes.
+        rng (np.random.Generator): Random number generator.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Mask of changed sequences and the characters of both positions.
+    """
+    chars = np.array(valid_chars, dtype="S1")
+    #ensure there is change from the all-"A" background
+    first = rng.choice(chars[chars != b"A"], size=2)
+
+    changed = rng.integers(1, 101, size=num_sequences) >= change_frequency
+    consistent = rng.integers(1, 101, size=num_sequences) >= same_character_freq
+    random_draw = changed & ~consistent
+    random1 = rng.choice(chars, size=num_sequences)
+    random2 = rng.choice(chars, size=num_sequences)
+
+    #every consistent change reuses the characters of the last random draw before it
+    last_draw = np.maximum.accumulate(np.where(random_draw, np.arange(num_sequences), -1))
+    pos1 = np.where(last_draw >= 0, random1[np.maximum(last_draw, 0)], first[0])
+    pos2 = np.where(last_draw >= 0, random2[np.maximum(last_draw, 0)], first[1])
+
+    return changed, pos1, pos2
+
+def choose_coupled_positions(num_couplings: int, length1: int, length2: int, single: bool,
+                             rng: np.random.Generator) -> List[Tuple[int, int, int, int]]:
+    """Pick the (0-based) positions and frequencies of every planted coupling.
+
+    The original four couplings keep their positions when the alignment is long enough;
+    further couplings go to random unused columns.
 
     Returns:
-        list: Modified list of sequences.
+        List[Tuple[int, int, int, int]]: Position 1, position 2, change frequency and same character frequency.
     """
-    
-    #these are static characters to change things to
-    seq1_change = random.choice(valid_chars)
-    seq2_change = random.choice(valid_chars)
-
-    #ensure there is change
-    if seq1_change == "A":
-        seq1_change = "L"
-        
-    if seq2_change == "A":
-        seq2_change = "N"
-    
-    for i in range(len(sequence1)):
-        change = random.randint(1, 100)
-        #this will change the sequences together
-        if change >= change_frequency:
-            same_change = random.randint(1, 100)
-            #change both positions to the new characters but "consistent characters"
-            if same_change >= same_character_freq:
-                sequence1[i] = sequence1[i][:positions[0]] + seq1_change + sequence1[i][positions[0]+1:]
-                sequence2[i] = sequence2[i][:positions[1]] + seq2_change + sequence2[i][positions[1]+1:]
+    couplings = []
+    used1, used2 = set(), set()
+    for number in range(num_couplings):
+        _, _, change_frequency, same_character_freq = CLASSIC_COUPLINGS[number % len(CLASSIC_COUPLINGS)]
+        if number < len(CLASSIC_COUPLINGS) and min(length1, length2) >= 20:
+            position1, position2 = CLASSIC_COUPLINGS[number][:2]
+        else:
+            free1 = np.setdiff1d(np.arange(length1), sorted(used1))
+            free2 = free1 if single else np.setdiff1d(np.arange(length2), sorted(used2))
+            if len(free1) < 2 or len(free2) < (2 if single else 1):
+                raise ValueError(f"Not enough columns to plant {num_couplings} couplings.")
+            if single:
+                position1, position2 = sorted(rng.choice(free1, size=2, replace=False).tolist())
             else:
-                #create random changes at the positions 
-                seq1_change = random.choice(valid_chars)
-                seq2_change = random.choice(valid_chars)
-                sequence1[i] = sequence1[i][:positions[0]] + seq1_change + sequence1[i][positions[0]+1:]
-                sequence2[i] = sequence2[i][:positions[1]] + seq2_change + sequence2[i][positions[1]+1:]
-                
+                position1, position2 = int(rng.choice(free1)), int(rng.choice(free2))
+        used1.add(position1)
+        (used1 if single else used2).add(position2)
+        couplings.append((position1, position2, change_frequency, same_character_freq))
 
-    return sequence1, sequence2
+    return couplings
 
-def create_changes_single(sequence1: list, positions: list, change_frequency: int, same_character_freq: int, valid_chars: list) -> list:
-    """Create changes at specified positions in the sequences.
+def plant_couplings(sequence1: np.ndarray, sequence2: np.ndarray, couplings: list, valid_chars: list,
+                    rng: np.random.Generator):
+    """Write the coupled characters of every planted pair into the alignments.
 
     Args:
-        sequences (list): List of sequences to modify.
-        positions (list): List of positions to modify in each sequence.
-        change_frequency (int): Frequency of changes (e.g., every Nth sequence).
-        same_character_freq (int): Frequency of keeping the same character.
+        sequence1 (np.ndarray): Character array of the first MSA, modified in place.
+        sequence2 (np.ndarray): Character array of the second MSA, or the first one for a single MSA.
+        couplings (list): Output of `choose_coupled_positions`.
         valid_chars (list): List of valid characters to use for changes.
+        rng (np.random.Generator): Random number generator.
+    """
+    for position1, position2, change_frequency, same_character_freq in couplings:
+        changed, pos1, pos2 = coupled_characters(len(sequence1), change_frequency, same_character_freq, valid_chars, rng)
+        sequence1[changed, position1] = pos1[changed]
+        sequence2[changed, position2] = pos2[changed]
+
+def add_gaps(sequences: np.ndarray, gap_rate: float, rng: np.random.Generator) -> np.ndarray:
+    """Replace a fraction of the residues with gaps ("-")."""
+    if gap_rate > 0:
+        sequences[rng.random(sequences.shape) < gap_rate] = b"-"
+    return sequences
+
+def generate_alignments(num_sequences: int, length: int = 20, single: bool = False, valid_chars: list = AMINO_ACIDS,
+                        num_couplings: int = 4, gap_rate: float = 0.0, noise: float = 0.0,
+                        seed: int = 1994) -> Tuple[np.ndarray, np.ndarray, pd.DataFrame]:
+    """Generate one MSA (single) or a pair of MSAs with planted coupled positions.
+
+    Args:
+        num_sequences (int): Number of sequences in each MSA.
+        length (int): Number of columns of each MSA.
+        single (bool): Plant the couplings within one MSA instead of across two.
+        valid_chars (list): Alphabet of the sequences.
+        num_couplings (int): Number of coupled position pairs.
+        gap_rate (float): Fraction of residues replaced by gaps.
+        noise (float): Fraction of background residues replaced by random characters.
+        seed (int): Random seed.
 
     Returns:
-        list: Modified list of sequences.
+        Tuple[np.ndarray, np.ndarray, pd.DataFrame]: The MSA(s) as character arrays (the second is None
+        for a single MSA) and the planted pairs with 1-based positions.
     """
-    
-    #these are static characters to change things to
-    pos1_change = random.choice(valid_chars)
-    pos2_change = random.choice(valid_chars)
-
-    #ensure there is change
-    if pos1_change == "A":
-        pos1_change = "L"
-        
-    if pos2_change == "A":
-        pos2_change = "N"
-    
-    for i in range(len(sequence1)):
-        change = random.randint(1, 100)
-        #this will change the sequences together
-        if change >= change_frequency:
-            same_change = random.randint(1, 100)
-            #change both positions to the new characters but "consistent characters"
-            if same_change >= same_character_freq:
-                sequence1[i] = sequence1[i][:positions[0]] + pos1_change + sequence1[i][positions[0]+1:]
-                sequence1[i] = sequence1[i][:positions[1]] + pos2_change + sequence1[i][positions[1]+1:]
-            else:
-                #create random changes at the positions 
-                pos1_change = random.choice(valid_chars)
-                pos2_change = random.choice(valid_chars)
-                sequence1[i] = sequence1[i][:positions[0]] + pos1_change + sequence1[i][positions[0]+1:]
-                sequence1[i] = sequence1[i][:positions[1]] + pos2_change + sequence1[i][positions[1]+1:]
-                
+    rng = np.random.default_rng(seed)
+    sequence1 = add_noise(generate_sequences(num_sequences, length), noise, valid_chars, rng)
+    sequence2 = None if single else add_noise(generate_sequences(num_sequences, length), noise, valid_chars, rng)
+
+    couplings = choose_coupled_positions(num_couplings, length, length, single, rng)
+    plant_couplings(sequence1, sequence1 if single else sequence2, couplings, valid_chars, rng)
 
-    return sequence1
+    add_gaps(sequence1, gap_rate, rng)
+    if not single:
+        add_gaps(sequence2, gap_rate, rng)
 
-def write_fasta(sequences: list, output_file: str):
+    planted = pd.DataFrame(couplings, columns=["Position_MSA1", "Position_MSA2", "Change_Frequency", "Same_Character_Frequency"])
+    planted[["Position_MSA1", "Position_MSA2"]] += 1
+
+    return sequence1, sequence2, planted
+
+def write_fasta(sequences: np.ndarray, output_file: str):
     """Write sequences to a FASTA file.
 
     Args:
-        sequences (list): List of sequences to write.
+        sequences (np.ndarray): Character array of the alignment, one row per sequence.
         output_file (str): Path to the output FASTA file.
     """
-    with open(output_file, 'w') as f:
-        for i, seq in enumerate(sequences):
-            f.write(f">seq{i+1}\n")
-            f.write(f"{seq}\n")
+    rows = sequences.view(f"S{sequences.shape[1]}").ravel()
+    with open(output_file, 'wb') as f:
+        for i, seq in enumerate(rows):
+            f.write(b">seq%d\n%s\n" % (i + 1, seq))
     return 1
 
 def main():
-    #reproducibility
-    random.seed(1994)
-    
     args = get_args()
 
     os.makedirs(args.output, exist_ok=True)
 
-    sequence1 = generate_sequences(args.num_sequences, seq_length=20)
-
-    #generate paired sequences if not single
-    if not args.single:
-        sequence2 = generate_sequences(args.num_sequences, seq_length=20)
-
-    #I am now going to create changes at specific positions with different 
-    #frequencies to test the MIT calculations
-
-    #positions 2 and 5 (index 1 and 4)
-    #this will be the highest mutual information positions
-    #it will have 50% changes with 100% same character frequency (both positions always change together)
-    if args.single:
-        sequence1 = create_changes_single(
-            sequence1, 
-            positions=[1, 4], 
-            change_frequency=50, 
-            same_character_freq=100,
-            valid_chars=AMINO_ACIDS
-        )
-    else:
-        #position 1 in the first sequence and 4 in the second sequence
-        sequence1, sequence2 = create_changes_paired(
-            sequence1, 
-            sequence2,
-            positions=[1, 4], 
-            change_frequency=50, 
-            same_character_freq=100,
-            valid_chars=AMINO_ACIDS
-        )
-    
-    #positions 7 and 10 (index 6 and 9)
-    #it will have 50% changes with 10% same character frequency (both positions change but rarely to the same character each time)
-    if args.single:
-        sequence1 = create_changes_single(
-            sequence1, 
-            positions=[6, 9], 
-            change_frequency=50, 
-            same_character_freq=10,
-            valid_chars=AMINO_ACIDS
-        )
-    else:
-        #first position will change in the first sequence and second position in the second sequence
-        sequence1, sequence2 = create_changes_paired(
-            sequence1, 
-            sequence2,
-            positions=[6, 9], 
-            change_frequency=50, 
-            same_character_freq=10,
-            valid_chars=AMINO_ACIDS
-        )
-    
-    #positions 12 and 14 (index 11 and 13)
-    #it will have 10% changes with 100% same character frequency (both positions change but rarely to the same character each time)
-    if args.single:
-        sequence1 = create_changes_single(
-            sequence1, 
-            positions=[11, 13], 
-            change_frequency=10, 
-            same_character_freq=100,
-            valid_chars=AMINO_ACIDS
-        )
-    else:
-        #first position will change in the first sequence and second position in the second sequence
-        sequence1, sequence2 = create_changes_paired(
-            sequence1, 
-            sequence2,
-            positions=[11, 13], 
-            change_frequency=10, 
-            same_character_freq=100,
-            valid_chars=AMINO_ACIDS
-        )
-
-    #positions 16 and 19 (index 15 and 18)
-    #it will have 10% changes with 30% same character frequency (both positions change but rarely to the same character each time)
-    if args.single:
-        sequence1 = create_changes_single(
-            sequence1, 
-            positions=[15, 18], 
-            change_frequency=10, 
-            same_character_freq=30,
-            valid_chars=AMINO_ACIDS
-        )
-    else:
-        #first position will change in the first sequence and second position in the second sequence
-        sequence1, sequence2 = create_changes_paired(
-            sequence1, 
-            sequence2,
-            positions=[15, 18], 
-            change_frequency=10, 
-            same_character_freq=30,
-            valid_chars=AMINO_ACIDS
+    valid_chars = AMINO_ACIDS if args.type == "A" else NUCLEIC_ACIDS
+    try:
+        sequence1, sequence2, planted = generate_alignments(
+            args.num_sequences,
+            length=args.length,
+            single=args.single,
+            valid_chars=valid_chars,
+            num_couplings=args.couplings,
+            gap_rate=args.gap_rate,
+            noise=args.noise,
+            seed=args.seed
         )
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
     if args.single:
         write_fasta(sequence1, f"{args.output}/single_MSA.fasta")
     else:
         write_fasta(sequence1, f"{args.output}/paired_MSA_1.fasta")
         write_fasta(sequence2, f"{args.output}/paired_MSA_2.fasta")
+    planted.to_csv(f"{args.output}/planted_pairs.csv", index=False)
 
     return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests of bin/MIT-run.py on alignments generated with MIT_test_sequence_generator.py.
+The engines (numpy, bit-packed, numpy with worker processes and the reference python engine)
+must agree on every score, the planted coupled positions must be the top scoring pairs and
+--top-k must keep pairs of equal positions of two different proteins.
+Run with `python -m pytest test/`.
+"""
+
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+#the generator and the benchmark helpers live next to this file
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from MIT_test_sequence_generator import NUCLEIC_ACIDS, generate_alignments, write_fasta
+from MIT_benchmark import load_scores, planted_recovery, run_engine
+
+#small enough for the python engine, long enough for several blocks of --tile-size 8
+NUM_SEQUENCES = 400
+LENGTH = 20
+#the two strongest couplings of the generator, the weaker ones need thousands of genomes to stand out
+COUPLINGS = 2
+
+@pytest.fixture(scope="module")
+def alignments(tmp_path_factory) -> dict:
+    """Write a pair of nucleotide MSAs with planted couplings.
+
+    Returns:
+        dict: The FASTA files, the planted pairs and the data directory.
+    """
+    data_dir = tmp_path_factory.mktemp("mit")
+    sequence1, sequence2, planted = generate_alignments(
+        NUM_SEQUENCES, length=LENGTH, valid_chars=NUCLEIC_ACIDS, num_couplings=COUPLINGS, gap_rate=0.02, noise=0.1, seed=1994
+    )
+    msa_files = [str(data_dir / "paired_MSA_1.fasta"), str(data_dir / "paired_MSA_2.fasta")]
+    write_fasta(sequence1, msa_files[0])
+    write_fasta(sequence2, msa_files[1])
+
+    return {"msa_files": msa_files, "planted": planted, "data_dir": data_dir}
+
+def score(alignments: dict, name: str, engine: str, workers: int = 1, extra: list = None) -> np.ndarray:
+    """Run one engine on the generated MSAs and return its score matrix.
+
+    Args:
+        alignments (dict): Output of the `alignments` fixture.
+        name (str): Name of the output directory of the run.
+        engine (str): Value of the -e option.
+        workers (int): Number of worker processes.
+        extra (list): Further command line options of the run.
+
+    Returns:
+        np.ndarray: Score matrix of the run.
+    """
+    output = str(alignments["data_dir"] / name)
+    result = run_engine(engine, alignments["msa_files"], output, "N", workers, ["--tile-size", "8"] + (extra or []))
+    assert result["Exit_Code"] == 0, open(f"{output}/benchmark.log").read()
+
+    return load_scores(output)
+
+@pytest.fixture(scope="module")
+def reference(alignments) -> np.ndarray:
+    """Score matrix of the reference python engine."""
+    return score(alignments, "python", "python")
+
+@pytest.mark.parametrize("name, engine, workers", [
+    ("numpy", "numpy", 1),
+    ("bitpack", "bitpack", 1),
+    ("workers", "numpy", 2),
+])
+def test_engines_agree_with_python(alignments, reference, name, engine, workers):
+    matrix = score(alignments, name, engine, workers)
+    assert matrix.shape == (LENGTH, LENGTH)
+    np.testing.assert_allclose(matrix, reference, rtol=0, atol=1e-9)
+
+def test_planted_pairs_are_top_pairs(alignments):
+    matrix = score(alignments, "numpy_planted", "numpy")
+    assert planted_recovery(matrix, alignments["planted"], single=False) == 1.0
+
+def test_top_k_keeps_inter_protein_self_pairs(alignments):
+    #a protein paired with an exact copy of itself couples every position with the same position of the copy
+    msa_file = alignments["msa_files"][0]
+    output = str(alignments["data_dir"] / "top_k_copy")
+    result = run_engine("numpy", [msa_file, msa_file], output, "N", 1, ["--tile-size", "8", "-k", "5"])
+    assert result["Exit_Code"] == 0, open(f"{output}/benchmark.log").read()
+    top_pairs = pd.read_csv(f"{output}/mit_top_pairs.csv")
+    assert len(top_pairs) == 5
+    assert (top_pairs["Position_MSA1"] == top_pairs["Position_MSA2"]).all()